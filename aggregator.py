@@ -0,0 +1,19 @@
+# Lifecycle event aggregator (Redis Streams consumer group)
+#
+#   python aggregator.py
+#
+# Rolls `ots:events` up into histograms and percentiles for the stats page.
+# One is enough; more can share the group.
+
+from app import create_app
+from app.services.event_aggregator import EventAggregator
+
+app = create_app()
+
+if __name__ == "__main__":
+    with app.app_context():
+        aggregator = EventAggregator(app.redis_service.redis_client)
+        try:
+            aggregator.run()
+        except KeyboardInterrupt:
+            pass
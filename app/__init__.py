@@ -1,7 +1,6 @@
 #  task create a The Application Factory 
 
 import os
-import redis
 from flask import Flask
 from . import routes 
 import config
@@ -15,6 +14,10 @@ from .extensions import limiter
 from flask_limiter.util import get_remote_address
 
 from .middleware.security_headers import SecurityHeaders
+from .utils.upload_stream import EncryptingRequest
+from .utils.encryption_utils import select_cipher
+from .services.redis_pool import get_redis
+from .cli import register_cli
 from flask_wtf.csrf import CSRFProtect
 
 security_headers = SecurityHeaders()
@@ -27,17 +30,36 @@ jwt = JWTManager()
 CONFIG = config.Config()
 
 
+_background_pid = None
+
+
+def _start_background(app):
+    """Start the expiry watcher and maintenance scheduler once per process."""
+    global _background_pid
+    if _background_pid == os.getpid() or app.testing:
+        return
+    _background_pid = os.getpid()
+    from app.services.expiry_watcher import start_watcher
+    from app.services.maintenance import start_scheduler
+    if CONFIG.EXPIRY_WATCHER_ENABLED:
+        start_watcher(app.redis_service)
+    if CONFIG.MAINTENANCE_ENABLED:
+        start_scheduler(app, app.redis_service)
+
+
 def create_app(test_config=None):
     # Create Flask app
     app = Flask(__name__)
+    # Encrypt multipart uploads as they stream in (no plaintext on disk)
+    app.request_class = EncryptingRequest
     
     # Silence excessive request logging
     import logging
     log = logging.getLogger('werkzeug')
     log.setLevel(logging.ERROR)
 
-    redis_client = redis.Redis(host=CONFIG.REDIS_HOST, port=CONFIG.REDIS_PORT, db=0, decode_responses=True)
-    app.redis_client = redis_client
+    # Shared per-process pool (built lazily; connects on first command)
+    app.redis_client = get_redis()
     app.config.from_object(CONFIG)
     app.register_blueprint(routes.bp)
 
@@ -47,6 +69,11 @@ def create_app(test_config=None):
     except Exception as e:
         app.logger.error(f"Failed to create upload directory: {e}")
 
+    # Resolve the cipher suite up front: rejects a bad CIPHER_SUITE and runs
+    # the `auto` self-benchmark here rather than inside the first upload
+    suite = select_cipher(CONFIG.CIPHER_SUITE)
+    app.logger.info(f"Cipher suite for new files: {suite.name} ({CONFIG.CIPHER_SUITE})")
+
 
 
 
@@ -56,44 +83,11 @@ def create_app(test_config=None):
         from config import Config
         limiter.init_app(app)  # Uses memory storage by default
         
-        # Non-blocking Redis initialization - try once, don't spam logs
-        app.redis_available = False
-        try:
-            redis_service = RedisService(Config.REDIS_HOST, Config.REDIS_PORT)
-            redis_service.redis_client.ping()
-            app.redis_available = True
-            app.redis_service = redis_service
-            app.logger.info(f"✅ Redis connected: {Config.REDIS_HOST}:{Config.REDIS_PORT}")
-            
-            # Only do cleanup if Redis is available
-            file_result = redis_service.cleanup_orphan_files()
-            app.logger.info(f"Startup file cleanup: {file_result}")
-            
-            metadata_result = redis_service.cleanup_orphan_metadata()
-            app.logger.info(f"Startup metadata cleanup: {metadata_result}")
-            
-            # Reset analytics counters
-            analytics_counters = [
-                "uploads", "downloads", "deletions",
-                "index_visits", "list_files_visits", "info_visits",
-                "protected_downloads", "unprotected_downloads",
-                "rate_limit_hits"
-            ]
-            for counter in analytics_counters:
-                redis_service.set_counter(counter, 0)
-            app.logger.info(f"Startup analytics reset: {len(analytics_counters)} counters reset to 0")
-            
-            # Reset rate limit counters
-            try:
-                rate_limit_keys = redis_service.redis_client.keys("LIMITS:LIMITER*")
-                if rate_limit_keys:
-                    redis_service.redis_client.delete(*rate_limit_keys)
-            except Exception:
-                pass  # Silently ignore rate limit reset errors
-        except Exception as e:
-            app.logger.warning(f"⚠️ Redis unavailable - running in degraded mode (no file storage): {e}")
-            app.redis_service = None
-        
+        # No Redis I/O here: the client connects on first use, so boot does
+        # not wait on Redis and the app can be preloaded before forking.
+        # Startup maintenance is `flask ots-maintenance` (app/cli.py) and
+        # the elected maintenance leader.
+        app.redis_service = RedisService()
 
         # Check admin credentials configured
         if not Config.ADMIN_PASSWORD:
@@ -119,6 +113,15 @@ def create_app(test_config=None):
             return AdminUser()
         return None
     
+    register_cli(app)
+
+    # Background threads start with the first request of each process:
+    # threads do not survive fork, so starting them here would lose them
+    # under preload_app
+    @app.before_request
+    def start_background_threads():
+        _start_background(app)
+
     # Register auth blueprint
     from app.auth import auth_bp
     app.register_blueprint(auth_bp, url_prefix='/admin')
@@ -0,0 +1,53 @@
+"""
+cli.py - `flask ots-maintenance`: the startup work create_app no longer does
+
+Run once per deploy (or from a release hook) instead of in every worker:
+
+    flask --app run ots-maintenance [--keep-counters] [--skip-cleanup]
+
+- moves pre-namespace keys under "ots:" and SCRIPT LOADs the Lua scripts,
+- reconciles orphan files and metadata (the maintenance leader also does
+  this on its schedule),
+- resets the analytics counters, their time buckets and visitor counts,
+  and the rate-limit windows.
+"""
+import click
+from flask import current_app
+
+from app.services.redis_pool import unlink_matching
+from app.services.stats import STATS_COUNTERS as ANALYTICS_COUNTERS
+
+
+def reset_rate_limits(redis_client) -> int:
+    '''
+    Delete the rate limiter's windows (app/services/rate_limit.py). Returns
+    the number of keys removed.
+    '''
+    return unlink_matching(redis_client, "ots:rl:*")
+
+
+def register_cli(app) -> None:
+
+    @app.cli.command("ots-maintenance")
+    @click.option("--keep-counters", is_flag=True, help="Do not reset analytics counters and rate limits.")
+    @click.option("--skip-cleanup", is_flag=True, help="Do not reconcile orphan files and metadata.")
+    def ots_maintenance(keep_counters, skip_cleanup):
+        """Run startup maintenance once (migration, scripts, cleanup, resets)."""
+        from app.services.key_migration import ensure_migrated
+
+        redis_service = current_app.redis_service
+        if ensure_migrated(redis_service.redis_client):
+            click.echo("Key migration complete")
+        redis_service.load_scripts()
+        click.echo("Lua scripts loaded")
+
+        if not skip_cleanup:
+            click.echo(f"File cleanup: {redis_service.cleanup_orphan_files()}")
+            click.echo(f"Metadata cleanup: {redis_service.cleanup_orphan_metadata()}")
+
+        if not keep_counters:
+            for counter in ANALYTICS_COUNTERS:
+                redis_service.set_counter(counter, 0)
+            buckets = unlink_matching(redis_service.redis_client, "ots:stats:*")
+            click.echo(f"Analytics reset: {len(ANALYTICS_COUNTERS)} counters reset to 0, {buckets} buckets removed")
+            click.echo(f"Rate limit reset: {reset_rate_limits(redis_service.redis_client)} keys removed")
@@ -3,6 +3,9 @@ import logging
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+from config import Config
+import app.services.rate_limit  # noqa: F401  registers the ots+redis:// storage
+
 logger = logging.getLogger(__name__)
 
 # Check if rate limiting is enabled (default True, set RATELIMIT_ENABLED=false to disable)
@@ -15,8 +18,9 @@ def _on_breach(request_limit):
 limiter = Limiter(
     key_func=get_remote_address,
     enabled=_ratelimit_enabled,
-    # Use memory storage as fallback when Redis is unavailable
-    storage_uri="memory://",
-    # Strategy for limiting
-    strategy="fixed-window",
+    # Shared windows in Redis (ots+redis://, see app/services/rate_limit.py)
+    storage_uri=Config.RATELIMIT_STORAGE_URI,
+    strategy=Config.RATELIMIT_STRATEGY,
+    # Per-worker memory storage while Redis is unreachable
+    in_memory_fallback_enabled=True,
 )
\ No newline at end of file
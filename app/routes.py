@@ -1,32 +1,52 @@
 
-from flask import Blueprint, current_app, request, jsonify, render_template, Response
+from flask import Blueprint, current_app, request, jsonify, render_template, Response, stream_with_context
 from config import Config
 import os 
+import json
+import uuid
+import time
+import queue
 
 import redis
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import app.services.redis_service as redis_service
-from app.utils.get_uuid import generate_uuid_and_filepath
+from app.utils.get_uuid import generate_uuid_and_filepath, build_uuid_filepath, is_allowed_extension
 from flask import send_from_directory
 import re 
 
-from app.utils.password_utils import PasswordUtils
 from functools import wraps
 from app.auth.decorators import admin_required
 
 
-from app.utils.serve_and_delete import serve_and_delete
+from app.utils.serve_and_delete import (
+    lease_busy, lease_busy_response, presented_lease_secret, serve_and_delete, unlock_file_key
+)
+from app.utils.read_ahead import advise_willneed
 
 
 import base64
 from app.utils.encryption_utils import (
-    generate_key,generate_salt,derive_key_from_password,encrypt_file_chunked
+    generate_key,generate_salt,derive_key_from_password,wrap_key,
+    FrameCipher,pick_chunk_size
+)
+from app.utils.resumable_upload import (
+    ChunkConflictError, ChunkLengthError, chunk_count, create_part_file, expected_chunk_length,
+    upload_chunk_size, write_chunk
 )
 
 
 
 from app.extensions import limiter
+from app.utils.kdf_pool import kdf_pool
+from werkzeug.exceptions import HTTPException
+from app.services.redis_pool import pool_stats
+from app.services.counter_buffer import counters
+from app.services.stats import stats_cache
+from app.services.stats_stream import StreamsFull, RESYNC, hub, sse
+from app.services import lifecycle_events, rate_limit
+from app.services.expiry_watcher import ExpiryWatcher
+from app.services.maintenance import MaintenanceScheduler
 
 from app.utils.helpers import is_cli_user_agent
 
@@ -37,6 +57,10 @@ def handle_redis_error(fn):
         try:
             return fn(*args, **kwargs)
 
+        except HTTPException:
+            # Deliberate HTTP errors (KDF pool busy, client disconnect, 413) keep their status
+            raise
+
         except redis.exceptions.ConnectionError as e:
             current_app.logger.error(f"Redis connection error: {e}")
             # return jsonify({"error": "Redis connection error"}), 503
@@ -72,7 +96,25 @@ def handle_redis_error(fn):
 bp = Blueprint('main', __name__)
 
 
-redis_service = redis_service.RedisService(Config.REDIS_HOST, Config.REDIS_PORT, Config.REDIS_DB)
+redis_service = redis_service.RedisService()
+
+# Key material and download-lease state never leave the server
+PRIVATE_METADATA_FIELDS = frozenset({
+    'encryption_key', 'encryption_salt', 'wrapped_key', 'password_hash',
+    'lease_secret', 'delivered',
+})
+
+
+def _public_metadata(metadata):
+    """Metadata as returned to clients: everything but PRIVATE_METADATA_FIELDS."""
+    return {field: value for field, value in metadata.items() if field not in PRIVATE_METADATA_FIELDS}
+
+
+@bp.before_request
+def count_visitor():
+    """Feed the unique-visitor HyperLogLog (buffered; health probes excluded)."""
+    if request.endpoint != 'main.health_check':
+        counters.visit(request.remote_addr or "unknown")
 # 
 @bp.route('/health')
 @limiter.exempt
@@ -109,7 +151,7 @@ def health_check():
 @limiter.limit(Config.RATELIMIT_DEFAULT)
 def index():
     # redis_service.increment_counter("/ - visits ",1)
-    redis_service.increment_counter("index_visits",1)
+    counters.incr("index_visits")
     return render_template('index.html')
 
 
@@ -117,61 +159,227 @@ def index():
 @limiter.limit("5 per hour")
 @handle_redis_error
 def upload_file():  
-        # step 1 : file sanitation , genrating uuid and saving file
+        # step 1 : file sanitation , genrating uuid
+        # The body was already encrypted while it streamed in (see EncryptingRequest),
+        # so the upload only has to be validated and moved into place.
         file = request.files['file']
         file_name, filepath = generate_uuid_and_filepath(file)
-        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True) 
-        file.save(filepath)
- 
-        # step 1.1 check if the user has kept the passowrd settin gturned on / off 
+        upload = file.stream
+        upload.finish()
+
+        # step 2 : wrap the key before the file is moved into place: if the KDF
+        # pool refuses (503), the uncommitted upload is discarded with the request
         password = request.form.get('password',"")
-        password_hash = None
-        is_protected = False
-
-        if password:
-            password_hash = PasswordUtils.hash_password(password)
-            salt = generate_salt()
-            key = derive_key_from_password(password, salt)
-            encryption_key = ""
-            encryption_salt = salt.hex()
-            is_protected = True
-        else:
-            key = generate_key()
-            encryption_key = base64.b64encode(key).decode()
-            encryption_salt = ""
-
-        temp_path = filepath + ".temp"
-        os.rename(filepath, temp_path)
-
-
-        base_nonce = encrypt_file_chunked(temp_path,filepath,key)
-
-
-        os.remove(temp_path)
-
-        # step 2 : store file metadata in redis
-        metadata = {
-            'filename': file_name,
-            'real_filename': secure_filename(file.filename),
-            'content_type': file.content_type,
-            'token': file_name,
-            'is_protected': str(is_protected),
-            'password_hash': password_hash if password_hash else "",
-            'attempt_to_unlock': '0',  # ← Changed to string!
-            'encryption_salt': encryption_salt,
-            'encryption_key': encryption_key,
-            'encryption_nonce' : base_nonce.hex(),
-            'is_encrypted' : "True"
-
-        }
-        
-        redis_service.store_file_metadata( file_name, metadata)
-        if redis_service.get_file_metadata(file_name):
-            # redis_service.increment_counter("uploads",1)
-            redis_service.increment_counter("uploads",1)
-            return jsonify({"status": "success", "metadata": redis_service.get_file_metadata(file_name)}), 201
-        else:
-            return jsonify({"status": "error", "message": "Failed to upload file"}), 500
+        metadata = _build_file_metadata(
+            file_name,
+            secure_filename(file.filename),
+            file.content_type,
+            upload.key,
+            password,
+            size=upload.size,
+            storage='inline' if upload.is_inline else 'disk',
+        )
+        upload.commit(filepath)
+
+        # step 3 : store file metadata in redis
+        return _store_upload(file_name, metadata, blob=upload.inline_data if upload.is_inline else None)
+
+
+def _build_file_metadata(file_name, real_filename, content_type, key, password, size, storage='disk'):
+    """Build metadata for a freshly encrypted file (wraps the key if password-protected)."""
+    # check if the user has kept the passowrd settin gturned on / off 
+    is_protected = False
+    wrapped_key = ""
+
+    if password:
+        # No bcrypt hash: the wrapped key doubles as the password verifier.
+        # Wrapped here, bounded by the KDF pool: the password and the raw
+        # key are never written to Redis.
+        salt = generate_salt()
+        wrapped_key = wrap_key(key, kdf_pool.run(derive_key_from_password, password, salt)).hex()
+        encryption_key = ""
+        encryption_salt = salt.hex()
+        is_protected = True
+    else:
+        encryption_key = base64.b64encode(key).decode()
+        encryption_salt = ""
+
+    return {
+        'filename': file_name,
+        'real_filename': real_filename,
+        'content_type': content_type,
+        'token': file_name,
+        'is_protected': str(is_protected),
+        'password_hash': "",  # legacy bcrypt verifier, superseded by wrapped_key
+        'attempt_to_unlock': '0',  # ← Changed to string!
+        'encryption_salt': encryption_salt,
+        'encryption_key': encryption_key,
+        'encryption_nonce' : "",  # legacy files only; v2 files carry it in their header
+        'wrapped_key': wrapped_key,
+        'storage': storage,
+        'size': str(size),  # plaintext bytes: Content-Length / Range
+        'is_encrypted' : "True"
+    }
+
+
+def _store_upload(file_name, metadata, blob=None):
+    """Persist upload metadata and build the upload API response."""
+    # One round trip: metadata + inline blob + TTL + registry (CREATE script)
+    stored = redis_service.create_file(file_name, metadata, blob)
+    counters.incr("uploads")
+    if stored:
+        counters.event("upload", file_name, s=int(metadata['size']), p=metadata['is_protected'] == "True",
+                       st=metadata['storage'][0])
+    if stored:
+        return jsonify({"status": "success", "metadata": _public_metadata(stored)}), 201
+    else:
+        return jsonify({"status": "error", "message": "Failed to upload file"}), 500
+
+
+# Resumable uploads: create session -> PUT chunks (any order) -> finalize
+@bp.route('/upload/sessions', methods=['POST'])
+@limiter.limit("5 per hour")
+@handle_redis_error
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    real_filename = secure_filename(data.get('filename') or "")
+    size = data.get('size')
+
+    if not real_filename or not is_allowed_extension(real_filename):
+        return jsonify({"status": "error", "message": "File type not allowed"}), 400
+    if not isinstance(size, int) or size < 0:
+        return jsonify({"status": "error", "message": "size must be a non-negative integer"}), 400
+    if size > Config.RESUMABLE_MAX_FILE_SIZE:
+        return jsonify({"status": "error", "message": "File size too large"}), 413
+
+    session_id = uuid.uuid4().hex
+    key = generate_key()
+    cipher = FrameCipher(key, pick_chunk_size(size))
+    chunk_size = upload_chunk_size(Config.RESUMABLE_CHUNK_SIZE, cipher.chunk_size)
+    part_file = f".{session_id}.part"
+    os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+    create_part_file(os.path.join(Config.UPLOAD_FOLDER, part_file), cipher, size)
+
+    session = {
+        'real_filename': real_filename,
+        'content_type': data.get('content_type') or 'application/octet-stream',
+        'size': size,
+        'chunk_size': chunk_size,
+        'chunk_count': chunk_count(size, chunk_size),
+        'frame_size': cipher.chunk_size,
+        'encryption_key': base64.b64encode(key).decode(),
+        'encryption_nonce': cipher.base_nonce.hex(),
+        'part_file': part_file,
+    }
+    redis_service.create_upload_session(session_id, session)
+    return jsonify({
+        "status": "success",
+        "session_id": session_id,
+        "chunk_size": chunk_size,
+        "chunk_count": session['chunk_count'],
+        "expires_in": Config.UPLOAD_SESSION_TTL,
+    }), 201
+
+
+@bp.route('/upload/sessions/<session_id>', methods=['GET'])
+@limiter.limit("60 per minute")
+@handle_redis_error
+def upload_session_status(session_id):
+    session = redis_service.get_upload_session(session_id)
+    if not session:
+        return jsonify({"status": "error", "message": "Upload session not found or expired"}), 404
+    return jsonify({
+        "status": "success",
+        "size": int(session['size']),
+        "chunk_size": int(session['chunk_size']),
+        "chunk_count": int(session['chunk_count']),
+        "received": redis_service.get_received_chunks(session_id),
+    }), 200
+
+
+@bp.route('/upload/sessions/<session_id>/chunks/<int:index>', methods=['PUT'])
+@limiter.limit("600 per minute")
+@handle_redis_error
+def upload_chunk(session_id, index):
+    session = redis_service.get_upload_session(session_id)
+    if not session:
+        return jsonify({"status": "error", "message": "Upload session not found or expired"}), 404
+
+    size, chunk_size = int(session['size']), int(session['chunk_size'])
+    if index >= int(session['chunk_count']):
+        return jsonify({"status": "error", "message": "Chunk index out of range"}), 400
+
+    # Retries reuse the chunk's nonces: one writer at a time, and only the
+    # first attempt may write without comparing against the disk
+    lock = redis_service.chunk_lock(session_id, index)
+    if not lock.acquire(blocking=False):
+        return jsonify({"status": "error", "message": "Chunk upload already in progress"}), 409
+    try:
+        write_chunk(
+            os.path.join(Config.UPLOAD_FOLDER, session['part_file']),
+            FrameCipher(
+                base64.b64decode(session['encryption_key']),
+                int(session['frame_size']),
+                bytes.fromhex(session['encryption_nonce']),
+            ),
+            size,
+            chunk_size,
+            index,
+            expected_chunk_length(size, chunk_size, index),
+            request.stream,
+            verify=not redis_service.begin_chunk(session_id, index),
+        )
+    except ChunkLengthError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except ChunkConflictError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockError:
+            pass  # expired during a very slow chunk
+
+    redis_service.mark_chunk_received(session_id, index)
+    return jsonify({"status": "success", "index": index}), 200
+
+
+@bp.route('/upload/sessions/<session_id>/finalize', methods=['POST'])
+@limiter.limit("10 per minute")
+@handle_redis_error
+def finalize_upload_session(session_id):
+    session = redis_service.get_upload_session(session_id)
+    if not session:
+        return jsonify({"status": "error", "message": "Upload session not found or expired"}), 404
+
+    received = redis_service.get_received_chunks(session_id)
+    missing = sorted(set(range(int(session['chunk_count']))) - set(received))
+    if missing:
+        return jsonify({"status": "error", "message": "Upload incomplete", "missing": missing}), 409
+
+    # Wrap the key first: if the KDF pool refuses (503), the session is
+    # still open and finalize can simply be retried
+    file_name, filepath = build_uuid_filepath(session['real_filename'])
+    data = request.get_json(silent=True) or request.form
+    key = base64.b64decode(session['encryption_key'])
+    password = data.get('password', "")
+    metadata = _build_file_metadata(
+        file_name,
+        session['real_filename'],
+        session['content_type'],
+        key,
+        password,
+        size=int(session['size']),
+    )
+
+    if not redis_service.claim_upload_session(session_id):
+        return jsonify({"status": "error", "message": "Upload session already finalized"}), 409
+
+    # Chunks were encrypted in place; the part file already is the ciphertext.
+    # Touch it first so orphan cleanup sees a fresh file until CREATE runs.
+    part_path = os.path.join(Config.UPLOAD_FOLDER, session['part_file'])
+    os.utime(part_path)
+    os.replace(part_path, filepath)
+    return _store_upload(file_name, metadata)
 
 
 
@@ -183,7 +391,20 @@ def download_file(token):
 
         directory_path = current_app.config['UPLOAD_FOLDER']
         # metadata = redis_service.atomic_delete(token)
-        metadata = redis_service.get_file_metadata(token)
+        # One round trip (OPEN script): metadata, inline blob and, for an
+        # unprotected file, the download lease. HEAD and CLI requests only peek.
+        cli_request = is_cli_user_agent(request.headers.get('User-Agent'))
+        claim = redis_service.open_download(
+            token,
+            'peek' if cli_request or request.method == 'HEAD' else 'open',
+            secret=presented_lease_secret(token),
+        )
+        metadata = claim.metadata
+        if claim.state == 'claimed':  # a Range resume is not a new download
+            counters.incr("unprotected_downloads")
+        elif claim.state == 'protected':
+            counters.incr("protected_downloads")
+            counters.incr("protected_downloads_visits")
 
         if not metadata:
             # Return 410 GONE for browser, JSON for API
@@ -210,7 +431,7 @@ def download_file(token):
                 current_app.logger.warning(f"Blocked access to locked file: {token} (attempts: {attempts})")
                 return render_template('max_retries.html', token=token), 403
 
-        if is_cli_user_agent(request.headers.get('User-Agent')):
+        if cli_request:
             msg = (
                 "⚠️  Access Denied for CLI Tools\n"
                 "------------------------------------------------\n"
@@ -226,11 +447,10 @@ def download_file(token):
         try :
 
             if metadata.get('is_protected') == 'True':
-                redis_service.increment_counter("protected_downloads",1)
-                return render_download_page(token)
+                # Counted by the OPEN script; render without a second lookup
+                return render_template('password.html', metadata=metadata, token=token)
             elif metadata.get('is_protected') == 'False':
-                redis_service.increment_counter("unprotected_downloads",1)
-                return serve_and_delete(uuid_file_name,original_file_name,directory_path,token,redis_service,metadata=metadata,password=None)
+                return serve_and_delete(uuid_file_name,original_file_name,directory_path,token,redis_service,metadata=metadata,password=None,claim=claim)
             else:
                 return jsonify({
                     "status": "error",
@@ -267,11 +487,11 @@ def render_download_page(token):
 
     if metadata.get('is_protected') == 'True':
         # redis_service.increment_counter("/download - protected - visits ",1)
-        redis_service.increment_counter("protected_downloads_visits",1)
+        counters.incr("protected_downloads_visits")
         return render_template('password.html', metadata=metadata, token=token)
     if metadata.get('is_protected') == 'False':
         # redis_service.increment_counter("/download - unprotected - visits ",1)
-        redis_service.increment_counter("unprotected_downloads_visits",1)
+        counters.incr("unprotected_downloads_visits")
         return render_template('dl.html', metadata=metadata, token=token)
     
 
@@ -290,13 +510,14 @@ def verify_token(token):
             metadata = redis_service.get_file_metadata(token)
             if not metadata:
                 return jsonify({"status": "error", "message": "File not found or already downloaded"}), 410
-            return jsonify({"status": "success", "metadata": metadata}), 200
+            return jsonify({"status": "success", "metadata": _public_metadata(metadata)}), 200
 
 
     if request.method == 'POST':
 
-            # Get metadata
-            metadata = redis_service.get_file_metadata(token)
+            # Get metadata (and inline blob / lease TTL) without changing anything
+            peek = redis_service.open_download(token, 'peek')
+            metadata = peek.metadata
             
             if not metadata:
                 return render_template('410.html'), 410
@@ -308,17 +529,28 @@ def verify_token(token):
                                      token=token,
                                      error="Please enter a password"), 400
             
-            stored_hash = metadata.get('password_hash')
-            
-            # Verify password
-            if PasswordUtils.verify_password(password, stored_hash):
+            # Locked, or another client is mid-download: refuse before paying for Argon2
+            if int(metadata.get('attempt_to_unlock', 0)) >= Config.MAX_RETRIES:
+                return render_template('max_retries.html', token=token), 403
+            if lease_busy(metadata, token):
+                return lease_busy_response(peek.retry_after)
+
+            # Let the kernel page the ciphertext in while Argon2 runs
+            if metadata.get('storage') != 'inline':
+                advise_willneed(os.path.join(current_app.config['UPLOAD_FOLDER'], metadata.get('filename', '')))
+
+            # Verify password: unwrapping the file key is the check (one Argon2 run)
+            key = unlock_file_key(metadata, password)
+            if key is not None:
                 # ✅ CORRECT PASSWORD
-                # Reset attempt counter
-                metadata['attempt_to_unlock'] = '0'
-                redis_service.store_file_metadata(token, metadata)
+                # One round trip: reset attempts + claim the download lease
+                claim = redis_service.open_download(token, 'unlock', secret=presented_lease_secret(token))
+                if claim.state == 'gone':
+                    return render_template('410.html'), 410
+                if claim.state == 'locked':
+                    return render_template('max_retries.html', token=token), 403
                 
                 # Serve file
-                redis_service.increment_counter("downloads", 1)
                 return serve_and_delete(
                     metadata.get('filename'),
                     metadata.get('real_filename'),
@@ -326,23 +558,26 @@ def verify_token(token):
                     token,
                     redis_service,
                     password=password,
-                    metadata=metadata
+                    metadata=claim.metadata,
+                    claim=claim,
+                    key=key
                 )
             
             else:
                 # ❌ WRONG PASSWORD
-                # Atomically increment attempt counter (Fix for Race Condition)
-                current_attempts = redis_service.increment_file_attempt(token)
+                # Atomically increment attempt counter and check the lock (ATTEMPT script)
+                current_attempts, locked = redis_service.record_failed_attempt(token)
+                if current_attempts < 0:
+                    return render_template('410.html'), 410
                 
                 # Check if max retries reached
-                
-                # Check if max retries reached
-                if current_attempts >= Config.MAX_RETRIES:
+                if locked:
                     # 🔒 SECURITY UPDATED (Pass 3):
                     # We DO NOT delete the file here. Doing so would create a DoS vector
                     # where an attacker could brute-force delete files they don't own.
                     # Instead, we just lock it (Prevented by the check at route start).
                     current_app.logger.warning(f"Max retries reached for: {token}. File locked.")
+                    counters.event("lock", token, p=True)
                     
                     return render_template('max_retries.html', 
                                          token=token,
@@ -362,36 +597,65 @@ def verify_token(token):
 
 
 # Admin-protected routes (Day 13)
+LIST_PAGE_SIZE = 50
+LIST_PAGE_MAX = 500
+
+
+def _listing_args():
+    """cursor, page size and order from the query string (ValueError if invalid)."""
+    limit = int(request.args.get('limit', LIST_PAGE_SIZE))
+    order = request.args.get('order', 'newest')
+    if not 1 <= limit <= LIST_PAGE_MAX or order not in ('newest', 'oldest'):
+        raise ValueError("bad listing arguments")
+    return request.args.get('cursor') or None, limit, order
+
+
 @bp.route('/list-files', methods=['GET'])
 @admin_required
 @handle_redis_error
 def list_files():
-    """Admin page to list all files (anonymized)."""
-    result = redis_service.list_files()
-    redis_service.increment_counter("list_files_visits", 1)
-    
-    # Get file tokens from redis keys
-    tokens = result.get('redis_keys', []) if isinstance(result, dict) else []
-    
-    # Anonymize files for zero-knowledge
-    anonymized = []
-    for token in tokens:
-        # Skip counter keys and other non-file keys
-        if not token or '_' in token or len(token) < 32:
-            continue
-        try:
-            metadata = redis_service.get_file_metadata(token)
-            if metadata and isinstance(metadata, dict):
-                anonymized.append({
-                    'token': token,
-                    'type': metadata.get('content_type', 'unknown'),
-                    'protected': metadata.get('is_protected', 'False'),
-                })
-        except:
-            # Skip keys that aren't file metadata
-            continue
-    
-    return render_template('admin/list_files.html', files=anonymized, count=len(anonymized))
+    """Admin page to list files (anonymized), one cursor page at a time."""
+    try:
+        cursor, limit, order = _listing_args()
+        files, next_cursor = redis_service.list_files_page(cursor, limit, newest_first=order == 'newest')
+    except ValueError:
+        return render_template('400.html'), 400
+    counters.incr("list_files_visits")
+
+    anonymized = [{
+        'token': entry['token'][:12],
+        'type': entry['content_type'] or 'unknown',
+        'protected': entry['is_protected'] or 'False',
+        'uploaded': datetime.utcfromtimestamp(entry['uploaded']).strftime('%Y-%m-%d %H:%M:%S'),
+    } for entry in files]
+
+    return render_template('admin/list_files.html', files=anonymized, count=redis_service.live_count(),
+                           next_cursor=next_cursor, limit=limit, order=order)
+
+
+@bp.route('/list-files/export', methods=['GET'])
+@admin_required
+@handle_redis_error
+def export_files():
+    """Stream every live file's listing fields as NDJSON (one object per line).
+    Tokens are download secrets: rows carry a hash and the listing's prefix only."""
+    order = request.args.get('order', 'newest')
+    if order not in ('newest', 'oldest'):
+        return jsonify({"status": "error", "error": "order must be newest or oldest"}), 400
+
+    def generate():
+        cursor = None
+        while True:
+            files, cursor = redis_service.list_files_page(cursor, LIST_PAGE_MAX, newest_first=order == 'newest')
+            if files:
+                rows = ({'id': lifecycle_events.token_hash(entry['token']), 'token_prefix': entry['token'][:12],
+                         **{k: v for k, v in entry.items() if k != 'token'}} for entry in files)
+                yield "".join(json.dumps(row, separators=(',', ':')) + "\n" for row in rows)
+            if cursor is None:
+                return
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=files.ndjson'})
 
 
 
@@ -399,9 +663,10 @@ def list_files():
 @admin_required
 def file_info(token):
    try :
-    if redis_service.get_file_metadata(token):
-        redis_service.increment_counter("info_visits", 1)
-        return jsonify({"status": "success", "metadata": redis_service.get_file_metadata(token)}), 200
+    metadata = redis_service.get_file_metadata(token)
+    if metadata:
+        counters.incr("info_visits")
+        return jsonify({"status": "success", "metadata": _public_metadata(metadata)}), 200
     else:
         return jsonify({"status": "error", "message": "Failed to get file metadata"}), 500
    except Exception as e:
@@ -441,37 +706,118 @@ def error_page(code):
 
 @bp.route('/stats')
 @admin_required
+@handle_redis_error
 def stats():
     """Admin stats dashboard (protected)."""
     stats_data = _get_stats_data()
     return render_template('stats.html', stats=stats_data)
 
 
+@bp.route('/stats/kdf')
+@admin_required
+def kdf_stats():
+    """Password-hashing pool load for this worker process (admin)."""
+    return jsonify(kdf_pool.stats())
+
+
+@bp.route('/stats/redis')
+@admin_required
+def redis_pool_stats():
+    """Redis connection pool usage, checkout waits and counter buffer for this worker process (admin)."""
+    return jsonify({**pool_stats(), "counter_buffer": counters.stats(), "stats_stream": hub.stats(),
+                    "rate_limit": rate_limit.prefilter.stats()})
+
+
+@bp.route('/stats/expiry')
+@admin_required
+@handle_redis_error
+def expiry_stats():
+    """Expired-file watcher: current leader, unlinks and expiry-to-unlink lag (admin)."""
+    return jsonify({"enabled": Config.EXPIRY_WATCHER_ENABLED, **ExpiryWatcher(redis_service).stats()})
+
+
+@bp.route('/stats/maintenance')
+@admin_required
+@handle_redis_error
+def maintenance_stats():
+    """Background maintenance: elected leader and the last run of each task (admin)."""
+    return jsonify({"enabled": Config.MAINTENANCE_ENABLED, **MaintenanceScheduler(redis_service).status()})
+
+
+@bp.route('/stats/events')
+@admin_required
+@handle_redis_error
+def event_stats():
+    """Lifecycle event rollup from the aggregator: counts, percentiles and histograms (admin)."""
+    return jsonify(lifecycle_events.summary(redis_service.redis_client))
+
+
 @bp.route('/stats-json')
 @handle_redis_error
 def stats_json():
-    """Return stats as JSON for API/AJAX refresh"""
-    return jsonify(_get_stats_data())
+    """Return stats as JSON for API/AJAX refresh (cached per process, ETag/304)."""
+    _, body, etag = stats_cache.get(redis_service.redis_client)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # revalidate; unchanged stats cost a 304
+    return response.make_conditional(request)
+
+
+@bp.route('/stats/stream')
+@admin_required
+def stats_stream():
+    """Live stats over Server-Sent Events: a snapshot, then counter deltas as they are flushed (admin)."""
+    try:
+        subscriber = hub.subscribe()
+    except StreamsFull:
+        # Each stream holds a worker thread; the page falls back to polling
+        return jsonify({"error": "Too many open streams"}), 503, {'Retry-After': '30'}
+
+    def events():
+        now = time.monotonic()
+        close_at = now + Config.STATS_STREAM_MAX_SECONDS
+        snapshot_at = now + Config.STATS_STREAM_SNAPSHOT_SECONDS
+        try:
+            yield f"retry: 5000\n{sse('snapshot', _get_stats_data())}"
+            while time.monotonic() < close_at:
+                try:
+                    message = subscriber.get(timeout=Config.STATS_STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"  # a gone client fails here and closes the stream
+                    message = False
+                if message is RESYNC or time.monotonic() >= snapshot_at:
+                    snapshot_at = time.monotonic() + Config.STATS_STREAM_SNAPSHOT_SECONDS
+                    yield sse('snapshot', _get_stats_data())
+                elif message:
+                    yield sse('delta', message)
+        except redis.exceptions.RedisError:
+            pass  # the client reconnects
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: do not buffer the stream
+    })
 
 
 def _get_stats_data():
-    """Helper to get all stats counters"""
-    return {
-        "uploads": redis_service.get_counter("uploads"),
-        "downloads": redis_service.get_counter("downloads"),
-        "deletions": redis_service.get_counter("deletions"),
-        "index_visits": redis_service.get_counter("index_visits"),
-        "list_files_visits": redis_service.get_counter("list_files_visits"),
-        "info_visits": redis_service.get_counter("info_visits"),
-        "protected_downloads": redis_service.get_counter("protected_downloads"),
-        "unprotected_downloads": redis_service.get_counter("unprotected_downloads"),
-        "rate_limit_hits": redis_service.get_counter("rate_limit_hits")
-    }
+    """Helper to get all stats counters, time series and unique visitors"""
+    data, _, _ = stats_cache.get(redis_service.redis_client)
+    return data
+
+@bp.app_errorhandler(503)
+def service_unavailable(e):
+    """Overload (e.g. KDF pool full): tell clients when to come back."""
+    headers = {'Retry-After': str(e.retry_after)} if getattr(e, 'retry_after', None) else {}
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        return jsonify({"error": "Service busy", "retry_after": headers.get('Retry-After')}), 503, headers
+    return render_template('503.html'), 503, headers
 
 @bp.app_errorhandler(429)
 def rate_limit_error(e):
     # Increment global rate limit counter
-    redis_service.increment_counter("rate_limit_hits", 1)
+    counters.incr("rate_limit_hits")
     
     current_app.logger.warning(
         f"🚫 Rate limit hit: IP={request.remote_addr}, "
@@ -0,0 +1,175 @@
+"""
+counter_buffer.py - Analytics counters without Redis writes on the request path
+
+Routes call `counters.incr(name)`, which only appends to an in-process deque
+(atomic in CPython, no lock). A background thread drains it every
+COUNTER_FLUSH_MS and applies the summed deltas with one pipelined INCRBY
+batch, together with the per-minute/per-hour buckets and the visitor
+HyperLogLog (`app/services/stats.py`); the last deltas are flushed at
+interpreter exit. `visit(ip)` buffers a visitor address and `event(...)`
+a lifecycle record (`app/services/lifecycle_events.py`) the same way.
+
+If Redis is unavailable the summed deltas are retained and retried with
+the next flush, for at most COUNTER_RETAIN_SECONDS; older ones are dropped.
+The deque holds at most COUNTER_MAX_BUFFER increments between flushes
+(beyond that the oldest are dropped). Analytics are best effort: losing a
+few increments is preferred over slowing a download.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque, Counter
+
+import redis
+
+from config import Config
+from app.services.redis_pool import get_redis
+from app.services.redis_service import RedisService
+from app.services.stats import add_buckets
+from app.services.lifecycle_events import add_events, event_fields
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+
+    def __init__(self, redis_client: redis.Redis = None) -> None:
+        self._redis_client = redis_client
+        self._pending = deque(maxlen=Config.COUNTER_MAX_BUFFER)
+        self._visitors = deque(maxlen=Config.COUNTER_MAX_BUFFER)
+        self._events = deque(maxlen=Config.COUNTER_MAX_BUFFER)
+        self._retained = Counter()
+        self._retained_visitors = set()
+        self._retained_events = []
+        self._retained_since = None
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._flushed = 0
+        self._dropped = 0
+        self._failures = 0
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        return self._redis_client or get_redis()
+
+    def incr(self, name: str, count: int = 1) -> None:
+        '''
+        Count `count` events for `name`; never touches Redis
+        '''
+        if self._pid != os.getpid():
+            self._start()
+        self._pending.append((name, count))
+
+    def visit(self, address: str) -> None:
+        '''
+        Count a visitor for the unique-visitor HyperLogLog; never touches Redis
+        '''
+        if self._pid != os.getpid():
+            self._start()
+        self._visitors.append(address)
+
+    def event(self, kind: str, token: str, **fields) -> None:
+        '''
+        Record a lifecycle event for the event stream; never touches Redis
+        '''
+        if self._pid != os.getpid():
+            self._start()
+        self._events.append(event_fields(kind, token, **fields))
+
+    def _start(self) -> None:
+        with self._flush_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="counter-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(Config.COUNTER_FLUSH_MS / 1000):
+            self.flush()
+
+    def flush(self) -> int:
+        '''
+        Apply every buffered delta in one pipeline. Returns the number of
+        counters written (0 if nothing was pending or Redis failed).
+        '''
+        with self._flush_lock:
+            deltas, visitors, events = self._retained, self._retained_visitors, self._retained_events
+            self._retained, self._retained_visitors, self._retained_events = Counter(), set(), []
+            while True:
+                try:
+                    name, count = self._pending.popleft()
+                except IndexError:
+                    break
+                deltas[name] += count
+            while True:
+                try:
+                    visitors.add(self._visitors.popleft())
+                except IndexError:
+                    break
+            while True:
+                try:
+                    events.append(self._events.popleft())
+                except IndexError:
+                    break
+            deltas = +deltas  # drop zero entries
+            if not deltas and not visitors and not events:
+                return 0
+            try:
+                self._write(deltas, visitors, events)
+            except redis.exceptions.RedisError as e:
+                self._failures += 1
+                now = time.monotonic()
+                if self._retained_since is None:
+                    self._retained_since = now
+                if now - self._retained_since > Config.COUNTER_RETAIN_SECONDS:
+                    self._dropped += sum(deltas.values())
+                    self._retained_since = None
+                    logger.warning(f"Dropped {sum(deltas.values())} buffered counter increments and {len(events)} events: {e}")
+                else:
+                    self._retained, self._retained_visitors, self._retained_events = deltas, visitors, events
+                return 0
+            self._retained_since = None
+            self._flushed += sum(deltas.values())
+            return len(deltas)
+
+    def _write(self, deltas: Counter, visitors: set = (), events: list = ()) -> None:
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for name, count in deltas.items():
+            pipeline.incrby(RedisService.counter_key(name), count)
+        add_buckets(pipeline, deltas, visitors)
+        add_events(pipeline, events)
+        pipeline.execute()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "pending_visitors": len(self._visitors),
+            "pending_events": len(self._events),
+            "retained": sum(self._retained.values()),
+            "flushed": self._flushed,
+            "dropped": self._dropped,
+            "flush_failures": self._failures,
+        }
+
+    def _after_fork(self) -> None:
+        # The parent flushes its own increments; the thread is gone in the child
+        self._pending.clear()
+        self._visitors.clear()
+        self._events.clear()
+        self._retained = Counter()
+        self._retained_visitors = set()
+        self._retained_events = []
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+
+counters = CounterBuffer()
+atexit.register(counters.flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=counters._after_fork)
@@ -0,0 +1,197 @@
+"""
+event_aggregator.py - Roll lifecycle events up into histograms and percentiles
+
+Runs as its own process (`python aggregator.py`), reading `ots:events`
+through the `aggregator` consumer group, so no aggregation happens in the
+web workers. Several aggregators can share the group.
+
+Each batch is binned with NumPy into fixed log-scale histograms (four bins
+per power of two, ~19% wide) kept in Redis:
+
+    ots:events:hist:<metric>   hash bin index -> count
+    ots:events:counts          hash <kind> / <kind>:protected -> count
+
+Fixed bins add up across batches and consumers, so the bin increments and
+the XACK of the batch go in one MULTI: a batch is counted exactly once even
+if the aggregator dies halfway. Every EVENTS_SUMMARY_SECONDS the
+histograms are turned into percentiles and stored as JSON in
+`ots:events:summary` for /stats/events.
+
+Metrics:
+    upload_size         bytes per upload
+    download_size       bytes per completed download
+    time_to_download    ms from upload to completed download
+    download_duration   ms to stream a download
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+
+import numpy as np
+import redis
+
+from config import Config
+from app.services.lifecycle_events import STREAM_KEY, GROUP, SUMMARY_KEY
+
+logger = logging.getLogger(__name__)
+
+COUNTS_KEY = "ots:events:counts"
+HIST_KEY = "ots:events:hist:{metric}"
+BINS_PER_OCTAVE = 4
+EDGES = 2.0 ** (np.arange(0, 48 * BINS_PER_OCTAVE + 1) / BINS_PER_OCTAVE)  # 1 .. 2^48
+PERCENTILES = (50, 90, 95, 99)
+
+# metric -> (event kind, record field)
+METRICS = {
+    "upload_size": ("upload", "s"),
+    "download_size": ("download", "s"),
+    "time_to_download": ("download", "age"),
+    "download_duration": ("download", "dur"),
+}
+
+
+def bin_counts(values) -> np.ndarray:
+    '''
+    Histogram of `values` over EDGES; out-of-range values land in the end bins
+    '''
+    values = np.clip(np.asarray(values, dtype=np.float64), EDGES[0], EDGES[-1])
+    counts, _ = np.histogram(values, bins=EDGES)
+    return counts
+
+
+def percentiles(counts: np.ndarray, qs=PERCENTILES) -> dict:
+    '''
+    Percentiles from bin counts, interpolated geometrically inside the bin
+    '''
+    total = counts.sum()
+    if not total:
+        return {f"p{q}": None for q in qs}
+    cumulative = np.cumsum(counts)
+    targets = np.asarray(qs, dtype=np.float64) / 100 * total
+    index = np.minimum(np.searchsorted(cumulative, targets), len(counts) - 1)
+    before = cumulative[index] - counts[index]
+    fraction = (targets - before) / np.maximum(counts[index], 1)
+    low, high = EDGES[index], EDGES[index + 1]
+    values = low * (high / low) ** fraction
+    return {f"p{q}": round(float(value), 1) for q, value in zip(qs, values)}
+
+
+class EventAggregator:
+
+    def __init__(self, redis_client: redis.Redis) -> None:
+        self.redis_client = redis_client
+        self._group_ready = False
+
+    def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            self.redis_client.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def aggregate(self, entries) -> int:
+        '''
+        Bin one batch of stream entries and acknowledge it atomically.
+        Returns the number of events counted.
+        '''
+        if not entries:
+            return 0
+        records = [fields for _, fields in entries if fields]
+        pipeline = self.redis_client.pipeline(transaction=True)
+        kinds = {}
+        for record in records:
+            kind = record.get("e", "unknown")
+            kinds[kind] = kinds.get(kind, 0) + 1
+            if record.get("p") == "1":
+                kinds[f"{kind}:protected"] = kinds.get(f"{kind}:protected", 0) + 1
+        for name, count in kinds.items():
+            pipeline.hincrby(COUNTS_KEY, name, count)
+        for metric, (kind, field) in METRICS.items():
+            values = [float(r[field]) for r in records if r.get("e") == kind and field in r]
+            if not values:
+                continue
+            counts = bin_counts(values)
+            for index in np.flatnonzero(counts):
+                pipeline.hincrby(HIST_KEY.format(metric=metric), int(index), int(counts[index]))
+        pipeline.xack(STREAM_KEY, GROUP, *[entry_id for entry_id, _ in entries])
+        pipeline.execute()
+        return len(records)
+
+    def summarize(self) -> dict:
+        '''
+        Percentiles and non-empty histogram bins for every metric, stored in
+        SUMMARY_KEY
+        '''
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.hgetall(COUNTS_KEY)
+        for metric in METRICS:
+            pipeline.hgetall(HIST_KEY.format(metric=metric))
+        results = pipeline.execute()
+
+        metrics = {}
+        for metric, bins in zip(METRICS, results[1:]):
+            counts = np.zeros(len(EDGES) - 1, dtype=np.int64)
+            for index, count in bins.items():
+                counts[int(index)] = int(count)
+            nonzero = np.flatnonzero(counts)
+            metrics[metric] = {
+                "count": int(counts.sum()),
+                **percentiles(counts),
+                "histogram": [[round(float(EDGES[i]), 1), round(float(EDGES[i + 1]), 1), int(counts[i])]
+                              for i in nonzero],
+            }
+        rollup = {
+            "updated": int(time.time()),
+            "counts": {name: int(count) for name, count in results[0].items()},
+            "metrics": metrics,
+        }
+        self.redis_client.set(SUMMARY_KEY, json.dumps(rollup, separators=(",", ":")))
+        return rollup
+
+    def run(self, stop: threading.Event = None, consumer: str = None, block_ms: int = 2000) -> int:
+        '''
+        Consume events until `stop` is set (or interrupted). Batches left
+        unacknowledged by a dead aggregator are reclaimed after
+        EVENTS_CLAIM_IDLE_MS. Returns the number of events counted.
+        '''
+        stop = stop or threading.Event()
+        consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        counted, dirty = 0, False
+        last_claim = last_summary = 0.0
+        logger.info(f"Event aggregator {consumer} started")
+
+        while not stop.is_set():
+            try:
+                self._ensure_group()
+                entries = []
+                if time.time() - last_claim > Config.EVENTS_CLAIM_IDLE_MS / 1000:
+                    last_claim = time.time()
+                    entries = self.redis_client.xautoclaim(
+                        STREAM_KEY, GROUP, consumer, Config.EVENTS_CLAIM_IDLE_MS,
+                        start_id="0-0", count=Config.EVENTS_BATCH_SIZE)[1]
+                if not entries:
+                    response = self.redis_client.xreadgroup(
+                        GROUP, consumer, {STREAM_KEY: ">"}, count=Config.EVENTS_BATCH_SIZE, block=block_ms)
+                    entries = response[0][1] if response else []
+                if entries:
+                    counted += self.aggregate(entries)
+                    dirty = True
+                if dirty and time.time() - last_summary >= Config.EVENTS_SUMMARY_SECONDS:
+                    self.summarize()
+                    last_summary, dirty = time.time(), False
+            except redis.exceptions.ResponseError as e:
+                if "NOGROUP" not in str(e):
+                    raise
+                self._group_ready = False  # stream was deleted; recreate the group
+            except redis.exceptions.ConnectionError as e:
+                logger.warning(f"Event aggregator: {e}")
+                stop.wait(5)
+        if dirty:
+            self.summarize()
+        return counted
@@ -0,0 +1,220 @@
+"""
+expiry_watcher.py - Unlink a file's ciphertext as soon as its token expires
+
+When a token's TTL lapses Redis drops the metadata, but the file on disk
+used to stay until the next startup cleanup. The watcher subscribes to
+`__keyevent@<db>__:expired` (enabled with `notify-keyspace-events Ex`) and,
+for every expired `ots:file:<token>`, unlinks the file and drops the token
+from the registry, and records an `expire` lifecycle event.
+
+- One watcher per host consumes events: each process runs the thread, but
+  only the holder of `ots:lock:expiry:<host>` (a renewed Redis lock)
+  subscribes; the others wait to take over.
+- Pub/sub is fire-and-forget, so the leader also runs the registry sweep
+  every EXPIRY_RECONCILE_SECONDS to catch events missed while nobody was
+  subscribed.
+- Lag between the expiry time and the unlink is kept for /stats/expiry.
+"""
+import os
+import time
+import socket
+import logging
+import threading
+import statistics
+
+import redis
+
+from config import Config
+from app.services.redis_service import RedisService
+from app.services.counter_buffer import counters
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "ots:lock:expiry:{host}"
+STATS_KEY = "ots:expiry:stats"
+LAG_KEY = "ots:expiry:lag_ms"
+LAG_SAMPLES = 1000
+
+
+class ExpiryWatcher:
+
+    def __init__(self, redis_service: RedisService, host: str = None) -> None:
+        self.redis_service = redis_service
+        self.host = host or socket.gethostname()
+        self.leading = False
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        return self.redis_service.redis_client
+
+    @property
+    def channel(self) -> str:
+        db = self.redis_client.connection_pool.connection_kwargs.get("db", 0)
+        return f"__keyevent@{db}__:expired"
+
+    def enable_notifications(self) -> bool:
+        '''
+        Make sure the server publishes expired events (adds "Ex" to
+        notify-keyspace-events). Returns False where CONFIG is not allowed
+        (managed Redis); the reconciler still removes files then.
+        '''
+        try:
+            flags = self.redis_client.config_get("notify-keyspace-events").get("notify-keyspace-events", "")
+            if "E" in flags and ("x" in flags or "A" in flags):
+                return True
+            merged = "".join(sorted(set(flags) | {"E", "x"}))
+            self.redis_client.config_set("notify-keyspace-events", merged)
+            return True
+        except redis.exceptions.ResponseError as e:
+            logger.warning(f"Cannot enable expired-key notifications ({e}); relying on the reconciler")
+            return False
+
+    def handle_expired(self, key: str) -> bool:
+        '''
+        React to one expired key: unlink the token's file and drop it from
+        the registry. Returns True if the key was a file token.
+        '''
+        if not key.startswith("ots:file:"):
+            return False
+        token = os.path.basename(key[len("ots:file:"):])
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.zscore(RedisService.REGISTRY_KEY, token)
+        self.redis_service._unregister(pipeline, token)
+        expires_at = pipeline.execute()[0]
+
+        unlinked = 0
+        try:
+            os.remove(os.path.join(Config.UPLOAD_FOLDER, token))
+            unlinked = 1
+        except FileNotFoundError:
+            pass  # inline file, or already removed
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.hincrby(STATS_KEY, "events", 1)
+        pipeline.hincrby(STATS_KEY, "unlinked", unlinked)
+        if expires_at is not None:
+            pipeline.lpush(LAG_KEY, round(max(time.time() - expires_at, 0) * 1000, 1))
+            pipeline.ltrim(LAG_KEY, 0, LAG_SAMPLES - 1)
+        pipeline.execute()
+        counters.event("expire", token)
+        return True
+
+    def reconcile(self) -> int:
+        '''
+        Sweep registry entries whose expiry has passed (events missed while
+        no watcher was subscribed). Returns the number of files removed.
+        '''
+        removed = self.redis_service.sweep_expired()
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.hincrby(STATS_KEY, "reconciled", removed)
+        pipeline.hset(STATS_KEY, "last_reconcile", int(time.time()))
+        pipeline.execute()
+        if removed:
+            logger.info(f"Expiry reconciler removed {removed} files missed by the watcher")
+        return removed
+
+    def run(self, stop: threading.Event) -> None:
+        '''
+        Contend for this host's lock until `stop` is set; consume events
+        while holding it.
+        '''
+        lock = self.redis_client.lock(
+            LOCK_KEY.format(host=self.host), timeout=Config.EXPIRY_LOCK_SECONDS, thread_local=False)
+        while not stop.is_set():
+            try:
+                if lock.acquire(blocking=False):
+                    self.leading = True
+                    self.redis_client.hset(STATS_KEY, "leader", f"{self.host}-{os.getpid()}")
+                    logger.info(f"Expiry watcher leading on {self.host} (pid {os.getpid()})")
+                    self._consume(lock, stop)
+                else:
+                    stop.wait(Config.EXPIRY_LOCK_SECONDS / 2)
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Expiry watcher: {e}")
+                stop.wait(5)
+            finally:
+                if self.leading:
+                    self.leading = False
+                    try:
+                        lock.release()
+                    except redis.exceptions.RedisError:
+                        pass  # lost or expired already
+
+    def _consume(self, lock, stop: threading.Event) -> None:
+        self.enable_notifications()
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        renew_at = time.monotonic() + Config.EXPIRY_LOCK_SECONDS / 3
+        reconcile_at = time.monotonic()  # once on taking over
+        try:
+            while not stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "message":
+                    self.handle_expired(message["data"])
+                now = time.monotonic()
+                if now >= renew_at:
+                    lock.reacquire()  # raises LockNotOwnedError if another process took over
+                    renew_at = now + Config.EXPIRY_LOCK_SECONDS / 3
+                if now >= reconcile_at:
+                    self.reconcile()
+                    reconcile_at = now + Config.EXPIRY_RECONCILE_SECONDS
+        finally:
+            pubsub.close()
+
+    def stats(self) -> dict:
+        pipeline = self.redis_client.pipeline()
+        pipeline.hgetall(STATS_KEY)
+        pipeline.lrange(LAG_KEY, 0, -1)
+        counters, lags = pipeline.execute()
+        samples = sorted(float(x) for x in lags)
+        return {
+            "leader": counters.get("leader"),
+            "events": int(counters.get("events", 0)),
+            "unlinked": int(counters.get("unlinked", 0)),
+            "reconciled": int(counters.get("reconciled", 0)),
+            "last_reconcile": int(counters["last_reconcile"]) if "last_reconcile" in counters else None,
+            "lag_ms_p50": round(statistics.median(samples), 1) if samples else None,
+            "lag_ms_p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else None,
+            "lag_ms_max": samples[-1] if samples else None,
+        }
+
+
+_lock = threading.Lock()
+_thread = None
+_stop = None
+
+
+def start_watcher(redis_service: RedisService) -> bool:
+    '''
+    Start this process's watcher thread (once). Returns False if it was
+    already running.
+    '''
+    global _thread, _stop
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        _stop = threading.Event()
+        _thread = threading.Thread(
+            target=ExpiryWatcher(redis_service).run, args=(_stop,), name="expiry-watcher", daemon=True)
+        _thread.start()
+        return True
+
+
+def stop_watcher(timeout: float = 5) -> None:
+    global _thread
+    with _lock:
+        if _thread is not None:
+            _stop.set()
+            _thread.join(timeout)
+            _thread = None
+
+
+def _after_fork() -> None:
+    # The thread does not exist in a forked child; let it start its own
+    global _thread, _lock
+    _thread = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,124 @@
+"""
+key_migration.py - Move pre-namespace keys under "ots:"
+
+Older releases stored file metadata and counters at the top level of the
+Redis db:
+
+    <uuid><ext>              ->  ots:file:<uuid><ext>   (+ registry entries)
+    <counter name>           ->  ots:ctr:<name>
+
+Only those exact shapes move: a token key must be a hash whose `token`
+field is its own name. Anything else in the db is left alone.
+
+The walk uses SCAN and RENAMENX (TTLs move with the key), so it can run
+against a live server and is safe to repeat or to run from several workers
+at once. `flask --app run ots-maintenance` (and the maintenance leader when
+it takes the lead) runs it once per db, guarded by the `ots:schema` marker;
+it can also be run by hand, ignoring the marker:
+
+    python -m app.services.key_migration
+"""
+import re
+import time
+import typing
+import logging
+
+import redis
+
+from config import Config
+from app.services.redis_pool import get_redis
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_KEY = "ots:schema"
+SCHEMA_VERSION = "2"
+
+COUNTERS = (
+    "uploads", "downloads", "deletions",
+    "index_visits", "list_files_visits", "info_visits",
+    "protected_downloads", "unprotected_downloads",
+    "protected_downloads_visits", "unprotected_downloads_visits",
+    "rate_limit_hits",
+)
+
+# uuid4 file name as generated on upload, with the original extension
+_TOKEN_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(\.[A-Za-z0-9]+)?")
+
+
+def _candidate(key: str) -> bool:
+    return key in COUNTERS or _TOKEN_RE.fullmatch(key) is not None
+
+
+def _target(key: str, key_type: str, token_field: typing.Optional[str]) -> typing.Optional[str]:
+    if key in COUNTERS and key_type == "string":
+        return RedisService.counter_key(key)
+    if key_type == "hash" and token_field == key:
+        return RedisService.file_key(key)
+    return None
+
+
+def migrate(client: redis.Redis, batch: int = 500) -> dict:
+    '''
+    Rename every legacy key to its namespaced name. Returns counts of
+    renamed keys and of keys left alone because the new name already exists.
+    '''
+    renamed = skipped = 0
+    keys = [key for key in client.scan_iter(count=batch) if _candidate(key)]
+    for i in range(0, len(keys), batch):
+        chunk = keys[i:i + batch]
+        pipeline = client.pipeline(transaction=False)
+        for key in chunk:
+            pipeline.type(key)
+            pipeline.hget(key, "token")
+            pipeline.ttl(key)
+        replies = pipeline.execute(raise_on_error=False)
+
+        moves = []
+        for key, key_type, token_field, ttl in zip(chunk, replies[::3], replies[1::3], replies[2::3]):
+            if isinstance(token_field, Exception):
+                token_field = None  # WRONGTYPE: not a hash
+            target = _target(key, key_type, token_field)
+            if target:
+                moves.append((key, target, key_type, ttl))
+
+        pipeline = client.pipeline(transaction=False)
+        for key, target, _, _ in moves:
+            pipeline.renamenx(key, target)
+        results = pipeline.execute(raise_on_error=False)
+
+        now = int(time.time())
+        pipeline = client.pipeline(transaction=False)
+        for (key, target, key_type, ttl), moved in zip(moves, results):
+            if moved is not True:
+                skipped += 1  # target exists, or the key expired under us
+                continue
+            renamed += 1
+            if target.startswith("ots:file:"):
+                if ttl < 0:
+                    ttl = Config.REDIS_TTL
+                    pipeline.expire(target, ttl)
+                pipeline.zadd(RedisService.REGISTRY_KEY, {key: now + ttl})
+                # Upload time is not indexed in old releases; infer it from the TTL left
+                pipeline.zadd(RedisService.UPLOADED_KEY, {key: now - max(Config.REDIS_TTL - ttl, 0)})
+        pipeline.execute()
+
+    logger.info(f"Key migration: {renamed} keys renamed, {skipped} skipped")
+    return {"renamed": renamed, "skipped": skipped}
+
+
+def ensure_migrated(client: redis.Redis) -> bool:
+    '''
+    Run `migrate` unless this db is already at SCHEMA_VERSION.
+    Returns True if a migration ran.
+    '''
+    if client.get(SCHEMA_KEY) == SCHEMA_VERSION:
+        return False
+    migrate(client)
+    client.set(SCHEMA_KEY, SCHEMA_VERSION)
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(migrate(get_redis()))
@@ -0,0 +1,80 @@
+"""
+lifecycle_events.py - Compact token lifecycle records for offline analytics
+
+Routes record events through the counter buffer (`counters.event(...)`),
+which XADDs them to the capped `ots:events` stream with its next flush, so
+recording costs no Redis round trip on the request path. A record is a
+few short fields:
+
+    e    upload | download | lock | expire | delete
+    h    token hash (16 hex chars); tokens are download secrets and are
+         never written to the stream
+    ts   event time, epoch ms
+    s    plaintext size in bytes          (upload, download)
+    p    1 if password protected          (upload, download, lock)
+    st   i (inline) or d (disk)           (upload, delete)
+    age  ms from upload to download       (download)
+    dur  ms to stream the download        (download)
+
+The stream keeps about EVENTS_STREAM_MAXLEN records (approximate MAXLEN).
+`python aggregator.py` rolls them up into histograms and percentiles
+(`app/services/event_aggregator.py`); `summary()` reads its result.
+"""
+import json
+import time
+import hashlib
+
+import redis
+
+from config import Config
+
+STREAM_KEY = "ots:events"
+GROUP = "aggregator"
+SUMMARY_KEY = "ots:events:summary"
+EVENT_TYPES = ("upload", "download", "lock", "expire", "delete")
+
+
+def token_hash(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=8).hexdigest()
+
+
+def event_fields(kind: str, token: str, **fields) -> dict:
+    '''
+    One stream record; fields that are None are left out
+    '''
+    record = {"e": kind, "h": token_hash(token), "ts": int(time.time() * 1000)}
+    for name, value in fields.items():
+        if value is None:
+            continue
+        record[name] = int(value) if isinstance(value, (bool, float)) else value
+    return record
+
+
+def add_events(pipeline, events) -> None:
+    '''
+    Queue the XADDs for one flush on `pipeline`
+    '''
+    for record in events:
+        pipeline.xadd(STREAM_KEY, record, maxlen=Config.EVENTS_STREAM_MAXLEN, approximate=True)
+
+
+def summary(redis_client: redis.Redis) -> dict:
+    '''
+    The aggregator's latest rollup plus stream length and backlog, in one
+    round trip.
+    '''
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.get(SUMMARY_KEY)
+    pipeline.xlen(STREAM_KEY)
+    pipeline.xinfo_groups(STREAM_KEY)
+    try:
+        rollup, length, groups = pipeline.execute()
+    except redis.exceptions.ResponseError:
+        # No stream yet (nothing recorded since the last reset)
+        rollup, length, groups = redis_client.get(SUMMARY_KEY), 0, []
+    group = next((g for g in groups if g["name"] == GROUP), None)
+    return {
+        "stream_length": length,
+        "aggregator_pending": group["pending"] if group else None,
+        **(json.loads(rollup) if rollup else {"updated": None, "counts": {}, "metrics": {}}),
+    }
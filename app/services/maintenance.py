@@ -0,0 +1,188 @@
+"""
+maintenance.py - Leader-elected background maintenance
+
+Every process runs the scheduler thread, but only the holder of
+`ots:lock:maintenance` (one per deployment, renewed while it works) runs
+the tasks; the others wait to take over if it dies. On taking the lead it
+applies any pending key migration; then, every
+MAINTENANCE_INTERVAL_SECONDS:
+
+    orphan_files     sweep expired registry entries, then unlink disk files
+                     with no live token (batched ZMSCORE)
+    orphan_metadata  ZSCAN a slice of the registry and drop metadata whose
+                     file or blob is gone; the cursor is kept in Redis so
+                     the next run continues where this one stopped
+
+Work is done in MAINTENANCE_BATCH_SIZE batches with MAINTENANCE_BATCH_PAUSE
+between them, so a run never monopolises Redis or the disk. Status and
+timing of each task are kept in Redis for the admin dashboard.
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+
+import redis
+
+from config import Config
+from app.services.redis_service import RedisService
+from app.services.key_migration import ensure_migrated
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "ots:lock:maintenance"
+STATUS_KEY = "ots:maint:status"
+METADATA_CURSOR_KEY = "ots:maint:cursor:metadata"
+
+
+class MaintenanceScheduler:
+
+    def __init__(self, redis_service: RedisService) -> None:
+        self.redis_service = redis_service
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self.leading = False
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        return self.redis_service.redis_client
+
+    def _orphan_files(self, pace) -> dict:
+        return self.redis_service.cleanup_orphan_files(Config.MAINTENANCE_BATCH_SIZE, pace)
+
+    def _orphan_metadata(self, pace) -> dict:
+        cursor = int(self.redis_client.get(METADATA_CURSOR_KEY) or 0)
+        result = self.redis_service.cleanup_orphan_metadata(
+            Config.MAINTENANCE_BATCH_SIZE, pace, cursor=cursor, max_batches=Config.MAINTENANCE_METADATA_BATCHES)
+        if result.get("success"):
+            self.redis_client.set(METADATA_CURSOR_KEY, result["cursor"])
+        return result
+
+    def run_once(self, pace=None) -> dict:
+        '''
+        Run every task once and record its outcome. `pace` is called
+        between batches (lock renewal and rate limiting); if it finds the
+        lock lost, the pass stops and the LockError propagates, so a former
+        leader never keeps sweeping alongside the new one.
+        '''
+        results = {}
+        for name, task in (("orphan_files", self._orphan_files), ("orphan_metadata", self._orphan_metadata)):
+            started = time.time()
+            try:
+                result = task(pace)
+                ok = bool(result.get("success"))
+            except redis.exceptions.LockError:
+                raise
+            except Exception as e:
+                logger.error(f"Maintenance task {name} failed: {e}")
+                result, ok = {"error": str(e)}, False
+            results[name] = {
+                "started": int(started),
+                "duration_ms": round((time.time() - started) * 1000, 1),
+                "ok": ok,
+                "result": result,
+            }
+        finished = time.time()
+        self.redis_client.hset(STATUS_KEY, mapping={
+            **{name: json.dumps(status) for name, status in results.items()},
+            "last_run": int(finished),
+            "next_run": int(finished + Config.MAINTENANCE_INTERVAL_SECONDS),
+        })
+        return results
+
+    def run(self, stop: threading.Event) -> None:
+        '''
+        Contend for the deployment-wide lock until `stop` is set; run the
+        tasks on schedule while holding it.
+        '''
+        lock = self.redis_client.lock(LOCK_KEY, timeout=Config.MAINTENANCE_LOCK_SECONDS, thread_local=False)
+
+        def pace():
+            lock.reacquire()  # raises LockNotOwnedError if another process took over
+            stop.wait(Config.MAINTENANCE_BATCH_PAUSE)
+
+        while not stop.is_set():
+            try:
+                if not lock.acquire(blocking=False):
+                    stop.wait(Config.MAINTENANCE_LOCK_SECONDS / 2)
+                    continue
+                self.leading = True
+                self.redis_client.hset(STATUS_KEY, "leader", self.name)
+                logger.info(f"Maintenance scheduler leading ({self.name})")
+                if ensure_migrated(self.redis_client):
+                    logger.info("Key migration complete")
+                while not stop.is_set():
+                    # A previous leader's schedule carries over
+                    next_run = int(self.redis_client.hget(STATUS_KEY, "next_run") or 0)
+                    if time.time() >= next_run:
+                        self.run_once(pace)
+                        continue
+                    lock.reacquire()
+                    stop.wait(min(Config.MAINTENANCE_LOCK_SECONDS / 3, next_run - time.time()))
+            except redis.exceptions.LockError:
+                logger.warning(f"Maintenance scheduler lost the lead ({self.name})")
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Maintenance scheduler: {e}")
+                stop.wait(5)
+            finally:
+                if self.leading:
+                    self.leading = False
+                    try:
+                        lock.release()
+                    except redis.exceptions.RedisError:
+                        pass  # lost or expired already
+
+    def status(self) -> dict:
+        status = self.redis_client.hgetall(STATUS_KEY)
+        return {
+            "leader": status.pop("leader", None),
+            "last_run": int(status.pop("last_run")) if "last_run" in status else None,
+            "next_run": int(status.pop("next_run")) if "next_run" in status else None,
+            "tasks": {name: json.loads(value) for name, value in status.items()},
+        }
+
+
+_lock = threading.Lock()
+_thread = None
+_stop = None
+
+
+def start_scheduler(app, redis_service: RedisService) -> bool:
+    '''
+    Start this process's scheduler thread (once) inside an app context.
+    Returns False if it was already running.
+    '''
+    global _thread, _stop
+
+    def run(stop):
+        with app.app_context():
+            MaintenanceScheduler(redis_service).run(stop)
+
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        _stop = threading.Event()
+        _thread = threading.Thread(target=run, args=(_stop,), name="maintenance", daemon=True)
+        _thread.start()
+        return True
+
+
+def stop_scheduler(timeout: float = 5) -> None:
+    global _thread
+    with _lock:
+        if _thread is not None:
+            _stop.set()
+            _thread.join(timeout)
+            _thread = None
+
+
+def _after_fork() -> None:
+    # The thread does not exist in a forked child; let it start its own
+    global _thread, _lock
+    _thread = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
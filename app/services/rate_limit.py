@@ -0,0 +1,225 @@
+"""
+rate_limit.py - Shared rate-limit storage for Flask-Limiter
+
+Limits used to live in each worker's memory (`memory://`), so every
+gunicorn worker enforced its own copy: with four workers a client got four
+times the configured limit, and each worker kept a window per client IP.
+`ots+redis://` (RATELIMIT_STORAGE_URI) registers this module's storage
+with `limits`:
+
+- Windows live in Redis on the process's shared pool (`ots:rl:<key>`), so
+  a limit holds across workers and hosts.
+- A moving-window hit is one Lua call. The script reads Redis' own clock
+  (TIME), so hosts with skewed clocks still agree on a window.
+- A local pre-filter runs in front of Redis. It keeps a token bucket per
+  limit key, sized to the whole limit and refilled at its rate, plus the
+  "full until" time of any window Redis has already refused. A client
+  that drains its bucket in this worker alone, or one Redis has refused,
+  gets its 429 without a round trip. A hit Redis refuses gives its tokens
+  back, so a client within its limit never drains the bucket and the
+  pre-filter cannot reject it. The pre-filter
+  keeps at most RATELIMIT_PREFILTER_KEYS entries (least recently used are
+  dropped, which only makes it more lenient).
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import redis
+from redis.commands.core import Script
+from limits.storage import Storage, MovingWindowSupport
+
+from config import Config
+from app.services.redis_pool import get_redis, unlink_matching
+
+KEY_PREFIX = "ots:rl:"
+
+# KEYS: window (list of entry times, newest first)
+# ARGV: limit, expiry seconds, amount
+# Returns {1, '0'} when acquired, else {0, seconds until the window has room}.
+ACQUIRE_MOVING_WINDOW = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local limit, expiry, amount = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+if amount > limit then
+    return {0, tostring(expiry)}
+end
+local oldest = redis.call('LINDEX', KEYS[1], limit - amount)
+if oldest and tonumber(oldest) > now - expiry then
+    return {0, tostring(tonumber(oldest) + expiry - now)}
+end
+for _ = 1, amount do
+    redis.call('LPUSH', KEYS[1], string.format('%.6f', now))
+end
+redis.call('LTRIM', KEYS[1], 0, limit - 1)
+redis.call('EXPIRE', KEYS[1], math.ceil(expiry))
+return {1, '0'}
+"""
+
+# KEYS: window; ARGV: limit, expiry seconds
+# Returns {start of window (oldest live entry) or now, live entries}.
+MOVING_WINDOW = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local entries = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local start, count = now, 0
+for _, entry in ipairs(entries) do
+    if tonumber(entry) <= now - tonumber(ARGV[2]) then
+        break
+    end
+    start, count = tonumber(entry), count + 1
+end
+return {tostring(start), count}
+"""
+
+# KEYS: counter; ARGV: expiry seconds, amount (fixed-window strategy)
+INCR_EXPIRE = """
+local value = redis.call('INCRBY', KEYS[1], ARGV[2])
+if value == tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return value
+"""
+
+
+class LocalPrefilter:
+    '''
+    Per-process token buckets and known-full windows, keyed by limit key
+    '''
+
+    def __init__(self, max_keys: int = None) -> None:
+        self.max_keys = max_keys or Config.RATELIMIT_PREFILTER_KEYS
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> [tokens, updated, blocked_until]
+        self.local_rejections = 0
+        self.redis_calls = 0
+        self.redis_rejections = 0
+
+    def allow(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        '''
+        Take `amount` tokens for `key`. False means the client is over the
+        limit for certain; True means ask Redis.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [float(limit), now, 0.0]
+                if len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            if now < entry[2]:
+                self.local_rejections += 1
+                return False
+            tokens = min(float(limit), entry[0] + (now - entry[1]) * limit / expiry)
+            entry[1] = now
+            if tokens < amount:
+                entry[0] = tokens
+                self.local_rejections += 1
+                return False
+            entry[0] = tokens - amount
+            return True
+
+    def block(self, key: str, seconds: float, amount: int = 1) -> None:
+        '''
+        Redis refused `key`: its window stays full for `seconds`, and the
+        `amount` tokens taken for the refused hit are returned
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[0] += amount  # capped at the limit on the next allow()
+                entry[2] = time.monotonic() + seconds
+
+    def clear(self, key: str = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._entries),
+            "max_keys": self.max_keys,
+            "local_rejections": self.local_rejections,
+            "redis_calls": self.redis_calls,
+            "redis_rejections": self.redis_rejections,
+        }
+
+
+prefilter = LocalPrefilter()
+
+
+class SharedRedisStorage(Storage, MovingWindowSupport):
+    '''
+    `limits` storage on this process's Redis pool, registered as `ots+redis://`
+    '''
+
+    STORAGE_SCHEME = ["ots+redis"]
+
+    def __init__(self, uri: str = None, wrap_exceptions: bool = False, **options) -> None:
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._acquire_script = Script(None, ACQUIRE_MOVING_WINDOW.encode())
+        self._window_script = Script(None, MOVING_WINDOW.encode())
+        self._incr_script = Script(None, INCR_EXPIRE.encode())
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        # Resolved per call: the pool is rebuilt in each forked worker
+        return get_redis()
+
+    @property
+    def base_exceptions(self):
+        return redis.exceptions.RedisError
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if Config.RATELIMIT_PREFILTER_ENABLED and not prefilter.allow(key, limit, expiry, amount):
+            return False
+        prefilter.redis_calls += 1
+        acquired, retry_in = self._acquire_script(
+            keys=[KEY_PREFIX + key], args=[limit, expiry, amount], client=self.redis_client)
+        if not acquired:
+            prefilter.redis_rejections += 1
+            prefilter.block(key, float(retry_in), amount)
+        return bool(acquired)
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> tuple:
+        start, count = self._window_script(
+            keys=[KEY_PREFIX + key], args=[limit, expiry], client=self.redis_client)
+        return float(start), int(count)
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return int(self._incr_script(keys=[KEY_PREFIX + key], args=[expiry, amount], client=self.redis_client))
+
+    def get(self, key: str) -> int:
+        return int(self.redis_client.get(KEY_PREFIX + key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        return time.time() + max(self.redis_client.pttl(KEY_PREFIX + key), 0) / 1000
+
+    def check(self) -> bool:
+        try:
+            return bool(self.redis_client.ping())
+        except redis.exceptions.RedisError:
+            return False
+
+    def reset(self) -> int:
+        prefilter.clear()
+        return unlink_matching(self.redis_client, f"{KEY_PREFIX}*")
+
+    def clear(self, key: str) -> None:
+        prefilter.clear(key)
+        self.redis_client.unlink(KEY_PREFIX + key)
+
+
+def _after_fork() -> None:
+    # Buckets describe the parent's traffic; the child starts lenient
+    global prefilter
+    prefilter = LocalPrefilter()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,138 @@
+"""
+redis_pool.py - One tuned Redis connection pool per process
+
+Every Redis user in a process (routes, create_app, the maintenance and
+aggregator commands) shares the client returned by `get_redis()`:
+
+- a BlockingConnectionPool capped at REDIS_MAX_CONNECTIONS; when it is
+  exhausted callers wait up to REDIS_POOL_TIMEOUT instead of opening more
+  sockets,
+- socket/connect timeouts and TCP keepalive, or a unix socket
+  (REDIS_SOCKET_PATH) when Redis runs on the same host,
+- redis-py's `health_check_interval` instead of explicit PINGs: idle
+  connections are checked before reuse,
+- fork-safe: a forked child (gunicorn worker) drops the inherited client
+  and builds its own pool on first use,
+- checkout waits and timeouts are kept for /stats/redis.
+"""
+import os
+import time
+import threading
+import statistics
+from collections import deque
+import redis
+from config import Config
+
+
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    """BlockingConnectionPool that records how long checkouts wait."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._checkouts = 0
+        self._exhausted = 0
+        self._timeouts = 0
+
+    def get_connection(self, *args, **kwargs):
+        if self.pool.empty():
+            with self._stats_lock:
+                self._exhausted += 1
+        start = time.monotonic()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except redis.exceptions.ConnectionError as e:
+            if str(e) == "No connection available.":
+                with self._stats_lock:
+                    self._timeouts += 1
+            raise
+        with self._stats_lock:
+            self._checkouts += 1
+            self._waits.append(time.monotonic() - start)
+        return connection
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            waits = sorted(self._waits)
+            checkouts, exhausted, timeouts = self._checkouts, self._exhausted, self._timeouts
+        return {
+            "max_connections": self.max_connections,
+            "connections": len(self._connections),
+            "idle": sum(1 for c in list(self.pool.queue) if c is not None),
+            "checkouts": checkouts,
+            "exhausted": exhausted,
+            "timeouts": timeouts,
+            "wait_ms_p50": round(statistics.median(waits) * 1000, 3) if waits else None,
+            "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 3) if waits else None,
+            "wait_ms_max": round(waits[-1] * 1000, 3) if waits else None,
+        }
+
+
+_lock = threading.Lock()
+_client = None
+
+
+def _build_pool() -> MeteredConnectionPool:
+    kwargs = dict(
+        max_connections=Config.REDIS_MAX_CONNECTIONS,
+        timeout=Config.REDIS_POOL_TIMEOUT,
+        db=Config.REDIS_DB,
+        decode_responses=True,
+        socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=Config.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=Config.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+    if Config.REDIS_SOCKET_PATH:
+        return MeteredConnectionPool(
+            connection_class=redis.UnixDomainSocketConnection, path=Config.REDIS_SOCKET_PATH, **kwargs)
+    return MeteredConnectionPool(
+        host=Config.REDIS_HOST, port=Config.REDIS_PORT, socket_keepalive=True, **kwargs)
+
+
+def get_redis() -> redis.Redis:
+    '''
+    This process's Redis client (built on first use)
+    '''
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis(connection_pool=_build_pool())
+    return _client
+
+
+def pool_stats() -> dict:
+    return get_redis().connection_pool.stats()
+
+
+def unlink_matching(redis_client, pattern: str) -> int:
+    '''
+    Delete every key matching `pattern` (SCAN + batched UNLINK). Returns
+    the number of keys removed.
+    '''
+    removed = 0
+    batch = []
+    for key in redis_client.scan_iter(pattern, count=500):
+        batch.append(key)
+        if len(batch) == 500:
+            removed += redis_client.unlink(*batch)
+            batch = []
+    if batch:
+        removed += redis_client.unlink(*batch)
+    return removed
+
+
+def reset() -> None:
+    '''
+    Drop this process's client so the next get_redis() builds a fresh pool
+    (after a fork, or when the Redis settings changed)
+    '''
+    global _client, _lock
+    _client = None
+    _lock = threading.Lock()
+
+
+# The parent's sockets must not be shared with a forked child
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset)
@@ -1,3 +1,4 @@
+import math
 import typing
 import redis 
 from datetime import datetime
@@ -7,56 +8,74 @@ import logging
 import time
 
 import os 
+import base64
+import secrets
 from flask import current_app
+from redis.commands.core import Script
+from app.services import token_scripts
+from app.services.lifecycle_events import token_hash
+from app.services.redis_pool import get_redis
+
+
+class DownloadClaim(typing.NamedTuple):
+    """Result of the OPEN script for one download request."""
+    state: str                      # gone, peek, protected, locked, busy, claimed, resumed
+    metadata: dict
+    secret: typing.Optional[str] = None
+    retry_after: int = 0
+    blob: typing.Optional[bytes] = None
 
 
 class RedisService:
 
     exception = redis.exceptions
     logger = logging.getLogger(__name__)
+
+    # Key layout: everything this app owns lives under "ots:"
+    #   ots:file:<token>   file metadata hash (TTL = file expiry / lease)
+    #   ots:blob:<token>   inline ciphertext
+    #   ots:ctr:<name>     analytics counter
+    #   ots:upload:<id>    resumable upload session (+ ":chunks" set)
+    #   ots:files          registry: live tokens scored by expiry (epoch s)
+    #   ots:files:by_upload  the same tokens scored by upload time (admin listing)
+    REGISTRY_KEY = "ots:files"
+    UPLOADED_KEY = "ots:files:by_upload"
+    # Metadata shown on the admin file list (fetched with HMGET, never HGETALL)
+    LISTING_FIELDS = ("content_type", "is_protected", "upload_time", "size", "storage")
     
-    # Class-level cache for connection status
-    _connection_checked = False
-    _connection_available = False
-    _last_check_time = 0
-    _check_interval = 30  # Re-check every 30 seconds
-    
-    def __init__(self, host: str, port: int, db: int = 0) -> None:
-        self.redis_client = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+    def __init__(self, redis_client: typing.Optional[redis.Redis] = None) -> None:
+        # None: use this process's shared pool (see redis_pool), resolved per
+        # call so a service built before a fork picks up the child's pool
+        self._redis_client = redis_client
+        # Token lifecycle scripts, called with EVALSHA (see token_scripts)
+        self._create_script = Script(None, token_scripts.CREATE.encode())
+        self._open_script = Script(None, token_scripts.OPEN.encode())
+        self._attempt_script = Script(None, token_scripts.ATTEMPT.encode())
+        self._consume_script = Script(None, token_scripts.CONSUME.encode())
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        return self._redis_client or get_redis()
+
+    def load_scripts(self) -> None:
+        '''
+        SCRIPT LOAD the lifecycle scripts so the first request already hits
+        EVALSHA (redis-py reloads them itself after a SCRIPT FLUSH)
+        '''
+        for script in (self._create_script, self._open_script, self._attempt_script, self._consume_script):
+            script.sha = self.redis_client.script_load(script.script)
 
     def ping(self) -> bool:
-        """Public method to check Redis connection."""
-        return self.__check_connection()
+        """Public method to check Redis connection (health endpoint only).
 
-    def __check_connection(self):
-        """Check Redis connection with caching to prevent log spam."""
-        current_time = time.time()
-        
-        # Return cached result if checked recently
-        if RedisService._connection_checked and (current_time - RedisService._last_check_time) < RedisService._check_interval:
-            return RedisService._connection_available
-        
+        Other calls do not PING first: the pool health-checks idle
+        connections itself (REDIS_HEALTH_CHECK_INTERVAL) and an unreachable
+        server surfaces as ConnectionError.
+        """
         try:
-            self.redis_client.ping()
-            RedisService._connection_available = True
-            RedisService._connection_checked = True
-            RedisService._last_check_time = current_time
-            return True
-
-        except self.exception.ConnectionError as e:
-            if not RedisService._connection_checked:
-                self.logger.error(f"Redis connection error: {e}")
-            RedisService._connection_available = False
-            RedisService._connection_checked = True
-            RedisService._last_check_time = current_time
-            return False
-            
-        except Exception as e:
-            if not RedisService._connection_checked:
-                self.logger.error(f"Redis connection error: {e}")
-            RedisService._connection_available = False
-            RedisService._connection_checked = True
-            RedisService._last_check_time = current_time
+            return bool(self.redis_client.ping())
+        except redis.exceptions.RedisError as e:
+            self.logger.error(f"Redis connection error: {e}")
             return False
 
 
@@ -64,47 +83,207 @@ class RedisService:
         # Store metadata for a file
         # Input: token (str), metadata (dict)
         # Returns: True if successful, False otherwise
-        if self.__check_connection() :
-            if not metadata is None :
-                self.redis_client.hset(token, mapping={
-                    "token": metadata['token'],
-                    "filename": metadata['filename'],
-                    "real_filename":metadata['real_filename'],
-                    "content_type": metadata['content_type'],
-                    "upload_time": datetime.utcnow().isoformat(),
-                    "password_hash": metadata['password_hash'],
-                    "is_protected": metadata['is_protected'],
-                    "attempt_to_unlock": metadata.get('attempt_to_unlock', '0'),  # ← ADD THIS!
-                    "TIME_TO_LIVE": str(Config.REDIS_TTL) + " seconds",
-                    "is_encrypted": metadata.get("is_encrypted", "True"),
-                    "encryption_nonce": metadata.get("encryption_nonce", ""),
-                    "encryption_key": metadata.get("encryption_key", ""),
-                    "encryption_salt": metadata.get("encryption_salt", ""),
-                }) 
-                self.redis_client.expire(token,str(Config.REDIS_TTL))
-            
-            return True
-        else:
-            self.logger.error("Redis connection error")
-            return False
+        if not metadata is None :
+            pipeline = self.redis_client.pipeline()
+            pipeline.hset(self.file_key(token), mapping=self._metadata_mapping(metadata)) 
+            pipeline.expire(self.file_key(token), Config.REDIS_TTL)
+            pipeline.zadd(self.REGISTRY_KEY, {token: int(time.time()) + Config.REDIS_TTL})
+            pipeline.zadd(self.UPLOADED_KEY, {token: round(time.time(), 3)})
+            pipeline.execute()
+        return True
+
+    @staticmethod
+    def _metadata_mapping(metadata: dict) -> dict:
+        return {
+            "token": metadata['token'],
+            "filename": metadata['filename'],
+            "real_filename":metadata['real_filename'],
+            "content_type": metadata['content_type'],
+            "upload_time": datetime.utcnow().isoformat(),
+            "password_hash": metadata['password_hash'],
+            "is_protected": metadata['is_protected'],
+            "attempt_to_unlock": metadata.get('attempt_to_unlock', '0'),  # ← ADD THIS!
+            "TIME_TO_LIVE": str(Config.REDIS_TTL) + " seconds",
+            "is_encrypted": metadata.get("is_encrypted", "True"),
+            "encryption_nonce": metadata.get("encryption_nonce", ""),
+            "encryption_key": metadata.get("encryption_key", ""),
+            "encryption_salt": metadata.get("encryption_salt", ""),
+            "wrapped_key": metadata.get("wrapped_key", ""),
+            "storage": metadata.get("storage", "disk"),
+            "size": metadata.get("size", ""),
+        }
+
+    def create_file(self, token: str, metadata: dict, blob: typing.Optional[bytes] = None) -> dict:
+        '''
+        Store a new file's metadata (and inline ciphertext) with REDIS_TTL
+        and register the token, in one round trip. Returns the stored metadata.
+        '''
+        mapping = self._metadata_mapping(metadata)
+        fields = [item for pair in mapping.items() for item in pair]
+        reply = self._create_script(
+            keys=[self.file_key(token), self.blob_key(token), self.REGISTRY_KEY, self.UPLOADED_KEY],
+            args=[Config.REDIS_TTL, base64.b64encode(blob).decode() if blob is not None else "",
+                  round(time.time(), 3), token] + fields,
+            client=self.redis_client,
+        )
+        return dict(zip(reply[::2], reply[1::2]))
  
 
+    @staticmethod
+    def file_key(token: str) -> str:
+        """Hash holding a file's metadata."""
+        return f"ots:file:{token}"
+
+    @staticmethod
+    def blob_key(token: str) -> str:
+        """Key holding the ciphertext of an inline-stored file."""
+        return f"ots:blob:{token}"
+
+    @staticmethod
+    def counter_key(name: str) -> str:
+        return f"ots:ctr:{name}"
+
+    def store_inline_blob(self, token: str, blob: bytes) -> bool:
+        '''
+        Store the ciphertext of a small file in Redis (base64, same TTL as metadata)
+        '''
+        self.redis_client.set(self.blob_key(token), base64.b64encode(blob).decode(), ex=Config.REDIS_TTL)
+        return True
+
+    def get_inline_blob(self, token: str) -> typing.Optional[bytes]:
+        '''
+        Fetch the ciphertext of an inline-stored file, or None if it expired
+        '''
+        value = self.redis_client.get(self.blob_key(token))
+        return base64.b64decode(value) if value else None
+
+    @staticmethod
+    def upload_session_key(session_id: str) -> str:
+        return f"ots:upload:{session_id}"
+
+    def create_upload_session(self, session_id: str, session: dict) -> bool:
+        '''
+        Store resumable upload session state with UPLOAD_SESSION_TTL
+        '''
+        key = self.upload_session_key(session_id)
+        pipeline = self.redis_client.pipeline()
+        pipeline.hset(key, mapping=session)
+        pipeline.expire(key, Config.UPLOAD_SESSION_TTL)
+        pipeline.execute()
+        return True
+
+    def get_upload_session(self, session_id: str) -> dict:
+        return self.redis_client.hgetall(self.upload_session_key(session_id))
+
+    def mark_chunk_received(self, session_id: str, index: int) -> None:
+        '''
+        Record a stored chunk and push the session expiry forward
+        '''
+        key = self.upload_session_key(session_id)
+        pipeline = self.redis_client.pipeline()
+        pipeline.sadd(f"{key}:chunks", index)
+        pipeline.expire(f"{key}:chunks", Config.UPLOAD_SESSION_TTL)
+        pipeline.expire(key, Config.UPLOAD_SESSION_TTL)
+        pipeline.execute()
+
+    def begin_chunk(self, session_id: str, index: int) -> bool:
+        '''
+        Record an attempt at chunk `index`; True if it is the first one
+        '''
+        key = f"{self.upload_session_key(session_id)}:started"
+        pipeline = self.redis_client.pipeline()
+        pipeline.sadd(key, index)
+        pipeline.expire(key, Config.UPLOAD_SESSION_TTL)
+        return pipeline.execute()[0] == 1
+
+    def chunk_lock(self, session_id: str, index: int):
+        '''
+        Lock held while one request writes chunk `index`
+        '''
+        return self.redis_client.lock(
+            f"{self.upload_session_key(session_id)}:lock:{index}", timeout=Config.UPLOAD_CHUNK_LOCK_SECONDS)
+
+    def get_received_chunks(self, session_id: str) -> list:
+        members = self.redis_client.smembers(f"{self.upload_session_key(session_id)}:chunks")
+        return sorted(int(m) for m in members)
+
+    def claim_upload_session(self, session_id: str) -> bool:
+        '''
+        Atomically end a session; only one concurrent finalize gets True
+        '''
+        key = self.upload_session_key(session_id)
+        pipeline = self.redis_client.pipeline()
+        pipeline.delete(key)
+        pipeline.delete(f"{key}:chunks", f"{key}:started")
+        return pipeline.execute()[0] > 0
+
     def get_file_metadata(self, token: str) -> typing.Optional[dict]:
         # Get metadata for a file
         # Input: token (str)
         # Returns: metadata dict or None if not found
         if not token is None :
-            return self.redis_client.hgetall(token)
+            return self.redis_client.hgetall(self.file_key(token))
         else:
             self.logger.error("Token is None")
             return None
 
+    def open_download(self, token: str, mode: str, secret: typing.Optional[str] = None) -> DownloadClaim:
+        '''
+        Look up a file and, unless `mode` is "peek", claim or resume its
+        download lease bound to a resume secret ("open" claims unprotected
+        files only, "unlock" is for a checked password). The inline blob
+        comes back in the same round trip.
+        '''
+        reply = self._open_script(
+            keys=[self.file_key(token), self.blob_key(token), self.REGISTRY_KEY],
+            args=[mode, secret or "", secrets.token_urlsafe(24), Config.DOWNLOAD_LEASE_SECONDS,
+                  int(time.time()), Config.REDIS_TTL, Config.MAX_RETRIES],
+            client=self.redis_client,
+        )
+        if reply[0] == "gone":
+            return DownloadClaim("gone", {})
+        state, lease_secret, retry_after, blob, fields = reply
+        return DownloadClaim(
+            state,
+            dict(zip(fields[::2], fields[1::2])),
+            lease_secret or None,
+            int(retry_after),
+            base64.b64decode(blob) if blob else None,
+        )
+
+    def record_failed_attempt(self, token: str) -> typing.Tuple[int, bool]:
+        '''
+        Count a wrong password. Returns (attempts, locked); attempts is -1
+        if the file is gone.
+        '''
+        attempts, locked = self._attempt_script(
+            keys=[self.file_key(token)], args=[Config.MAX_RETRIES], client=self.redis_client)
+        return int(attempts), bool(locked)
+
+    def consume_download(self, token: str, start: int, stop: int,
+                         size: typing.Optional[int], complete: bool) -> int:
+        '''
+        Record delivered plaintext bytes [start, stop) and renew the lease;
+        deletes the token once the whole file has been delivered (for files
+        of unknown size: once `complete`). Returns 1 if deleted now, 0 if
+        not complete yet, -1 if the token was already gone.
+        '''
+        return int(self._consume_script(
+            keys=[self.file_key(token), self.blob_key(token), self.REGISTRY_KEY, self.UPLOADED_KEY],
+            args=[start, stop, "" if size is None else size, "1" if complete else "0",
+                  Config.DOWNLOAD_LEASE_SECONDS, int(time.time())],
+            client=self.redis_client,
+        ))
+
     def delete_file(self, token: str) -> bool:
         # Delete a file
         # Input: token (str)
         # Returns: True if successful, False otherwise
         if not token is None :
-                self.redis_client.delete(token)
+                pipeline = self.redis_client.pipeline()
+                pipeline.delete(self.file_key(token))
+                self._unregister(pipeline, token)
+                pipeline.execute()
                 return True
         else:
             self.logger.error("Token is None")
@@ -115,35 +294,133 @@ class RedisService:
         # Check if a file exists
         # Input: token (str)
         # Returns: True if file exists, False otherwise
-        if self.__check_connection() :
-            if not token is None :
-                return self.redis_client.exists(token) > 0
-            else:
-                self.logger.error("Token is None")
-                return False
-
+        if not token is None :
+            return self.redis_client.exists(self.file_key(token)) > 0
         else:
-            self.logger.error("Redis connection error")
+            self.logger.error("Token is None")
             return False
 
-    def list_files(self):
+    def list_files_page(self, cursor: typing.Optional[str] = None, limit: int = 50,
+                        newest_first: bool = True) -> typing.Tuple[list, typing.Optional[str]]:
         '''
-        List all files in the upload folder and redis keys
+        One page of live files in upload order: a range query on the upload
+        index plus one pipelined HMGET of LISTING_FIELDS per batch.
+        `cursor` is the opaque value returned with the previous page
+        ("<upload score>:<token hash>" - tokens are download secrets and
+        never go into links); raises ValueError for a malformed one.
+        Returns (entries, next cursor or None).
         '''
-        try:
-            files = self.redis_client.keys('*')
+        after = None
+        bound = "+inf" if newest_first else "-inf"
+        if cursor:
+            score, _, after = cursor.partition(":")
+            bound = float(score)
+            if not after or not math.isfinite(bound):
+                raise ValueError("malformed cursor")
+        # Members sharing the cursor's score are held back until the
+        # cursor's own token is met; the previous page showed them all
+        skipping, held = after is not None, []
+
+        entries, stale, offset = [], [], 0
+        while len(entries) <= limit:
+            want = limit + 1 - len(entries)
+            if newest_first:
+                batch = self.redis_client.zrevrangebyscore(
+                    self.UPLOADED_KEY, bound, "-inf", start=offset, num=want, withscores=True)
+            else:
+                batch = self.redis_client.zrangebyscore(
+                    self.UPLOADED_KEY, bound, "+inf", start=offset, num=want, withscores=True)
+            offset += len(batch)
+            exhausted = len(batch) < want
+            if skipping:
+                kept = []
+                for token, score in batch:
+                    if skipping and score == bound:
+                        held.append((token, score))
+                        if token_hash(token) == after:
+                            held, skipping = [], False
+                        continue
+                    if skipping:
+                        # Past the ties without meeting the cursor's token (it
+                        # expired): better to show them again than to drop them
+                        kept, held, skipping = kept + held, [], False
+                    kept.append((token, score))
+                if skipping and exhausted:
+                    kept, held = kept + held, []
+                batch = kept
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for token, _ in batch:
+                pipeline.hmget(self.file_key(token), *self.LISTING_FIELDS)
+            for (token, score), values in zip(batch, pipeline.execute()):
+                if all(value is None for value in values):
+                    stale.append(token)  # expired; the hash is gone
+                    continue
+                entries.append({"token": token, "uploaded": score, **dict(zip(self.LISTING_FIELDS, values))})
+            if exhausted:
+                break
+
+        if stale:
+            self.redis_client.zrem(self.UPLOADED_KEY, *stale)
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = f"{entries[-1]['uploaded']!r}:{token_hash(entries[-1]['token'])}"
+        return entries, next_cursor
+
+    def live_count(self) -> int:
+        '''
+        Number of tokens that have not expired (ZCOUNT, O(log n))
+        '''
+        return self.redis_client.zcount(self.REGISTRY_KEY, int(time.time()), "+inf")
 
-            resposnse = {
-                "redis_keys": files,
-                "files": os.listdir(Config.UPLOAD_FOLDER)
-            }
-        
-            return resposnse
-            return resposnse
-        except Exception as e:
-            self.logger.error(f"Redis connection error: {e}")
-            return str(e)
+    def _unregister(self, pipeline, token: str) -> None:
+        # Drop a token from both indexes (registry and upload order)
+        pipeline.zrem(self.REGISTRY_KEY, token)
+        pipeline.zrem(self.UPLOADED_KEY, token)
 
+    def live_tokens(self) -> list:
+        '''
+        Tokens that have not expired, soonest expiry first (a registry range
+        query; never KEYS)
+        '''
+        return self.redis_client.zrangebyscore(self.REGISTRY_KEY, int(time.time()), "+inf")
+
+    def sweep_expired(self, batch: int = 500, between_batches: typing.Optional[typing.Callable] = None) -> int:
+        '''
+        Drop registry entries whose expiry has passed and delete their files
+        from disk. Entries whose hash is still there (the score lagged a TTL
+        change) are re-scored instead. Returns the number of files removed.
+        `between_batches` is called after each batch (rate limiting).
+        '''
+        removed = 0
+        while True:
+            now = int(time.time())
+            tokens = self.redis_client.zrangebyscore(self.REGISTRY_KEY, "-inf", now, start=0, num=batch)
+            if not tokens:
+                return removed
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for token in tokens:
+                pipeline.ttl(self.file_key(token))
+            ttls = pipeline.execute()
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for token, ttl in zip(tokens, ttls):
+                if ttl > 0:
+                    pipeline.zadd(self.REGISTRY_KEY, {token: now + ttl})
+                    continue
+                self._unregister(pipeline, token)
+                file_path = os.path.join(Config.UPLOAD_FOLDER, token)
+                try:
+                    os.remove(file_path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass  # inline file, or already downloaded
+            pipeline.execute()
+            if len(tokens) < batch:
+                return removed
+            if between_batches:
+                between_batches()
 
     def increment_file_attempt(self, token: str) -> int:
         '''
@@ -151,9 +428,7 @@ class RedisService:
         Returns the new value.
         '''
         try:
-            if self.__check_connection():
-                return self.redis_client.hincrby(token, "attempt_to_unlock", 1)
-            return 9999 # Fail closed if redis down
+            return self.redis_client.hincrby(self.file_key(token), "attempt_to_unlock", 1)
         except Exception as e:
             self.logger.error(f"Redis error incrementing attempt: {e}")
             return 9999
@@ -177,43 +452,36 @@ class RedisService:
         Delete metadata from redis
         '''
         try :
-            if self.__check_connection() :
-                if self.redis_client.delete(token) > 0 :
-                    return True
-                else:
-                    return False
-            else:
-                # self.logger.error("Redis connection error")
-                return False
+            pipeline = self.redis_client.pipeline()
+            pipeline.delete(self.file_key(token), self.blob_key(token))
+            self._unregister(pipeline, token)
+            return pipeline.execute()[0] > 0
         except Exception as e:
             self.logger.error(f"Redis connection error: {e}")
             return False
             
 
     def atomic_delete(self, token):
+        pipeline = self.redis_client.pipeline()
         try :
-            if self.__check_connection() :
-                pipeline = self.redis_client.pipeline()
-                pipeline.watch(token)
-            #    pipeline.multi()
-                metadata = self.redis_client.hgetall(token)
-                try:
-                    if metadata:
-                        pipeline.multi()
-                        pipeline.delete(token)
-                        pipeline.execute()
-                        return metadata
-                    else:
-                        pipeline.unwatch()
-                        return None
-                except redis.exceptions.WatchError:
-                    self.logger.error(f"Redis error: WatchError")
-                    return None
-                except Exception as e:
-                    self.logger.error(f"Redis connection error: {e}")
+            pipeline.watch(self.file_key(token))
+        #    pipeline.multi()
+            metadata = pipeline.hgetall(self.file_key(token))
+            try:
+                if metadata:
+                    pipeline.multi()
+                    pipeline.delete(self.file_key(token), self.blob_key(token))
+                    self._unregister(pipeline, token)
+                    pipeline.execute()
+                    return metadata
+                else:
+                    pipeline.unwatch()
                     return None
-            else:
-                # self.logger.error("Redis connection error")
+            except redis.exceptions.WatchError:
+                self.logger.error(f"Redis error: WatchError")
+                return None
+            except Exception as e:
+                self.logger.error(f"Redis connection error: {e}")
                 return None
         except Exception as e:
             self.logger.error(f"Redis connection error: {e}")
@@ -259,17 +527,14 @@ class RedisService:
             status["error"] = f"Error deleting file: {e}"
 
 
-    def cleanup_orphan_files(self):
+    def cleanup_orphan_files(self, batch_size: int = 500, between_batches: typing.Optional[typing.Callable] = None):
         """
-        Delete files from disk that have no metadata in Redis.
+        Delete files from disk that have no live entry in the token registry.
         This happens when TTL expires but file wasn't downloaded.
+        `between_batches` is called after each batch (rate limiting).
         """
         try:
-            deleted_count = 0
-            
-            # Get all Redis keys (tokens)
-            redis_keys = set(self.redis_client.keys('*'))
-            
+            deleted_count = self.sweep_expired(batch_size, between_batches)
             total_files_checked = 0
             
             # Check if upload directory exists
@@ -277,31 +542,49 @@ class RedisService:
                 self.logger.warning(f"Upload folder {current_app.config['UPLOAD_FOLDER']} does not exist. Skipping orphan cleanup.")
                 return {
                     "success": True,
-                    "deleted_count": 0,
+                    "deleted_count": deleted_count,
                     "total_files_checked": 0
                 }
 
-            # Find orphaned files
+            def remove_orphans(entries):
+                # One ZMSCORE per batch instead of a KEYS snapshot of the keyspace
+                removed = 0
+                now = time.time()
+                scores = self.redis_client.zmscore(self.REGISTRY_KEY, [entry.name for entry in entries])
+                for entry, score in zip(entries, scores):
+                    if score is not None and score >= now:
+                        continue
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                        self.logger.info(f"✅ Deleted orphan file: {entry.name}")
+                    except Exception as e:
+                        self.logger.error(f"Failed to delete orphan {entry.name}: {e}")
+                return removed
+
+            # Find orphaned files (the file name is the token)
+            batch = []
             with os.scandir(current_app.config['UPLOAD_FOLDER']) as it:
                 for entry in it:
                     if not entry.is_file():
                         continue
                         
                     total_files_checked += 1
-                    filename = entry.name
-                    
-                    # Extract token from filename (e.g., "abc123.pdf" → "abc123")
-                    token = os.path.splitext(filename)[0]
-                    
-                    # If token NOT in Redis → orphaned file!
-                    if token not in redis_keys:
-                        file_path = entry.path
-                        try:
-                            os.remove(file_path)
-                            deleted_count += 1
-                            self.logger.info(f"✅ Deleted orphan file: {filename}")
-                        except Exception as e:
-                            self.logger.error(f"Failed to delete orphan {filename}: {e}")
+
+                    # Uploads still streaming in, or committed to disk a moment
+                    # before CREATE registers them: only reclaim old files
+                    age = time.time() - entry.stat().st_mtime
+                    if age < (Config.UPLOAD_SESSION_TTL if entry.name.endswith('.part') else Config.ORPHAN_GRACE_SECONDS):
+                        continue
+
+                    batch.append(entry)
+                    if len(batch) == batch_size:
+                        deleted_count += remove_orphans(batch)
+                        batch = []
+                        if between_batches:
+                            between_batches()
+            if batch:
+                deleted_count += remove_orphans(batch)
             
             self.logger.info(f"Cleanup complete: {deleted_count} orphan files deleted")
             return {
@@ -309,11 +592,9 @@ class RedisService:
                 "deleted_count": deleted_count,
                 "total_files_checked": total_files_checked
             }
-            
-
-
-
 
+        except redis.exceptions.LockError:
+            raise  # `between_batches` found the maintenance lock lost: stop here
         except Exception as e:
             self.logger.error(f"Error in orphan cleanup: {e}")
             return {
@@ -323,67 +604,70 @@ class RedisService:
 
 
         
-    def cleanup_orphan_metadata(self):
+    def cleanup_orphan_metadata(self, batch_size: int = 500, between_batches: typing.Optional[typing.Callable] = None,
+                                cursor: int = 0, max_batches: typing.Optional[int] = None):
         """
-        Delete Redis keys that have no corresponding file on disk.
+        Delete file metadata that has no corresponding file on disk (or no
+        inline blob), walking the token registry with ZSCAN.
         This happens when files are deleted but Redis data persists (e.g., Docker restart).
+        With `max_batches` the walk stops early; pass the returned `cursor`
+        back to continue (0 means the walk completed).
         """
         try:
             deleted_count = 0
-            
-            # Get all Redis keys
-            redis_keys = self.redis_client.keys('*')
-            
-            # REMOVED: listdir call to prevent OOM
-            # We will check os.path.exists for each key instead
-            
-            # Check each Redis key
-            for key in redis_keys:
-                # Check if key is a hash before calling hgetall()
-                key_type = self.redis_client.type(key)
-                
-                if key_type != 'hash':
-                    # Skip non-hash keys (not file metadata)
-                    continue
-                
-                # Get metadata to find filename
-                try:
-                    metadata = self.redis_client.hgetall(key)
-                except Exception as e:
-                    self.logger.warning(f"Could not get metadata for {key}: {e}")
-                    continue
-                
-                if not metadata:
-                    # Empty key, delete it
-                    self.redis_client.delete(key)
-                    deleted_count += 1
-                    self.logger.info(f"Deleted empty key: {key}")
-                    continue
-                
-                filename = metadata.get('filename')
-                
-                if not filename:
-                    # No filename in metadata, delete it
-                    self.redis_client.delete(key)
-                    deleted_count += 1
-                    self.logger.info(f"Deleted key with no filename: {key}")
-                    continue
-                
-                # Check if file exists on disk
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                if not os.path.exists(file_path):
-                    # File doesn't exist → orphaned metadata!
-                    self.redis_client.delete(key)
-                    deleted_count += 1
-                    self.logger.info(f"✅ Deleted orphaned metadata: {key} (file: {filename})")
+            total_keys_checked = 0
+
+            def reconcile(tokens):
+                removed = 0
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for token in tokens:
+                    pipeline.hmget(self.file_key(token), 'filename', 'storage')
+                    pipeline.exists(self.blob_key(token))
+                replies = pipeline.execute()
+
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for token, (filename, storage), has_blob in zip(tokens, replies[::2], replies[1::2]):
+                    if filename is None and storage is None:
+                        # Hash already expired: just drop the registry entry
+                        self._unregister(pipeline, token)
+                        continue
+                    if storage == 'inline':
+                        # Inline files live in Redis; there is nothing on disk to check
+                        orphaned = not has_blob
+                    else:
+                        orphaned = not filename or not os.path.exists(
+                            os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+                    if orphaned:
+                        pipeline.delete(self.file_key(token), self.blob_key(token))
+                        self._unregister(pipeline, token)
+                        removed += 1
+                        self.logger.info(f"✅ Deleted orphaned metadata: {token}")
+                pipeline.execute()
+                return removed
+
+            batches = 0
+            while True:
+                cursor, entries = self.redis_client.zscan(self.REGISTRY_KEY, cursor, count=batch_size)
+                tokens = [token for token, _ in entries]
+                total_keys_checked += len(tokens)
+                if tokens:
+                    deleted_count += reconcile(tokens)
+                batches += 1
+                if cursor == 0 or max_batches is not None and batches >= max_batches:
+                    break
+                if between_batches:
+                    between_batches()
             
             self.logger.info(f"Metadata cleanup complete: {deleted_count} orphaned keys deleted")
             return {
                 "success": True,
                 "deleted_count": deleted_count,
-                "total_keys_checked": len(redis_keys)
+                "total_keys_checked": total_keys_checked,
+                "cursor": cursor
             }
             
+        except redis.exceptions.LockError:
+            raise  # `between_batches` found the maintenance lock lost: stop here
         except Exception as e:
             self.logger.error(f"Error in metadata cleanup: {e}")
             return {
@@ -397,9 +681,7 @@ class RedisService:
     def increment_counter(self, key: str, count: int) -> bool:
         """Increment counter by 1"""
         try :
-            if not self.__check_connection():
-                return False
-            self.redis_client.incrby(key,count)
+            self.redis_client.incrby(self.counter_key(key),count)
             return True
         except Exception as e:
             self.logger.error(f"Error incrementing counter: {e}")   
@@ -407,9 +689,7 @@ class RedisService:
     def decrement_counter(self, key: str, count: int) -> bool:
         """Decrement counter by 1"""
         try :
-            if not self.__check_connection():
-                return False
-            self.redis_client.decrby(key,count)
+            self.redis_client.decrby(self.counter_key(key),count)
             return True
         except Exception as e:
             self.logger.error(f"Error decrementing counter: {e}")   
@@ -418,9 +698,7 @@ class RedisService:
     def set_counter(self, counter_name, value):
         """Set counter to specific value"""
         try :
-            if not self.__check_connection():
-                return False
-            self.redis_client.set(counter_name, value)
+            self.redis_client.set(self.counter_key(counter_name), value)
             return True
         except Exception as e:
             self.logger.error(f"Error setting counter: {e}")   
@@ -428,9 +706,7 @@ class RedisService:
 
     def get_counter(self, counter_name):
         try:
-            if not self.__check_connection():
-                return 0
-            value = self.redis_client.get(counter_name)
+            value = self.redis_client.get(self.counter_key(counter_name))
             return int(value) if value else 0
         except:
             return 0
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+stats_stream.py - Live stats for /stats/stream (Server-Sent Events)
+
+Every counter flush PUBLISHes its deltas on `ots:stats:events` in the same
+pipeline as the INCRBYs (see stats.add_buckets). In each process one hub
+thread holds the only subscription and fans the messages out to the
+process's open streams, so the Redis cost does not grow with the number of
+dashboards watching: one pub/sub connection per process while at least
+one stream is open, none otherwise.
+
+A stream starts with a full snapshot (the cached /stats-json data), then
+sends deltas as they are published and a fresh snapshot every
+STATS_STREAM_SNAPSHOT_SECONDS (unique visitors are not additive). A client
+that falls too far behind is resynced with a snapshot rather than fed a
+backlog. Each stream holds a worker thread, so a process serves at most
+STATS_STREAM_MAX_CLIENTS and closes each after STATS_STREAM_MAX_SECONDS;
+EventSource reconnects on its own.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+import redis
+
+from config import Config
+from app.services.redis_pool import get_redis
+from app.services.stats import EVENTS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+RESYNC = None  # queued instead of deltas for a subscriber that fell behind
+QUEUE_SIZE = 100
+
+
+class StreamsFull(Exception):
+    pass
+
+
+class StatsHub:
+
+    def __init__(self, redis_client: redis.Redis = None) -> None:
+        self._redis_client = redis_client
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._published = 0
+        self._resyncs = 0
+
+    @property
+    def redis_client(self) -> redis.Redis:
+        return self._redis_client or get_redis()
+
+    def subscribe(self) -> queue.Queue:
+        '''
+        Register a stream and make sure this process is subscribed. Raises
+        StreamsFull past STATS_STREAM_MAX_CLIENTS.
+        '''
+        with self._lock:
+            if len(self._subscribers) >= Config.STATS_STREAM_MAX_CLIENTS:
+                raise StreamsFull()
+            subscriber = queue.Queue(maxsize=QUEUE_SIZE)
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stats-hub", daemon=True)
+                self._thread.start()
+            return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, message) -> None:
+        '''
+        Hand one message to every stream of this process (never blocks)
+        '''
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                self._resyncs += 1
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(RESYNC)
+        self._published += 1
+
+    def _run(self) -> None:
+        pubsub = None
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+                try:
+                    if pubsub is None:
+                        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                        pubsub.subscribe(EVENTS_CHANNEL)
+                    message = pubsub.get_message(timeout=1.0)
+                except redis.exceptions.RedisError as e:
+                    logger.warning(f"Stats hub: {e}")
+                    if pubsub is not None:
+                        pubsub.close()
+                        pubsub = None
+                    self.publish(RESYNC)  # deltas may have been missed
+                    time.sleep(5)
+                    continue
+                if message and message["type"] == "message":
+                    self.publish(json.loads(message["data"]))
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": Config.STATS_STREAM_MAX_CLIENTS,
+            "subscribed": self._thread is not None and self._thread.is_alive(),
+            "published": self._published,
+            "resyncs": self._resyncs,
+        }
+
+    def _after_fork(self) -> None:
+        # Streams and the hub thread belong to the parent
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+
+
+hub = StatsHub()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=hub._after_fork)
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
@@ -0,0 +1,183 @@
+"""
+token_scripts.py - Server-side Lua for the token lifecycle
+
+Each state transition of a shared file is one script, so a route makes a
+single Redis round trip for it instead of HGETALL/WATCH/MULTI/EXEC plus
+separate expiry calls. RedisService calls them with EVALSHA (loaded by
+`flask ots-maintenance`, or on first use). Analytics counters are not
+written here; routes buffer them (see counter_buffer).
+
+    create  ->  open / unlock (lease claimed)  ->  consume (deleted)
+                  `-> attempt (wrong password, may lock)
+
+A download lease is the key's TTL: claiming cuts it to the lease length
+(capped at the file's original expiry, `expires_at`) and every delivery
+renews it, so an abandoned transfer simply expires.
+
+Every script keeps the token registry (`ots:files`, a sorted set scored by
+expiry) in step with the key's TTL, and create/consume maintain the
+upload-order index used by the admin listing, so listing and sweeping live
+tokens never has to walk the keyspace.
+"""
+
+# Shared by the scripts that claim or renew a lease.
+# KEYS[1] = file key, KEYS[2] = inline blob key, KEYS[3] = token registry
+_RENEW_LEASE = """
+local function renew_lease(token, deadline, lease, now)
+    local expire_in = math.floor(math.min(lease, deadline - now))
+    if expire_in < 1 then expire_in = 1 end
+    redis.call('EXPIRE', KEYS[1], expire_in)
+    redis.call('EXPIRE', KEYS[2], expire_in)
+    redis.call('ZADD', KEYS[3], now + expire_in, token)
+end
+"""
+
+# KEYS: file key, inline blob key, token registry, upload-order index
+# ARGV: ttl, base64 blob ('' when stored on disk), now, token, field, value, ...
+# Returns the stored metadata (flat HGETALL reply).
+CREATE = """
+redis.call('HSET', KEYS[1], unpack(ARGV, 5))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[1])
+end
+redis.call('ZADD', KEYS[3], tonumber(ARGV[3]) + tonumber(ARGV[1]), ARGV[4])
+redis.call('ZADD', KEYS[4], ARGV[3], ARGV[4])
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# KEYS: file key, inline blob key, token registry
+# ARGV: mode, presented resume secret, fresh secret, lease seconds, now,
+#       default ttl, max attempts
+#
+# mode 'peek'   - metadata (+ blob) only, nothing changes (HEAD, CLI)
+# mode 'open'   - /d/<token>: claim unprotected files, report protected ones
+# mode 'unlock' - password checked: reset attempts and claim
+#
+# Returns {state, secret, retry_after, blob, metadata}; state is one of
+# gone, peek, protected, locked, busy, claimed, resumed.
+OPEN = _RENEW_LEASE + """
+local fields = redis.call('HGETALL', KEYS[1])
+if #fields == 0 then
+    return {'gone'}
+end
+local meta = {}
+for i = 1, #fields, 2 do
+    meta[fields[i]] = fields[i + 1]
+end
+local blob = false
+if meta['storage'] == 'inline' then
+    blob = redis.call('GET', KEYS[2])
+end
+local function reply(state, secret, retry_after)
+    return {state, secret or '', retry_after or 0, blob, fields}
+end
+
+local mode = ARGV[1]
+if mode == 'peek' then
+    return reply('peek', nil, redis.call('TTL', KEYS[1]))
+end
+local locked = tonumber(meta['attempt_to_unlock'] or '0') >= tonumber(ARGV[7])
+if mode == 'open' and meta['is_protected'] ~= 'False' then
+    if locked then
+        return reply('locked')
+    end
+    return reply('protected')
+end
+if mode == 'unlock' and locked then
+    return reply('locked')
+end
+
+local ttl = redis.call('TTL', KEYS[1])
+local secret = meta['lease_secret']
+local state = 'claimed'
+if secret then
+    -- compare digests rather than the secrets themselves
+    if redis.sha1hex(secret) ~= redis.sha1hex(ARGV[2]) then
+        return reply('busy', nil, ttl)
+    end
+    state = 'resumed'
+else
+    secret = ARGV[3]
+end
+
+local lease, now = tonumber(ARGV[4]), tonumber(ARGV[5])
+local deadline = tonumber(meta['expires_at'])
+if not deadline then
+    if ttl > 0 then deadline = now + ttl else deadline = now + tonumber(ARGV[6]) end
+end
+redis.call('HSET', KEYS[1], 'lease_secret', secret, 'expires_at', deadline)
+if mode == 'unlock' then
+    redis.call('HSET', KEYS[1], 'attempt_to_unlock', '0')
+end
+renew_lease(meta['token'], deadline, lease, now)
+return reply(state, secret)
+"""
+
+# KEYS: file key
+# ARGV: max attempts
+# Returns {attempts, locked}; attempts is -1 if the token is gone. A locked
+# file is not incremented further.
+ATTEMPT = """
+local attempts = redis.call('HGET', KEYS[1], 'attempt_to_unlock')
+if not attempts then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {-1, 0}
+    end
+    attempts = 0
+end
+local max_attempts = tonumber(ARGV[1])
+if tonumber(attempts) >= max_attempts then
+    return {tonumber(attempts), 1}
+end
+attempts = redis.call('HINCRBY', KEYS[1], 'attempt_to_unlock', 1)
+return {attempts, attempts >= max_attempts and 1 or 0}
+"""
+
+# KEYS: file key, inline blob key, token registry, upload-order index
+# ARGV: start, stop, size ('' when unknown), streamed to the end ('1'/'0'),
+#       lease seconds, now
+#
+# Merges [start, stop) into the `delivered` ranges and renews the lease.
+# Once every byte has been delivered the token and blob are deleted.
+# Returns 1 if deleted now, 0 if not yet complete,
+# -1 if the token was already gone.
+CONSUME = _RENEW_LEASE + """
+local meta = redis.call('HMGET', KEYS[1], 'delivered', 'expires_at', 'token')
+if not meta[3] then
+    return -1
+end
+local complete = ARGV[4] == '1'
+local size = tonumber(ARGV[3])
+if size then
+    local start, stop = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local delivered = cjson.decode(meta[1] or '[]')
+    if stop > start then
+        table.insert(delivered, {start, stop})
+    end
+    table.sort(delivered, function(a, b) return a[1] < b[1] end)
+    local merged = {}
+    for _, range in ipairs(delivered) do
+        local last = merged[#merged]
+        if last and range[1] <= last[2] then
+            if range[2] > last[2] then last[2] = range[2] end
+        else
+            merged[#merged + 1] = {range[1], range[2]}
+        end
+    end
+    complete = size == 0 or (#merged == 1 and merged[1][1] == 0 and merged[1][2] >= size)
+    if not complete then
+        redis.call('HSET', KEYS[1], 'delivered', cjson.encode(merged))
+    end
+end
+if not complete then
+    if meta[2] then
+        renew_lease(meta[3], tonumber(meta[2]), tonumber(ARGV[5]), tonumber(ARGV[6]))
+    end
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('ZREM', KEYS[3], meta[3])
+redis.call('ZREM', KEYS[4], meta[3])
+return 1
+"""
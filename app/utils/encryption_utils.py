@@ -1,13 +1,107 @@
 
 import os
-from typing import Generator
-from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+import mmap
+import time
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Generator, NamedTuple, Optional
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 from argon2.low_level import hash_secret_raw, Type
 from config import Config
 
 
+# Container format (version 2)
+#
+#   header | frame 0 | frame 1 | ... | frame n-1
+#
+#   header  = magic "OTSC" | version u8 | cipher id u8 | chunk size u32 |
+#             base nonce 12B | plaintext length u64       (30 bytes, big-endian)
+#   frame i = AEAD(chunk i), nonce = base nonce + i. Every frame but the last
+#             holds exactly `chunk size` plaintext bytes, so frames need no
+#             length prefix and frame i starts at a computable offset.
+#             AAD = header without the length + a final-frame flag, which pins
+#             the parameters and makes truncated files fail to decrypt.
+#
+# Version 1 (legacy, no header) is a bare run of 4-byte-length-prefixed 64KB
+# frames whose nonce lives in Redis; decrypt_stream still reads it.
+MAGIC = b"OTSC"
+FORMAT_VERSION = 2
+CIPHER_CHACHA20_POLY1305 = 1
+CIPHER_AES_256_GCM = 2
+TAG_SIZE = 16
+_HEADER = struct.Struct(">4sBBI12sQ")
+HEADER_SIZE = _HEADER.size
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
 
 
+class FileHeader(NamedTuple):
+    cipher_id: int
+    chunk_size: int
+    base_nonce: bytes
+    plaintext_length: int
+    version: int = FORMAT_VERSION
+
+    def pack(self) -> bytes:
+        return _HEADER.pack(MAGIC, self.version, self.cipher_id, self.chunk_size,
+                            self.base_nonce, self.plaintext_length)
+
+    def aad(self, final: bool) -> bytes:
+        # The length is left out: streamed uploads only know it at the end
+        return self.pack()[:-8] + (b"\x01" if final else b"\x00")
+
+
+class CipherSuite(NamedTuple):
+    # All suites take 32-byte keys, 12-byte nonces and add a 16-byte tag
+    cipher_id: int
+    name: str
+    aead: type
+
+
+CIPHERS = {
+    CIPHER_CHACHA20_POLY1305: CipherSuite(CIPHER_CHACHA20_POLY1305, "chacha20-poly1305", ChaCha20Poly1305),
+    CIPHER_AES_256_GCM: CipherSuite(CIPHER_AES_256_GCM, "aes-256-gcm", AESGCM),
+}
+CIPHERS_BY_NAME = {suite.name: suite for suite in CIPHERS.values()}
+_auto_suite = None
+
+
+def benchmark_ciphers(sample_size: int = 1024 * 1024, rounds: int = 3) -> dict:
+    '''
+    Encrypt throughput (MB/s, best of `rounds`) of every suite on this host
+    '''
+    data = bytes(sample_size)
+    rates = {}
+    for suite in CIPHERS.values():
+        cipher = suite.aead(os.urandom(32))
+        best = float("inf")
+        for round_num in range(rounds):
+            start = time.perf_counter()
+            cipher.encrypt(round_num.to_bytes(12, 'big'), data, None)
+            best = min(best, time.perf_counter() - start)
+        rates[suite.name] = sample_size / (1024 * 1024) / best
+    return rates
+
+
+def select_cipher(name: Optional[str] = None) -> CipherSuite:
+    '''
+    Suite for new files: Config.CIPHER_SUITE by name, or for `auto` the
+    fastest one on this host (benchmarked once per process)
+    '''
+    global _auto_suite
+    name = (name or Config.CIPHER_SUITE).lower()
+    if name == "auto":
+        if _auto_suite is None:
+            rates = benchmark_ciphers()
+            _auto_suite = CIPHERS_BY_NAME[max(rates, key=rates.get)]
+        return _auto_suite
+    try:
+        return CIPHERS_BY_NAME[name]
+    except KeyError:
+        raise ValueError(f"Unknown cipher suite {name!r} (expected one of {sorted(CIPHERS_BY_NAME)} or 'auto')")
+
 
 def generate_key() -> bytes:
     return os.urandom(32)
@@ -49,56 +143,449 @@ def _increment_nonce(base_nonce: bytes, counter: int) -> bytes:
     return new_int.to_bytes(12, 'big')
 
 
+def frame_count(plaintext_length: int, chunk_size: int) -> int:
+    '''
+    Number of frames in a v2 file (an empty file still has one final frame)
+    '''
+    return max(1, -(-plaintext_length // chunk_size))
+
+
+def frame_offset(frame_num: int, chunk_size: int) -> int:
+    '''
+    Byte offset of frame `frame_num` in a v2 file
+    '''
+    return HEADER_SIZE + frame_num * (chunk_size + TAG_SIZE)
+
+
+def pick_chunk_size(size_hint: Optional[int] = None) -> int:
+    '''
+    Frame size for a new file: Config.CHUNK_SIZE, or scaled to the expected
+    file size when CHUNK_SIZE_AUTO is on (fewer, larger frames for big files)
+    '''
+    if not Config.CHUNK_SIZE_AUTO or not size_hint:
+        return Config.CHUNK_SIZE
+    if size_hint <= 1024 * 1024:
+        return 64 * 1024
+    if size_hint <= 64 * 1024 * 1024:
+        return 256 * 1024
+    return 1024 * 1024
+
+
+class BufferPool:
+    '''
+    Per-process free lists of reusable bytearrays, keyed by size, so the
+    frame loops do not allocate a fresh buffer for every chunk.
+    list.pop/append are atomic, so threads may share the pool.
+    '''
+
+    def __init__(self, max_per_size: int = 8) -> None:
+        self.max_per_size = max_per_size
+        self._free = {}
+
+    def acquire(self, size: int) -> bytearray:
+        try:
+            return self._free[size].pop()
+        except (KeyError, IndexError):
+            return bytearray(size)
+
+    def release(self, buf: bytearray) -> None:
+        free = self._free.setdefault(len(buf), [])
+        if len(free) < self.max_per_size:
+            free.append(buf)
+
+
+buffer_pool = BufferPool()
+
+
+def _readinto_exact(stream: BinaryIO, view: memoryview) -> int:
+    '''
+    Fill `view` from `stream`; returns the byte count (short only at EOF)
+    '''
+    readinto = getattr(stream, 'readinto', None)
+    total = 0
+    while total < len(view):
+        if readinto is not None:
+            n = readinto(view[total:] if total else view)
+        else:
+            data = stream.read(len(view) - total)
+            n = len(data)
+            view[total:total + n] = data
+        if not n:
+            break
+        total += n
+    return total
+
+
+class FrameCipher:
+    '''
+    Seals and opens the frames of one v2 file. The plaintext length is only
+    needed by `header()`, so streams can seal frames first and write the
+    header last. Nonces come from the base nonce parsed once, not per frame.
+    New files use the configured suite; existing ones the id in their header.
+    '''
+
+    def __init__(self, key: bytes, chunk_size: Optional[int] = None,
+                 base_nonce: Optional[bytes] = None,
+                 cipher_id: Optional[int] = None) -> None:
+        self.chunk_size = chunk_size or Config.CHUNK_SIZE
+        self.base_nonce = base_nonce or os.urandom(12)
+        self.cipher_id = cipher_id or select_cipher().cipher_id
+        self._cipher = CIPHERS[self.cipher_id].aead(key)
+        # Missing from older cryptography releases (e.g. the pinned 46.0.x)
+        self._encrypt_into = getattr(self._cipher, "encrypt_into", None)
+        self._nonce_base = int.from_bytes(self.base_nonce, 'big')
+        template = FileHeader(self.cipher_id, self.chunk_size, self.base_nonce, 0)
+        self._aad = {False: template.aad(False), True: template.aad(True)}
+
+    @classmethod
+    def from_header(cls, header: FileHeader, key: bytes, base_nonce: Optional[bytes] = None) -> "FrameCipher":
+        cipher = cls(key, header.chunk_size, header.base_nonce, header.cipher_id)
+        if base_nonce:
+            # Explicit nonce (legacy metadata) wins; AAD still binds the header's
+            cipher._nonce_base = int.from_bytes(base_nonce, 'big')
+        return cipher
+
+    def header(self, plaintext_length: int) -> bytes:
+        return FileHeader(self.cipher_id, self.chunk_size, self.base_nonce, plaintext_length).pack()
+
+    def nonce(self, frame_num: int) -> bytes:
+        # to_bytes raises OverflowError past 2**96, like _increment_nonce
+        return (self._nonce_base + frame_num).to_bytes(12, 'big')
+
+    def seal(self, frame_num: int, chunk: bytes, final: bool) -> bytes:
+        return self._cipher.encrypt(self.nonce(frame_num), chunk, self._aad[final])
+
+    def seal_into(self, frame_num: int, chunk, out: memoryview, final: bool) -> int:
+        '''
+        Seal `chunk` into `out`, which must be exactly len(chunk) + TAG_SIZE
+        '''
+        if self._encrypt_into is None:
+            sealed = self._cipher.encrypt(self.nonce(frame_num), bytes(chunk), self._aad[final])
+            out[:len(sealed)] = sealed
+            return len(sealed)
+        return self._encrypt_into(self.nonce(frame_num), chunk, self._aad[final], out)
+
+    def open(self, frame_num: int, frame, final: bool) -> bytes:
+        return self._cipher.decrypt(self.nonce(frame_num), frame, self._aad[final])
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+_executors_pid = None
+
+
+def _get_executor(workers: int) -> ThreadPoolExecutor:
+    '''
+    Shared per-process cipher pool. Threads do not survive fork, so pools
+    are rebuilt in each worker process.
+    '''
+    global _executors_pid
+    with _executors_lock:
+        if _executors_pid != os.getpid():
+            _executors.clear()
+            _executors_pid = os.getpid()
+        if workers not in _executors:
+            _executors[workers] = ThreadPoolExecutor(workers, thread_name_prefix="seal")
+        return _executors[workers]
+
+
+def parallel_workers(size_hint: Optional[int]) -> int:
+    '''
+    Cipher workers for a file of `size_hint` bytes (1 = seal inline)
+    '''
+    if not size_hint or size_hint < Config.PARALLEL_ENCRYPT_MIN_BYTES:
+        return 1
+    return max(1, Config.ENCRYPT_WORKERS)
+
+
+class ParallelSealer:
+    '''
+    Seals frames on a thread pool (the AEAD releases the GIL) and writes them
+    to `sink` strictly in frame order. At most `window` frames are in flight,
+    so memory stays bounded however fast the reader is. The output is
+    byte-for-byte what sequential sealing would produce.
+    '''
+
+    def __init__(self, cipher: FrameCipher, sink: BinaryIO, workers: int,
+                 window: Optional[int] = None) -> None:
+        self.cipher = cipher
+        self.sink = sink
+        self.window = window or 2 * workers
+        self._executor = _get_executor(workers)
+        self._pending = deque()
+
+    def submit(self, frame_num: int, plain: bytearray, length: int, final: bool) -> None:
+        '''
+        Queue a frame. Takes ownership of `plain` (a buffer_pool buffer)
+        '''
+        sealed = buffer_pool.acquire(self.cipher.chunk_size + TAG_SIZE)
+        future = self._executor.submit(self._seal, frame_num, plain, sealed, length, final)
+        self._pending.append((future, plain, sealed, length))
+        while len(self._pending) >= self.window:
+            self._write_next()
+
+    def _seal(self, frame_num: int, plain: bytearray, sealed: bytearray, length: int, final: bool) -> None:
+        self.cipher.seal_into(frame_num, memoryview(plain)[:length],
+                              memoryview(sealed)[:length + TAG_SIZE], final)
 
-def encrypt_file_chunked(input_path: str, output_path: str, key: bytes) -> bytes:
-    '''
-    Encrypt a file using ChaCha20Poly1305
-    '''
-    base_nonce = os.urandom(12)  # Random per file!
-    cipher = ChaCha20Poly1305(key)
-
-    # with open(input_path, 'rb') as f:
-    #     chunk_num = 0
-    #     while True :
-    #         chunk = f.read(64 * 1024)
-    #         if not(chunk):
-    #             break
-    #         else:
-    #             chunk_nonce = _increment_nonce(base_nonce, chunk_num)
-    #             encrypted = cipher.encrypt(chunk_nonce, chunk, None)
-    #             chunk_num += 1
-                
-
-    with open(input_path,'rb') as infile , open(output_path,'wb') as outfile:
-        chunk_num = 0
-        while True:
-            chunk = infile.read(64 * 1024)
-            if not(chunk):
-                break
-            else:
-                chunk_nonce = _increment_nonce(base_nonce, chunk_num)
-                encrypted = cipher.encrypt(chunk_nonce, chunk, None)
-                chunk_num += 1
-                length_bytes = len(encrypted).to_bytes(4, 'big')
-                outfile.write(length_bytes + encrypted)
-
-    return base_nonce
-
-def decrypt_file_chunked(input_path: str, key: bytes, base_nonce: bytes) -> Generator[bytes, None, None]:
-    '''
-    Decrypt a file using ChaCha20Poly1305
-    '''
-    cipher = ChaCha20Poly1305(key)
-    with open (input_path, 'rb') as f:
-        chunk_num = 0
-        while True:
-            length_bytes = f.read(4)
-            if not(length_bytes):
-                break
-
-            chunk_length = int.from_bytes(length_bytes, 'big')
-            chunk = f.read(chunk_length)
-            chunk_nonce = _increment_nonce(base_nonce, chunk_num)
-            decrypted = cipher.decrypt(chunk_nonce, chunk, None)
-            chunk_num += 1
-            yield decrypted
\ No newline at end of file
+    def _write_next(self) -> None:
+        future, plain, sealed, length = self._pending.popleft()
+        try:
+            future.result()
+            self.sink.write(memoryview(sealed)[:length + TAG_SIZE])
+        finally:
+            buffer_pool.release(plain)
+            buffer_pool.release(sealed)
+
+    def flush(self) -> None:
+        '''
+        Write every queued frame (call before the sink changes or closes)
+        '''
+        while self._pending:
+            self._write_next()
+
+    def abort(self) -> None:
+        '''
+        Drop queued frames without writing them
+        '''
+        while self._pending:
+            future, plain, sealed, _ = self._pending.popleft()
+            if not future.cancel():
+                future.exception()  # still running: let it finish with the buffers
+            buffer_pool.release(plain)
+            buffer_pool.release(sealed)
+
+
+def _frames(header: FileHeader) -> Generator[tuple, None, None]:
+    '''
+    (frame number, is final, ciphertext length) for every frame of a v2 file
+    '''
+    frames = frame_count(header.plaintext_length, header.chunk_size)
+    last_length = header.plaintext_length - (frames - 1) * header.chunk_size + TAG_SIZE
+    full_length = header.chunk_size + TAG_SIZE
+    for frame_num in range(frames - 1):
+        yield frame_num, False, full_length
+    yield frames - 1, True, last_length
+
+
+def read_header(f: BinaryIO) -> Optional[FileHeader]:
+    '''
+    Parse a v2 header. Returns None (and rewinds) for legacy headerless files
+    '''
+    head = f.read(HEADER_SIZE)
+    if len(head) < HEADER_SIZE or head[:4] != MAGIC:
+        f.seek(-len(head), os.SEEK_CUR)
+        return None
+    _, version, cipher_id, chunk_size, base_nonce, length = _HEADER.unpack(head)
+    if version != FORMAT_VERSION or cipher_id not in CIPHERS or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"Unsupported file format (version {version}, cipher {cipher_id})")
+    return FileHeader(cipher_id, chunk_size, base_nonce, length, version)
+
+
+def wrap_key(key: bytes, wrapping_key: bytes) -> bytes:
+    '''
+    Encrypt a file key with a password-derived key (nonce + ciphertext)
+    '''
+    nonce = os.urandom(12)
+    return nonce + ChaCha20Poly1305(wrapping_key).encrypt(nonce, key, None)
+
+
+def unwrap_key(wrapped: bytes, wrapping_key: bytes) -> bytes:
+    '''
+    Recover a file key wrapped by wrap_key. Raises InvalidTag on a wrong key
+    '''
+    return ChaCha20Poly1305(wrapping_key).decrypt(wrapped[:12], wrapped[12:], None)
+
+
+
+def encrypt_file_chunked(input_path: str, output_path: str, key: bytes,
+                         chunk_size: Optional[int] = None, workers: Optional[int] = None) -> bytes:
+    '''
+    Encrypt a file into the v2 container. Returns the base nonce.
+    Files above PARALLEL_ENCRYPT_MIN_BYTES are sealed on `workers` threads
+    (default ENCRYPT_WORKERS); the output is identical either way.
+    '''
+    size = os.path.getsize(input_path)
+    cipher = FrameCipher(key, chunk_size or pick_chunk_size(size))
+    frames = frame_count(size, cipher.chunk_size)
+    workers = workers or parallel_workers(size)
+
+    with open(input_path,'rb', buffering=0) as infile , open(output_path,'wb', buffering=0) as outfile:
+        outfile.write(cipher.header(size))
+        if workers > 1:
+            _encrypt_parallel(infile, cipher, ParallelSealer(cipher, outfile, workers), frames)
+        else:
+            _encrypt_sequential(infile, outfile, cipher, frames)
+
+    return cipher.base_nonce
+
+
+def _encrypt_sequential(infile: BinaryIO, outfile: BinaryIO, cipher: FrameCipher, frames: int) -> None:
+    plain = buffer_pool.acquire(cipher.chunk_size)
+    sealed = buffer_pool.acquire(cipher.chunk_size + TAG_SIZE)
+    try:
+        plain_view, sealed_view = memoryview(plain), memoryview(sealed)
+        for chunk_num in range(frames):
+            n = _readinto_exact(infile, plain_view)
+            final = chunk_num == frames - 1
+            if n < cipher.chunk_size and not final:
+                raise ValueError("Input shrank while being encrypted")
+            chunk, out = (plain_view, sealed_view) if n == cipher.chunk_size else (plain_view[:n], sealed_view[:n + TAG_SIZE])
+            cipher.seal_into(chunk_num, chunk, out, final)
+            outfile.write(out)
+    finally:
+        buffer_pool.release(plain)
+        buffer_pool.release(sealed)
+
+
+def _encrypt_parallel(infile: BinaryIO, cipher: FrameCipher, sealer: ParallelSealer, frames: int) -> None:
+    try:
+        for chunk_num in range(frames):
+            plain = buffer_pool.acquire(cipher.chunk_size)
+            n = _readinto_exact(infile, memoryview(plain))
+            final = chunk_num == frames - 1
+            if n < cipher.chunk_size and not final:
+                buffer_pool.release(plain)
+                raise ValueError("Input shrank while being encrypted")
+            sealer.submit(chunk_num, plain, n, final)
+        sealer.flush()
+    except BaseException:
+        sealer.abort()
+        raise
+
+
+def _decrypt_legacy(f: BinaryIO, key: bytes, base_nonce: bytes) -> Generator[bytes, None, None]:
+    '''
+    Decrypt a version 1 file (length-prefixed frames, nonce from Redis)
+    '''
+    cipher = CIPHERS[CIPHER_CHACHA20_POLY1305].aead(key)
+    chunk_num = 0
+    while True:
+        length_bytes = f.read(4)
+        if not(length_bytes):
+            break
+
+        chunk_length = int.from_bytes(length_bytes, 'big')
+        chunk = f.read(chunk_length)
+        chunk_nonce = _increment_nonce(base_nonce, chunk_num)
+        decrypted = cipher.decrypt(chunk_nonce, chunk, None)
+        chunk_num += 1
+        yield decrypted
+
+
+def _decrypt_frames(f: BinaryIO, cipher: FrameCipher, header: FileHeader,
+                    first: int, last: int) -> Generator[bytes, None, None]:
+    '''
+    Decrypt frames first..last (inclusive), reading from f's current position
+    '''
+    frames = frame_count(header.plaintext_length, header.chunk_size)
+    last_length = header.plaintext_length - (frames - 1) * header.chunk_size + TAG_SIZE
+    buf = buffer_pool.acquire(header.chunk_size + TAG_SIZE)
+    try:
+        view = memoryview(buf)
+        for chunk_num in range(first, last + 1):
+            final = chunk_num == frames - 1
+            length = last_length if final else len(view)
+            frame = view if length == len(view) else view[:length]
+            if _readinto_exact(f, frame) != length:
+                raise InvalidTag("Truncated ciphertext")
+            yield cipher.open(chunk_num, frame, final)
+    finally:
+        buffer_pool.release(buf)
+
+
+def decrypt_stream(f: BinaryIO, key: bytes, base_nonce: Optional[bytes] = None) -> Generator[bytes, None, None]:
+    '''
+    Decrypt an open v2 or legacy file object chunk by chunk.
+    `base_nonce` is required for legacy files; for v2 files it overrides the header nonce.
+    Frames are read into one pooled buffer, so each chunk costs a single allocation (its plaintext).
+    '''
+    header = read_header(f)
+    if header is None:
+        yield from _decrypt_legacy(f, key, base_nonce)
+        return
+
+    cipher = FrameCipher.from_header(header, key, base_nonce)
+    frames = frame_count(header.plaintext_length, header.chunk_size)
+    yield from _decrypt_frames(f, cipher, header, 0, frames - 1)
+    if f.read(1):
+        raise InvalidTag("Trailing data after final frame")
+
+
+def plaintext_length(f: BinaryIO) -> Optional[int]:
+    '''
+    Plaintext size recorded in a v2 header (None for legacy files)
+    '''
+    header = read_header(f)
+    return header.plaintext_length if header else None
+
+
+def decrypt_range(f: BinaryIO, key: bytes, start: int, stop: int,
+                  base_nonce: Optional[bytes] = None) -> Generator[bytes, None, None]:
+    '''
+    Decrypt plaintext bytes [start, stop) of a v2 file. Frame offsets follow
+    from the fixed frame size, so only the frames overlapping the range are
+    read and decrypted. Legacy files have no index and raise ValueError.
+    '''
+    header = read_header(f)
+    if header is None:
+        raise ValueError("Legacy files do not support random access")
+    if not 0 <= start <= stop <= header.plaintext_length:
+        raise ValueError(f"Range {start}-{stop} outside 0-{header.plaintext_length}")
+    if start == stop:
+        return
+
+    chunk_size = header.chunk_size
+    first, last = start // chunk_size, (stop - 1) // chunk_size
+    f.seek(frame_offset(first, chunk_size))
+    cipher = FrameCipher.from_header(header, key, base_nonce)
+    for chunk_num, plaintext in enumerate(_decrypt_frames(f, cipher, header, first, last), first):
+        lo = start - chunk_num * chunk_size if chunk_num == first else 0
+        hi = stop - chunk_num * chunk_size if chunk_num == last else len(plaintext)
+        yield plaintext if (lo, hi) == (0, len(plaintext)) else plaintext[lo:hi]
+
+
+def decrypt_file_range(input_path: str, key: bytes, start: int, stop: int,
+                       base_nonce: Optional[bytes] = None) -> Generator[bytes, None, None]:
+    '''
+    decrypt_range on a file path
+    '''
+    with open(input_path, 'rb', buffering=0) as f:
+        yield from decrypt_range(f, key, start, stop, base_nonce)
+
+
+def _decrypt_mapped(mapped: mmap.mmap, key: bytes, base_nonce: Optional[bytes]) -> Generator[bytes, None, None]:
+    '''
+    decrypt_stream over a memory-mapped file: frames are decrypted straight
+    from the page cache, with no read copies at all
+    '''
+    header = read_header(mapped)
+    if header is None:
+        yield from _decrypt_legacy(mapped, key, base_nonce)
+        return
+
+    cipher = FrameCipher.from_header(header, key, base_nonce)
+    offset = HEADER_SIZE
+    with memoryview(mapped) as view:
+        for chunk_num, final, length in _frames(header):
+            if offset + length > len(view):
+                raise InvalidTag("Truncated ciphertext")
+            # Views must be released before the mapping can be closed
+            with view[offset:offset + length] as frame:
+                yield cipher.open(chunk_num, frame, final)
+            offset += length
+        if offset != len(view):
+            raise InvalidTag("Trailing data after final frame")
+
+
+def decrypt_file_chunked(input_path: str, key: bytes, base_nonce: Optional[bytes] = None,
+                         use_mmap: bool = False) -> Generator[bytes, None, None]:
+    '''
+    Decrypt a file (v2 container or legacy) chunk by chunk, optionally via mmap
+    '''
+    with open (input_path, 'rb', buffering=0) as f:
+        if not use_mmap or os.fstat(f.fileno()).st_size == 0:
+            yield from decrypt_stream(f, key, base_nonce)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from _decrypt_mapped(mapped, key, base_nonce)
@@ -19,13 +19,17 @@ class FileTooLargeException(Exception):
         self.message = message
 
 
+def is_allowed_extension(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
+
+
 def check_file(file):
     try :
      
 
         #check teh file extenion from teh allowed extenions 
 
-        if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in Config.ALLOWED_EXTENSIONS:
+        if not is_allowed_extension(file.filename):
             logger.error("File type not allowed")
             raise FileNotAllowedException("File type not allowed")
         #check if file size is less then 20 Mib
@@ -45,13 +49,14 @@ def generate_uuid_and_filepath(file):
         logger.info("Generating UUID and file path")
         try:
             file = check_file(file)
-            #generate a unique file name 
-            file_name = str(uuid.uuid4()) + os.path.splitext(file.filename)[1]
-            # file_name = str(uuid.uuid4()) 
-            filepath = os.path.join(Config.UPLOAD_FOLDER, file_name)
-
-            return file_name, filepath 
+            return build_uuid_filepath(file.filename)
         except Exception as e:
             logger.error(f"Error generating UUID and file path: {str(e)}")
             raise FileNotAllowedException(f"Error generating UUID and file path: {str(e)}")
-            
+
+
+def build_uuid_filepath(filename):
+    #generate a unique file name 
+    file_name = str(uuid.uuid4()) + os.path.splitext(filename)[1]
+    filepath = os.path.join(Config.UPLOAD_FOLDER, file_name)
+    return file_name, filepath
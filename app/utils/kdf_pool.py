@@ -0,0 +1,115 @@
+"""
+kdf_pool.py - Bounded executor for Argon2 / bcrypt work
+
+Argon2id at 64 MiB and bcrypt are deliberately expensive, so running them
+inline on every request thread lets a burst of protected requests pin all
+cores and spike RSS. All password hashing goes through one small pool per
+process instead:
+
+- concurrency is capped by KDF_MAX_WORKERS and by KDF_MEMORY_BUDGET_KIB
+  divided by the Argon2 memory cost; both are per process, so a host
+  running WEB_CONCURRENCY workers may use that many times the budget,
+- at most KDF_MAX_QUEUE calls may wait; beyond that callers get an
+  immediate 503 with Retry-After instead of piling up,
+- queue depth, wait time and rejections are kept for /stats/kdf.
+"""
+import os
+import time
+import threading
+import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.exceptions import ServiceUnavailable
+from config import Config
+
+
+class KDFPoolBusy(ServiceUnavailable):
+    """Raised when the KDF queue is full or the wait timed out."""
+
+    def __init__(self):
+        super().__init__("Server is busy, please retry shortly", retry_after=Config.KDF_RETRY_AFTER)
+
+
+class KDFPool:
+
+    def __init__(self, max_workers: int, max_queue: int, queue_timeout: float) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._rejected = 0
+        self._completed = 0
+        self._waits = deque(maxlen=1000)
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Threads do not survive fork: build the executor in each worker process
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="kdf")
+            self._pid = os.getpid()
+            self._in_flight = self._running = 0
+        return self._executor
+
+    def run(self, fn, *args):
+        '''
+        Run `fn(*args)` on the pool, blocking until done. Raises KDFPoolBusy
+        when the wait queue is full or the job waited longer than queue_timeout.
+        '''
+        with self._lock:
+            executor = self._get_executor()
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise KDFPoolBusy()
+            self._in_flight += 1
+
+        submitted = time.monotonic()
+
+        def job():
+            with self._lock:
+                self._running += 1
+                self._waits.append(time.monotonic() - submitted)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        future = executor.submit(job)
+        try:
+            return future.result(timeout=self.queue_timeout)
+        except FutureTimeout:
+            if future.cancel():
+                with self._lock:
+                    self._rejected += 1
+                raise KDFPoolBusy()
+            # Already running: the hash is nearly done, so wait it out
+            return future.result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queue_depth": max(0, self._in_flight - self._running),
+                "queue_limit": self.max_queue,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_ms_p50": round(statistics.median(waits) * 1000, 1) if waits else None,
+                "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else None,
+            }
+
+
+def _worker_count() -> int:
+    by_memory = Config.KDF_MEMORY_BUDGET_KIB // max(1, Config.ARGON2_MEMORY_COST)
+    return max(1, min(Config.KDF_MAX_WORKERS, by_memory))
+
+
+kdf_pool = KDFPool(_worker_count(), Config.KDF_MAX_QUEUE, Config.KDF_QUEUE_TIMEOUT)
@@ -0,0 +1,108 @@
+"""
+resumable_upload.py - Chunked, resumable uploads encrypted on arrival
+
+A session fixes the file size, key, base nonce and frame size up front, and
+the container header is written when the session is created. Every upload
+chunk covers a whole number of frames, so the ciphertext offset of chunk N
+in the final file is known before it arrives. Chunks are therefore
+encrypted while they stream in and written in place with `pwrite` - in any
+order, in parallel, retried as often as needed - and finalize is a rename.
+Server memory stays at one frame per in-flight chunk, whatever the file size.
+
+A frame's nonce is fixed by its position, so a retried chunk is sealed
+under the same nonces as the first attempt. Sealing different bytes there
+would leak their XOR and the GHASH key, so a retry (`verify=True`) only
+fills in frames that never reached the disk and must otherwise reproduce
+the ciphertext already written; anything else is a ChunkConflictError.
+"""
+import os
+from typing import BinaryIO
+from app.utils.encryption_utils import (
+    FrameCipher, TAG_SIZE, buffer_pool, frame_count, frame_offset, _readinto_exact
+)
+
+
+class ChunkLengthError(ValueError):
+    """Raised when an uploaded chunk is shorter or longer than expected."""
+
+
+class ChunkConflictError(ValueError):
+    """Raised when a retried chunk differs from the bytes already written."""
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return -(-size // chunk_size)
+
+
+def upload_chunk_size(requested: int, frame_size: int) -> int:
+    '''
+    Round the upload chunk size down to a whole number of frames
+    '''
+    return max(frame_size, requested // frame_size * frame_size)
+
+
+def expected_chunk_length(size: int, chunk_size: int, index: int) -> int:
+    '''
+    Plaintext length of chunk `index`; only the last chunk may be short
+    '''
+    return min(chunk_size, size - index * chunk_size)
+
+
+def create_part_file(part_path: str, cipher: FrameCipher, size: int) -> None:
+    '''
+    Write the container header. An empty file has no chunks to upload, so its
+    single (empty, final) frame is written here too.
+    '''
+    with open(part_path, 'wb') as f:
+        f.write(cipher.header(size))
+        if size == 0:
+            f.write(cipher.seal(0, b"", True))
+
+
+def write_chunk(part_path: str, cipher: FrameCipher, size: int, chunk_size: int,
+                index: int, length: int, stream: BinaryIO, verify: bool = False) -> None:
+    '''
+    Encrypt chunk `index` from `stream` straight into its slot in `part_path`.
+    With `verify`, frames already on disk are compared instead of rewritten.
+    '''
+    frame_size = cipher.chunk_size
+    last_frame = frame_count(size, frame_size) - 1
+    frame_num = index * chunk_size // frame_size
+    offset = frame_offset(frame_num, frame_size)
+    remaining = length
+    plain = buffer_pool.acquire(frame_size)
+    sealed = buffer_pool.acquire(frame_size + TAG_SIZE)
+
+    fd = os.open(part_path, os.O_RDWR if verify else os.O_WRONLY)
+    try:
+        plain_view, sealed_view = memoryview(plain), memoryview(sealed)
+        while remaining > 0:
+            wanted = min(frame_size, remaining)
+            plaintext = plain_view if wanted == frame_size else plain_view[:wanted]
+            if _readinto_exact(stream, plaintext) < wanted:
+                raise ChunkLengthError(f"Chunk {index} ended early: expected {length} bytes")
+            frame = sealed_view if wanted == frame_size else sealed_view[:wanted + TAG_SIZE]
+            cipher.seal_into(frame_num, plaintext, frame, frame_num == last_frame)
+            if not verify or _needs_write(fd, frame, offset, index):
+                os.pwrite(fd, frame, offset)
+            offset += len(frame)
+            frame_num += 1
+            remaining -= wanted
+    finally:
+        os.close(fd)
+        buffer_pool.release(plain)
+        buffer_pool.release(sealed)
+
+    if stream.read(1):
+        raise ChunkLengthError(f"Chunk {index} is larger than {length} bytes")
+
+
+def _needs_write(fd: int, frame: memoryview, offset: int, index: int) -> bool:
+    '''
+    True if the slot at `offset` was never (or only partly) written by an
+    earlier attempt, False if it already holds `frame`
+    '''
+    written = os.pread(fd, len(frame), offset).rstrip(b"\0")
+    if frame[:len(written)] != written:
+        raise ChunkConflictError(f"Chunk {index} differs from the bytes already uploaded")
+    return len(written) < len(frame)
@@ -3,17 +3,102 @@ serve_and_delete.py - Streaming decrypted file download with cleanup
 
 Day 16-17: Encryption/Decryption Implementation
 """
+import io
 import os
+import time
 import logging
+import hmac
 import base64
-from flask import Response
-from app.utils.encryption_utils import decrypt_file_chunked, derive_key_from_password
+from typing import Optional
+from datetime import datetime, timezone
+from flask import Response, request
+from config import Config
+from cryptography.exceptions import InvalidTag
+from app.utils.kdf_pool import kdf_pool
+from app.utils.password_utils import PasswordUtils
+from app.utils.read_ahead import read_ahead
+from app.services.counter_buffer import counters
+from app.utils.encryption_utils import (
+    decrypt_file_chunked, decrypt_file_range, decrypt_range, decrypt_stream,
+    derive_key_from_password, plaintext_length, unwrap_key
+)
+
+
+def unlock_file_key(metadata: dict, password: str) -> Optional[bytes]:
+    """
+    Check a password and recover the file key with one Argon2 derivation.
+
+    The wrapped file key is AEAD-sealed with the password-derived key, so a
+    successful unwrap *is* the password check. Files from before key wrapping
+    still carry a bcrypt hash and are checked with it first.
+
+    Returns:
+        The file key, or None if the password is wrong.
+    """
+    salt = bytes.fromhex(metadata["encryption_salt"])
+    if metadata.get("wrapped_key"):
+        password_key = kdf_pool.run(derive_key_from_password, password, salt)
+        try:
+            return unwrap_key(bytes.fromhex(metadata["wrapped_key"]), password_key)
+        except InvalidTag:
+            return None
+
+    if not kdf_pool.run(PasswordUtils.verify_password, password, metadata.get("password_hash")):
+        return None
+    return kdf_pool.run(derive_key_from_password, password, salt)
+
+
+LEASE_HEADER = 'X-Resume-Secret'
+
+
+def lease_cookie_name(token: str) -> str:
+    return f"ots_lease_{token}"
+
+
+def presented_lease_secret(token: str) -> Optional[str]:
+    """
+    Resume secret sent with this request, as a header or the lease cookie.
+    """
+    return request.headers.get(LEASE_HEADER) or request.cookies.get(lease_cookie_name(token))
+
+
+def lease_busy(metadata: dict, token: str) -> bool:
+    """
+    Cheap pre-check: is another client holding this file's download lease?
+    """
+    lease_secret = metadata.get("lease_secret")
+    presented = presented_lease_secret(token)
+    return bool(lease_secret) and not (presented and hmac.compare_digest(lease_secret, presented))
+
+
+def lease_busy_response(retry_after: int) -> Response:
+    return Response("Download already in progress\n", mimetype='text/plain', status=409,
+                    headers={'Retry-After': str(max(1, retry_after))})
+
+
+def _age_ms(metadata: dict) -> Optional[float]:
+    """Milliseconds since upload (upload_time is naive UTC ISO), or None."""
+    try:
+        uploaded = datetime.fromisoformat(metadata["upload_time"]).replace(tzinfo=timezone.utc)
+    except (KeyError, ValueError):
+        return None
+    return (time.time() - uploaded.timestamp()) * 1000
 
 
 def serve_and_delete(uuid_file_name, original_file_name, directory_path,
-                     token, redis_service, password, metadata):
+                     token, redis_service, password, metadata, claim, key=None):
     """
     Stream decrypted file to client, then cleanup.
+
+    Answers HEAD, sends Content-Length and serves single-range Range
+    requests (206) by decrypting only the frames the range overlaps.
+
+    The caller claims a download lease first (RedisService.open_download);
+    its resume secret goes back as the `X-Resume-Secret` header and a
+    cookie. Until the lease expires only requests carrying the secret are
+    served, so a dropped transfer resumes with Range while duplicates get
+    409. The file is deleted once every byte has been delivered, or
+    expires with the lease.
     
     Args:
         uuid_file_name: Token-based filename on disk
@@ -23,37 +108,137 @@ def serve_and_delete(uuid_file_name, original_file_name, directory_path,
         redis_service: Redis service instance
         password: Password for decryption (None if not protected)
         metadata: File metadata from Redis
+        claim: DownloadClaim for this request ("peek" for HEAD)
+        key: File key already unlocked by the caller (skips key derivation)
     """
+    if claim.state == "busy":
+        return lease_busy_response(claim.retry_after)
+
     file_path = os.path.join(directory_path, uuid_file_name)
+
+    # Small files are stored inline in Redis and arrive with the claim
+    inline_blob = None
+    if metadata.get("storage") == "inline":
+        inline_blob = claim.blob
+        if inline_blob is None:
+            raise FileNotFoundError(f"Inline blob missing for {token}")
     
     # Get decryption key
-    if metadata.get("encryption_salt"):
-        salt = bytes.fromhex(metadata["encryption_salt"])
-        key = derive_key_from_password(password, salt)
+    if key is not None:
+        pass
+    elif metadata.get("encryption_salt"):
+        key = unlock_file_key(metadata, password)
+        if key is None:
+            raise InvalidTag("Wrong password")
     else:
         key = base64.b64decode(metadata["encryption_key"])
     
-    base_nonce = bytes.fromhex(metadata.get("encryption_nonce"))
-    
-    # Generator with cleanup in finally
+    # Only legacy (headerless) files keep their nonce in Redis
+    legacy_nonce = metadata.get("encryption_nonce")
+    base_nonce = bytes.fromhex(legacy_nonce) if legacy_nonce else None
+
+    def open_ciphertext():
+        if inline_blob is not None:
+            return io.BytesIO(inline_blob)
+        return open(file_path, 'rb', buffering=0)
+
+    # Plaintext size enables Content-Length and Range (None for legacy files)
+    if metadata.get("size"):
+        size = int(metadata["size"])
+    else:
+        with open_ciphertext() as f:
+            size = plaintext_length(f)
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{original_file_name}"',
+        'Accept-Ranges': 'bytes' if size is not None else 'none',
+    }
+    mimetype = metadata.get('content_type', 'application/octet-stream')
+
+    def respond(response: Response) -> Response:
+        if claim.secret:
+            response.headers[LEASE_HEADER] = claim.secret
+            response.set_cookie(lease_cookie_name(token), claim.secret, max_age=Config.DOWNLOAD_LEASE_SECONDS,
+                                httponly=True, samesite='Lax', secure=request.is_secure)
+        return response
+
+    status = 200
+    start, stop = 0, size
+
+    byte_range = request.range
+    if size is not None and byte_range is not None and byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+        span = byte_range.range_for_length(size)
+        if span is None:
+            return respond(Response(status=416, headers={'Content-Range': f'bytes */{size}'}))
+        start, stop = span
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    if size is not None:
+        headers['Content-Length'] = str(stop - start)
+
+    # HEAD: headers only, nothing delivered, nothing deleted
+    if request.method == 'HEAD':
+        response = Response(None, status=status, mimetype=mimetype, headers=headers)
+        # A legacy file's length is unknown; an empty body must not claim 0
+        response.automatically_set_content_length = size is not None
+        return response
+
+    def chunks_for_request():
+        if status == 206:
+            if inline_blob is not None:
+                return decrypt_range(io.BytesIO(inline_blob), key, start, stop, base_nonce)
+            chunks = decrypt_file_range(file_path, key, start, stop, base_nonce)
+        elif inline_blob is not None:
+            return decrypt_stream(io.BytesIO(inline_blob), key, base_nonce)
+        else:
+            chunks = decrypt_file_chunked(file_path, key, base_nonce, use_mmap=Config.DECRYPT_USE_MMAP)
+        if Config.DOWNLOAD_READ_AHEAD_FRAMES > 0:
+            # Decrypt ahead of the socket writes on a background thread
+            chunks = read_ahead(chunks, Config.DOWNLOAD_READ_AHEAD_FRAMES)
+        return chunks
+
+    def record(delivered: int, complete: bool) -> None:
+        # One CONSUME call records the bytes and renews the lease; the
+        # one-time deletion fires only once every byte has been delivered
+        # (possibly across several Range requests). A dropped connection
+        # leaves the file to be resumed until the lease runs out.
+        if redis_service.consume_download(token, start, start + delivered, size, complete) != 1:
+            return
+        counters.incr("downloads")
+        counters.incr("deletions")
+        counters.event("download", token, s=size, p=metadata.get("is_protected") == "True",
+                       age=_age_ms(metadata), dur=(time.monotonic() - started) * 1000)
+        if inline_blob is None and os.path.exists(file_path):
+            os.remove(file_path)
+            logging.info(f"✅ Deleted file: {uuid_file_name}")
+        counters.event("delete", token, st="i" if inline_blob is not None else "d")
+
+    started = time.monotonic()
+    renew_every = Config.DOWNLOAD_LEASE_SECONDS / 3
+
     def generate():
+        chunks = None
+        delivered = 0   # bytes the server has finished writing
+        in_flight = 0
+        complete = False
+        renewed = started
         try:
-            for chunk in decrypt_file_chunked(file_path, key, base_nonce):
+            chunks = chunks_for_request()
+            for chunk in chunks:
+                # Resumed after a yield: the previous chunk reached the socket
+                delivered += in_flight
+                in_flight = len(chunk)
+                if time.monotonic() - renewed >= renew_every:
+                    # A transfer longer than the lease must not lose its key
+                    # (and its file) mid-stream: record progress and renew
+                    record(delivered, False)
+                    renewed = time.monotonic()
                 yield chunk
+            delivered += in_flight
+            complete = True
         finally:
-            # Cleanup AFTER streaming completes
-            redis_service.atomic_delete(token)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logging.info(f"✅ Deleted file: {uuid_file_name}")
-            redis_service.increment_counter("downloads", 1)
-            redis_service.increment_counter("deletions", 1)
-    
-    # Return Response (OUTSIDE generator)
-    return Response(
-        generate(),
-        mimetype=metadata.get('content_type', 'application/octet-stream'),
-        headers={
-            'Content-Disposition': f'attachment; filename="{original_file_name}"'
-        }
-    )
\ No newline at end of file
+            if chunks is not None:
+                chunks.close()
+            record(delivered, complete)
+
+    return respond(Response(generate(), status=status, mimetype=mimetype, headers=headers))
@@ -0,0 +1,197 @@
+"""
+upload_stream.py - Encrypt uploads while werkzeug parses the multipart body
+
+The form parser writes each file part into whatever `_get_file_stream`
+returns. Handing it an encrypting sink means plaintext never touches disk:
+chunks are sealed as they arrive and only the final ciphertext is written.
+"""
+import io
+import os
+import uuid
+import logging
+from flask import Request
+from typing import Optional
+from config import Config
+from app.utils.encryption_utils import (
+    generate_key, pick_chunk_size, parallel_workers, buffer_pool,
+    FrameCipher, ParallelSealer, HEADER_SIZE, TAG_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EncryptedUploadStream:
+    """
+    Write-only file object that encrypts into a hidden `.part` file.
+
+    Uses a fresh random key per upload (password-protected uploads wrap it
+    afterwards, since the password field may arrive after the file part).
+    Ciphertext stays in memory until the plaintext exceeds `inline_limit`,
+    so tiny files never touch disk (`inline_data` holds them afterwards).
+    The part file is renamed into place by `commit()`; anything not
+    committed is unlinked on `close()`.
+
+    The container header carries the plaintext length, which is unknown
+    until the body ends: a placeholder is written first and filled in by
+    `finish()`, and the last chunk is held back so it can be sealed as final.
+    """
+
+    def __init__(self, directory: str, chunk_size: Optional[int] = None,
+                 inline_limit: int = 0, workers: int = 1):
+        self.key = generate_key()
+        self._cipher = FrameCipher(self.key, chunk_size)
+        self.base_nonce = self._cipher.base_nonce
+        self.chunk_size = self._cipher.chunk_size
+        self.inline_limit = inline_limit
+        self.inline_data = None
+        self.size = 0
+        self.directory = directory
+        self.path = None
+        # Pooled frame buffers: multipart parts are copied into `_plain` and
+        # sealed into `_sealed`, so no per-chunk bytes objects are created.
+        # With workers > 1, full `_plain` buffers are handed to a ParallelSealer instead.
+        self._plain = buffer_pool.acquire(self.chunk_size)
+        self._sealed = buffer_pool.acquire(self.chunk_size + TAG_SIZE) if workers <= 1 else None
+        self._filled = 0
+        self._chunk_num = 0
+        self._file = io.BytesIO()
+        self._file.write(bytes(HEADER_SIZE))
+        self._parallel = ParallelSealer(self._cipher, self._file, workers) if workers > 1 else None
+        self._finished = False
+        self._committed = False
+        if inline_limit <= 0:
+            self._spill()
+
+    @property
+    def is_inline(self) -> bool:
+        return self.path is None
+
+    def _spill(self) -> None:
+        """Move buffered ciphertext to a part file on disk."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f".{uuid.uuid4().hex}.part")
+        if self._parallel:
+            self._parallel.flush()
+        disk_file = open(self.path, 'wb')
+        disk_file.write(self._file.getbuffer())
+        self._file = disk_file
+        if self._parallel:
+            self._parallel.sink = disk_file
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        if self._finished:
+            raise ValueError("write to finished upload stream")
+        view = memoryview(data)
+        self.size += len(view)
+        if self.is_inline and self.size > self.inline_limit:
+            self._spill()
+        while view:
+            # A full buffer is only sealed once more data arrives: the last
+            # chunk must stay buffered until finish() seals it as final
+            if self._filled == self.chunk_size:
+                self._write_frame()
+            n = min(self.chunk_size - self._filled, len(view))
+            self._plain[self._filled:self._filled + n] = view[:n]
+            self._filled += n
+            view = view[n:]
+        return len(data)
+
+    def _write_frame(self, final: bool = False) -> None:
+        n = self._filled
+        if self._parallel:
+            self._parallel.submit(self._chunk_num, self._plain, n, final)
+            self._plain = None if final else buffer_pool.acquire(self.chunk_size)
+            self._chunk_num += 1
+            self._filled = 0
+            return
+        plain, sealed = memoryview(self._plain), memoryview(self._sealed)
+        if n < self.chunk_size:
+            plain, sealed = plain[:n], sealed[:n + TAG_SIZE]
+        self._cipher.seal_into(self._chunk_num, plain, sealed, final)
+        self._file.write(sealed)
+        self._chunk_num += 1
+        self._filled = 0
+
+    def _release_buffers(self) -> None:
+        for buf in (self._plain, self._sealed):
+            if buf is not None:
+                buffer_pool.release(buf)
+        self._plain = self._sealed = None
+
+    def finish(self) -> None:
+        """Seal the final chunk, fill in the header and close the part file."""
+        if self._finished:
+            return
+        self._write_frame(final=True)
+        if self._parallel:
+            self._parallel.flush()
+        self._release_buffers()
+        self._file.seek(0)
+        self._file.write(self._cipher.header(self.size))
+        if self.is_inline:
+            self.inline_data = self._file.getvalue()
+        self._file.close()
+        self._finished = True
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        # werkzeug rewinds the container once the part is complete
+        self.finish()
+        return 0
+
+    def commit(self, final_path: str) -> None:
+        """Move the finished ciphertext to its token path (no-op when inline)."""
+        self.finish()
+        if not self.is_inline:
+            os.replace(self.path, final_path)
+            self.path = final_path
+        self._committed = True
+
+    def close(self) -> None:
+        if self._parallel and not self._finished:
+            self._parallel.abort()
+        self._release_buffers()
+        if self._committed:
+            return
+        if not self._file.closed:
+            self._file.close()
+        if self.is_inline:
+            self.inline_data = None
+            return
+        try:
+            os.remove(self.path)
+            logger.info(f"Discarded incomplete upload: {os.path.basename(self.path)}")
+        except FileNotFoundError:
+            pass
+
+
+class EncryptingRequest(Request):
+    """Request class that streams `/upload` file parts into the encryptor."""
+
+    upload_endpoint = 'main.upload_file'
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        if self.endpoint != self.upload_endpoint:
+            return super()._get_file_stream(
+                total_content_length, content_type, filename, content_length
+            )
+        stream = EncryptedUploadStream(
+            Config.UPLOAD_FOLDER,
+            chunk_size=pick_chunk_size(total_content_length),
+            inline_limit=Config.INLINE_STORAGE_MAX_BYTES,
+            workers=parallel_workers(total_content_length),
+        )
+        self.__dict__.setdefault('_upload_streams', []).append(stream)
+        return stream
+
+    def close(self) -> None:
+        # Also reached when parsing aborts (client disconnect, size limit),
+        # in which case the partial stream never made it into `files`.
+        try:
+            super().close()
+        finally:
+            for stream in self.__dict__.get('_upload_streams', ()):
+                stream.close()
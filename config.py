@@ -11,6 +11,14 @@ class Config:
     REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
+    # Unix socket for a co-located Redis (takes precedence over host/port)
+    REDIS_SOCKET_PATH = os.environ.get('REDIS_SOCKET_PATH', '')
+    # Per-process connection pool (app/services/redis_pool.py)
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 20))
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5))
+    REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', 2))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))  # PING idle connections older than this
     ALLOWED_EXTENSIONS = {'pdf', 'txt', 'png', 'jpg', 'jpeg', 'gif','env','md'}
     MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 mb
     REDIS_TTL = 5 * 60 * 60  # 5 hours
@@ -44,7 +52,81 @@ class Config:
             secrets.compare_digest(password, cls.ADMIN_PASSWORD)
         )
 
+    # Plaintext bytes per encrypted frame; recorded in each file's header, so
+    # changing it never affects files already stored.
     CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 64 * 1024))  # 64KB
+    # Pick the frame size from the file size instead (64KB / 256KB / 1MB)
+    CHUNK_SIZE_AUTO = os.environ.get('CHUNK_SIZE_AUTO', 'false').lower() == 'true'
+    # AEAD for new files: chacha20-poly1305 | aes-256-gcm | auto (fastest on this host,
+    # measured at startup). Each file records its cipher, so switching is safe.
+    CIPHER_SUITE = os.environ.get('CIPHER_SUITE', 'chacha20-poly1305').lower()
+    # Seal frames of large files on a thread pool (the AEAD releases the GIL)
+    ENCRYPT_WORKERS = int(os.environ.get('ENCRYPT_WORKERS', min(4, os.cpu_count() or 1)))
+    PARALLEL_ENCRYPT_MIN_BYTES = int(os.environ.get('PARALLEL_ENCRYPT_MIN_BYTES', 8 * 1024 * 1024))  # 8MB
+    # Decrypt downloads from a read-only mmap instead of read() copies
+    DECRYPT_USE_MMAP = os.environ.get('DECRYPT_USE_MMAP', 'false').lower() == 'true'
+    # Chunks decrypted ahead of the socket writer per download (0 = lockstep);
+    # the background thread only pays off with a spare core
+    DOWNLOAD_READ_AHEAD_FRAMES = int(os.environ.get('DOWNLOAD_READ_AHEAD_FRAMES', 4 if (os.cpu_count() or 1) > 1 else 0))
+
+    # The first download leases the file to one client for this long
+    # (renewed every third of it while bytes flow); reconnects presenting the resume secret
+    # continue with Range, others get 409. The file expires with the lease.
+    DOWNLOAD_LEASE_SECONDS = int(os.environ.get('DOWNLOAD_LEASE_SECONDS', 10 * 60))
+
+    # Files up to this size (plaintext bytes) are stored encrypted in Redis
+    # next to their metadata instead of on disk. 0 disables the inline tier.
+    INLINE_STORAGE_MAX_BYTES = int(os.environ.get("INLINE_STORAGE_MAX_BYTES", 16 * 1024))  # 16KB
+
+    # Resumable uploads (create session -> PUT chunks -> finalize)
+    # Chunk size must be a multiple of 64KB and fit in MAX_CONTENT_LENGTH.
+    RESUMABLE_CHUNK_SIZE = int(os.environ.get("RESUMABLE_CHUNK_SIZE", 8 * 1024 * 1024))  # 8MB
+    RESUMABLE_MAX_FILE_SIZE = int(os.environ.get("RESUMABLE_MAX_FILE_SIZE", 4 * 1024 * 1024 * 1024))  # 4GB
+    UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", 6 * 60 * 60))  # 6 hours, refreshed per chunk
+    UPLOAD_CHUNK_LOCK_SECONDS = int(os.environ.get("UPLOAD_CHUNK_LOCK_SECONDS", 10 * 60))  # one writer per chunk
+
+    # Analytics counters are buffered per process and written in one pipeline
+    # every COUNTER_FLUSH_MS; deltas are kept for COUNTER_RETAIN_SECONDS while
+    # Redis is unreachable, then dropped.
+    COUNTER_FLUSH_MS = int(os.environ.get("COUNTER_FLUSH_MS", 1000))
+    COUNTER_MAX_BUFFER = int(os.environ.get("COUNTER_MAX_BUFFER", 100_000))  # increments between flushes
+    COUNTER_RETAIN_SECONDS = int(os.environ.get("COUNTER_RETAIN_SECONDS", 5 * 60))
+    # Each flush also feeds per-minute and per-hour buckets for the dashboard
+    # charts; /stats-json is cached per process for STATS_CACHE_SECONDS.
+    STATS_MINUTE_TTL = int(os.environ.get("STATS_MINUTE_TTL", 2 * 60 * 60))  # 2 hours
+    STATS_HOUR_TTL = int(os.environ.get("STATS_HOUR_TTL", 7 * 24 * 60 * 60))  # 7 days
+    STATS_CACHE_SECONDS = float(os.environ.get("STATS_CACHE_SECONDS", 2))
+    # /stats/stream (SSE): each open stream holds a worker thread, so cap them
+    # per process and close them periodically (EventSource reconnects).
+    STATS_STREAM_MAX_CLIENTS = int(os.environ.get("STATS_STREAM_MAX_CLIENTS", 2))
+    STATS_STREAM_MAX_SECONDS = int(os.environ.get("STATS_STREAM_MAX_SECONDS", 5 * 60))
+    STATS_STREAM_SNAPSHOT_SECONDS = int(os.environ.get("STATS_STREAM_SNAPSHOT_SECONDS", 60))
+    STATS_STREAM_HEARTBEAT_SECONDS = int(os.environ.get("STATS_STREAM_HEARTBEAT_SECONDS", 15))
+
+    # Lifecycle events (upload/download/lock/expire/delete) go to a capped
+    # Redis Stream with each counter flush; `python aggregator.py` rolls
+    # them up into histograms and percentiles for the stats page.
+    EVENTS_STREAM_MAXLEN = int(os.environ.get("EVENTS_STREAM_MAXLEN", 100_000))
+    EVENTS_BATCH_SIZE = int(os.environ.get("EVENTS_BATCH_SIZE", 1000))
+    EVENTS_SUMMARY_SECONDS = int(os.environ.get("EVENTS_SUMMARY_SECONDS", 10))
+    EVENTS_CLAIM_IDLE_MS = int(os.environ.get("EVENTS_CLAIM_IDLE_MS", 60 * 1000))  # reclaim a dead aggregator's batch
+
+    # Unlink a file as soon as its token expires (Redis keyspace notifications;
+    # one subscriber per host holds a lock). The reconciler sweeps the token
+    # registry for events missed while nobody was subscribed.
+    EXPIRY_WATCHER_ENABLED = os.environ.get('EXPIRY_WATCHER_ENABLED', 'true').lower() == 'true'
+    EXPIRY_RECONCILE_SECONDS = int(os.environ.get("EXPIRY_RECONCILE_SECONDS", 5 * 60))
+    EXPIRY_LOCK_SECONDS = int(os.environ.get("EXPIRY_LOCK_SECONDS", 30))
+
+    # Background maintenance (orphan file/metadata reconciliation), run by one
+    # elected process per deployment instead of every worker at boot
+    MAINTENANCE_ENABLED = os.environ.get('MAINTENANCE_ENABLED', 'true').lower() == 'true'
+    MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get("MAINTENANCE_INTERVAL_SECONDS", 15 * 60))
+    MAINTENANCE_BATCH_SIZE = int(os.environ.get("MAINTENANCE_BATCH_SIZE", 500))
+    MAINTENANCE_BATCH_PAUSE = float(os.environ.get("MAINTENANCE_BATCH_PAUSE", 0.05))  # seconds between batches
+    MAINTENANCE_METADATA_BATCHES = int(os.environ.get("MAINTENANCE_METADATA_BATCHES", 20))  # registry slice per run
+    MAINTENANCE_LOCK_SECONDS = int(os.environ.get("MAINTENANCE_LOCK_SECONDS", 60))
+    ORPHAN_GRACE_SECONDS = int(os.environ.get("ORPHAN_GRACE_SECONDS", 5 * 60))  # committed, not yet registered
 
 
 
@@ -53,10 +135,25 @@ class Config:
     ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", 4))
     ARGON2_SALT_LENGTH = int(os.environ.get("ARGON2_SALT_LENGTH", 16))
 
+    # KDF pool: Argon2/bcrypt run on a bounded per-process pool.
+    # Concurrency = min(KDF_MAX_WORKERS, KDF_MEMORY_BUDGET_KIB // ARGON2_MEMORY_COST).
+    # Both limits are per process: the host total is WEB_CONCURRENCY times this.
+    KDF_MAX_WORKERS = int(os.environ.get("KDF_MAX_WORKERS", 2))
+    KDF_MEMORY_BUDGET_KIB = int(os.environ.get("KDF_MEMORY_BUDGET_KIB", 2 * 65536))  # 128 MiB per process
+    KDF_MAX_QUEUE = int(os.environ.get("KDF_MAX_QUEUE", 8))
+    KDF_QUEUE_TIMEOUT = float(os.environ.get("KDF_QUEUE_TIMEOUT", 10))  # seconds
+    KDF_RETRY_AFTER = int(os.environ.get("KDF_RETRY_AFTER", 2))  # seconds, sent with 503
+
 
 
     # rate-limiting :
-    RATELIMIT_STORAGE_URI = f"redis://{os.environ.get('REDIS_HOST', 'localhost')}:{os.environ.get('REDIS_PORT', 6379)}/0"
+    # ots+redis:// shares the Redis pool (app/services/rate_limit.py) so limits
+    # hold across workers; memory:// keeps a separate window per worker.
+    RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", "ots+redis://")
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "moving-window")
+    # Local token buckets reject clients over their limit without asking Redis
+    RATELIMIT_PREFILTER_ENABLED = os.environ.get("RATELIMIT_PREFILTER_ENABLED", "true").lower() == "true"
+    RATELIMIT_PREFILTER_KEYS = int(os.environ.get("RATELIMIT_PREFILTER_KEYS", 50_000))
     RATELIMIT_DEFAULT = "100 per hour"
     RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
 
@@ -0,0 +1,22 @@
+# Gunicorn settings (picked up automatically from the working directory)
+#
+# The app is imported once in the master (preload_app) and forked: create_app
+# does no Redis I/O and background threads start per worker on the first
+# request, so nothing is shared across the fork that should not be.
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+# Each open /stats/stream holds a thread (at most STATS_STREAM_MAX_CLIENTS
+# per worker), so keep headroom for requests
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 120
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything the master imported into the permanent generation so
+    # the workers' collectors never touch (and copy-on-write) those pages
+    gc.freeze()
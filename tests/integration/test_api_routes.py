@@ -3,6 +3,7 @@ import pytest
 from app import create_app
 from config import Config
 import io
+import os
 
 # We need a fixture to create the app context for coverage
 @pytest.fixture
@@ -56,3 +57,340 @@ def test_upload_api(client):
     dl_response = client.get(f'/d/{token}')
     assert dl_response.status_code == 200
     assert b"test content" in dl_response.data
+
+
+def test_protected_upload_roundtrip(client):
+    data = {
+        'file': (io.BytesIO(b"protected content"), 'secret.txt'),
+        'password': 'password123'
+    }
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 201
+    token = response.get_json()['metadata']['token']
+
+    dl_response = client.post(f'/verify/{token}', data={'password': 'password123'})
+    assert dl_response.status_code == 200
+    assert dl_response.data == b"protected content"
+
+
+def test_upload_never_writes_plaintext(client):
+    parts_before = {n for n in os.listdir(Config.UPLOAD_FOLDER) if n.endswith('.part')}
+    payload = b"plaintext marker " * 8192
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 201
+    token = response.get_json()['metadata']['token']
+
+    with open(os.path.join(Config.UPLOAD_FOLDER, token), 'rb') as f:
+        assert b"plaintext marker" not in f.read()
+    assert {n for n in os.listdir(Config.UPLOAD_FOLDER) if n.endswith('.part')} == parts_before
+
+
+def test_truncated_upload_leaves_no_files(client):
+    before = set(os.listdir(Config.UPLOAD_FOLDER))
+    boundary = 'ots-boundary'
+    body = (
+        f'--{boundary}\r\n'
+        'Content-Disposition: form-data; name="file"; filename="cut.txt"\r\n'
+        'Content-Type: text/plain\r\n\r\n'
+    ).encode() + b"x" * 200_000
+    # Announce more bytes than are sent, like a client dropping mid-upload
+    response = client.post(
+        '/upload',
+        input_stream=io.BytesIO(body),
+        content_type=f'multipart/form-data; boundary={boundary}',
+        headers={'Content-Length': str(len(body) + 1_000_000)},
+    )
+    assert response.status_code >= 400
+    assert set(os.listdir(Config.UPLOAD_FOLDER)) == before
+
+
+def test_busy_kdf_pool_leaves_no_files(client, monkeypatch):
+    from app.routes import kdf_pool
+    from app.utils.kdf_pool import KDFPoolBusy
+
+    def busy(*args):
+        raise KDFPoolBusy()
+
+    monkeypatch.setattr(kdf_pool, 'run', busy)
+    before = set(os.listdir(Config.UPLOAD_FOLDER))
+    data = {'file': (io.BytesIO(b"y" * 100_000), 'busy.txt'), 'password': 'password123'}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert set(os.listdir(Config.UPLOAD_FOLDER)) == before
+
+    # A resumable finalize keeps its session and can be retried
+    session = client.post('/upload/sessions', json={'filename': 'busy.txt', 'size': 10}).get_json()
+    session_id = session['session_id']
+    client.put(f'/upload/sessions/{session_id}/chunks/0', data=b"z" * 10, content_type='application/octet-stream')
+    assert client.post(f'/upload/sessions/{session_id}/finalize', json={'password': 'password123'}).status_code == 503
+    monkeypatch.undo()
+    response = client.post(f'/upload/sessions/{session_id}/finalize', json={'password': 'password123'})
+    assert response.status_code == 201
+    token = response.get_json()['metadata']['token']
+    assert client.post(f'/verify/{token}', data={'password': 'password123'}).data == b"z" * 10
+
+
+def test_tiny_upload_stored_inline(client):
+    from app.routes import redis_service
+
+    before = set(os.listdir(Config.UPLOAD_FOLDER))
+    data = {'file': (io.BytesIO(b"API_KEY=abc123\n"), 'app.env'), 'password': ''}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 201
+    metadata = response.get_json()['metadata']
+    token = metadata['token']
+
+    assert metadata['storage'] == 'inline'
+    assert set(os.listdir(Config.UPLOAD_FOLDER)) == before
+    assert redis_service.redis_client.ttl(redis_service.blob_key(token)) > 0
+
+    dl_response = client.get(f'/d/{token}')
+    assert dl_response.data == b"API_KEY=abc123\n"
+    assert not redis_service.redis_client.exists(redis_service.file_key(token), redis_service.blob_key(token))
+
+
+def test_parallel_encrypted_upload_roundtrip(client, monkeypatch):
+    monkeypatch.setattr(Config, 'PARALLEL_ENCRYPT_MIN_BYTES', 64 * 1024)
+    monkeypatch.setattr(Config, 'ENCRYPT_WORKERS', 3)
+    payload = os.urandom(1024 * 1024 + 123)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 201
+    token = response.get_json()['metadata']['token']
+    assert client.get(f'/d/{token}').data == payload
+
+
+def test_read_ahead_download_roundtrip(client, monkeypatch):
+    monkeypatch.setattr(Config, 'DOWNLOAD_READ_AHEAD_FRAMES', 2)
+    payload = os.urandom(512 * 1024 + 5)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': 'password123'}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    token = response.get_json()['metadata']['token']
+    assert client.post(f'/verify/{token}', data={'password': 'password123'}).data == payload
+
+
+def test_head_reports_length_and_keeps_file(client):
+    payload = os.urandom(300 * 1024)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    response = client.head(f'/d/{token}')
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == str(len(payload))
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert client.get(f'/d/{token}').data == payload
+
+
+def test_range_requests_delete_after_full_coverage(client):
+    from app.routes import redis_service
+
+    payload = os.urandom(300 * 1024 + 17)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    first = client.get(f'/d/{token}', headers={'Range': 'bytes=0-99999'})
+    assert first.status_code == 206
+    assert first.headers['Content-Range'] == f'bytes 0-99999/{len(payload)}'
+    assert first.data == payload[:100000]
+    assert redis_service.redis_client.exists(redis_service.file_key(token))
+
+    rest = client.get(f'/d/{token}', headers={'Range': 'bytes=100000-'})
+    assert rest.status_code == 206
+    assert rest.data == payload[100000:]
+    assert not redis_service.redis_client.exists(redis_service.file_key(token))
+
+
+def test_unsatisfiable_range(client):
+    data = {'file': (io.BytesIO(b"short file contents" * 100), 'a.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    response = client.get(f'/d/{token}', headers={'Range': 'bytes=5000-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */1900'
+
+
+def test_interrupted_download_keeps_file(client):
+    from app.routes import redis_service
+
+    payload = os.urandom(600 * 1024)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    response = client.get(f'/d/{token}', buffered=False)
+    next(response.response)
+    response.close()
+    assert redis_service.redis_client.exists(redis_service.file_key(token))
+
+    rest = client.get(f'/d/{token}', headers={'Range': 'bytes=0-'})
+    assert rest.data == payload
+    assert not redis_service.redis_client.exists(redis_service.file_key(token))
+
+
+def test_metadata_responses_hide_keys_and_lease(client):
+    from app.routes import PRIVATE_METADATA_FIELDS
+
+    data = {'file': (io.BytesIO(os.urandom(600 * 1024)), 'big.txt'), 'password': ''}
+    uploaded = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']
+    token = uploaded['token']
+
+    response = client.get(f'/d/{token}', buffered=False)
+    next(response.response)
+    response.close()
+
+    metadata = client.get(f'/verify/{token}').get_json()['metadata']
+    assert metadata['token'] == token
+    assert not PRIVATE_METADATA_FIELDS & (set(uploaded) | set(metadata))
+
+
+def test_long_download_renews_its_lease(client, monkeypatch):
+    import time
+    from app.routes import redis_service
+
+    monkeypatch.setattr(Config, 'DOWNLOAD_LEASE_SECONDS', 2)
+    payload = os.urandom(5 * 64 * 1024)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    # A slow client: the transfer outlives the 2 s lease it was claimed with
+    response = client.get(f'/d/{token}', buffered=False)
+    received, started = [], time.monotonic()
+    for chunk in response.response:
+        received.append(chunk)
+        time.sleep(0.8)
+        assert redis_service.redis_client.exists(redis_service.file_key(token))
+    response.close()
+    assert time.monotonic() - started > 3
+    assert b"".join(received) == payload
+    assert not redis_service.redis_client.exists(redis_service.file_key(token))
+
+
+def test_range_resume_is_not_a_new_download(client, monkeypatch):
+    from app import routes
+
+    payload = os.urandom(300 * 1024)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+    counted = []
+    monkeypatch.setattr(routes.counters, 'incr', lambda name, count=1: counted.append(name))
+
+    client.get(f'/d/{token}', headers={'Range': 'bytes=0-99999'})
+    client.get(f'/d/{token}', headers={'Range': 'bytes=100000-'})
+    assert counted.count("unprotected_downloads") == 1
+
+
+def test_download_lease_blocks_other_clients(client):
+    from app.routes import redis_service
+
+    payload = os.urandom(600 * 1024)
+    data = {'file': (io.BytesIO(payload), 'big.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    response = client.get(f'/d/{token}', buffered=False)
+    secret = response.headers['X-Resume-Secret']
+    next(response.response)
+    response.close()
+    assert 0 < redis_service.redis_client.ttl(redis_service.file_key(token)) <= Config.DOWNLOAD_LEASE_SECONDS
+
+    other = client.application.test_client()
+    busy = other.get(f'/d/{token}')
+    assert busy.status_code == 409
+    assert int(busy.headers['Retry-After']) > 0
+    assert other.get(f'/d/{token}', headers={'X-Resume-Secret': 'guess'}).status_code == 409
+
+    resumed = other.get(f'/d/{token}', headers={'X-Resume-Secret': secret, 'Range': 'bytes=0-'})
+    assert resumed.data == payload
+    assert not redis_service.redis_client.exists(redis_service.file_key(token))
+
+
+def test_protected_lease_rejected_before_password_check(client):
+    data = {'file': (io.BytesIO(os.urandom(300 * 1024)), 'big.txt'), 'password': 'password123'}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    response = client.post(f'/verify/{token}', data={'password': 'password123'}, buffered=False)
+    next(response.response)
+    response.close()
+
+    other = client.application.test_client()
+    assert other.post(f'/verify/{token}', data={'password': 'wrong'}).status_code == 409
+    assert client.post(f'/verify/{token}', data={'password': 'password123'}).status_code == 200
+
+
+def test_wrong_password_counts_attempt(client):
+    data = {'file': (io.BytesIO(b"guarded"), 'secret.txt'), 'password': 'password123'}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+
+    response = client.post(f'/verify/{token}', data={'password': 'wrong-password'})
+    assert response.status_code == 403
+    assert b"4 attempts remaining" in response.data
+
+    response = client.post(f'/verify/{token}', data={'password': 'password123'})
+    assert response.data == b"guarded"
+
+
+def _write_v1_file(path, key, plaintext, chunk_size=64 * 1024):
+    """Version 1 container: no header, 4-byte length prefix per 64KB ChaCha20 frame, nonce kept in Redis."""
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    base_nonce = os.urandom(12)
+    cipher = ChaCha20Poly1305(key)
+    with open(path, 'wb') as f:
+        for num, start in enumerate(range(0, len(plaintext), chunk_size)):
+            nonce = (int.from_bytes(base_nonce, 'big') + num).to_bytes(12, 'big')
+            frame = cipher.encrypt(nonce, plaintext[start:start + chunk_size], None)
+            f.write(len(frame).to_bytes(4, 'big') + frame)
+    return base_nonce
+
+
+def _store_v1_file(token, **fields):
+    from app.routes import redis_service
+    redis_service.store_file_metadata(token, {
+        'token': token, 'filename': token, 'real_filename': 'legacy.txt', 'content_type': 'text/plain',
+        'is_encrypted': 'True', 'attempt_to_unlock': '0', **fields,
+    })
+
+
+def test_legacy_v1_file_download_head_and_range(client):
+    """Headerless v1 files: no length to advertise, so no Content-Length and Range falls back to 200."""
+    import base64
+    import uuid
+    from app.routes import redis_service
+    from app.utils.encryption_utils import generate_key
+
+    payload = os.urandom(150 * 1024 + 7)  # three frames, the last one short
+    key = generate_key()
+    token = f"{uuid.uuid4()}.txt"
+    nonce = _write_v1_file(os.path.join(Config.UPLOAD_FOLDER, token), key, payload)
+    _store_v1_file(token, password_hash='', is_protected='False', encryption_key=base64.b64encode(key).decode(),
+                   encryption_nonce=nonce.hex())
+
+    head = client.head(f'/d/{token}')
+    assert head.status_code == 200
+    assert head.headers['Accept-Ranges'] == 'none'
+    assert 'Content-Length' not in head.headers
+    assert redis_service.redis_client.exists(redis_service.file_key(token))
+
+    response = client.get(f'/d/{token}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 200
+    assert 'Content-Range' not in response.headers
+    assert response.data == payload
+    assert not redis_service.redis_client.exists(redis_service.file_key(token))
+
+
+def test_legacy_bcrypt_protected_file(client):
+    """Files from before key wrapping: bcrypt verifier + key derived directly from the password."""
+    import uuid
+    from app.utils.password_utils import PasswordUtils
+    from app.utils.encryption_utils import derive_key_from_password, generate_salt
+
+    token = f"{uuid.uuid4()}.txt"
+    salt = generate_salt()
+    nonce = _write_v1_file(os.path.join(Config.UPLOAD_FOLDER, token),
+                           derive_key_from_password("password123", salt), b"legacy secret")
+    _store_v1_file(token, password_hash=PasswordUtils.hash_password("password123"), is_protected='True',
+                   encryption_salt=salt.hex(), encryption_nonce=nonce.hex())
+
+    assert client.post(f'/verify/{token}', data={'password': 'nope-nope'}).status_code == 403
+    response = client.post(f'/verify/{token}', data={'password': 'password123'})
+    assert response.data == b"legacy secret"
+    assert 'Content-Length' not in response.headers
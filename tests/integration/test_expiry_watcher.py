@@ -0,0 +1,93 @@
+"""
+Expired tokens: the keyspace-notification watcher unlinks files right away,
+one process per host leads, and the reconciler catches missed events.
+"""
+import io
+import os
+import time
+import threading
+import pytest
+from app import create_app
+from app.services import expiry_watcher
+from app.services.expiry_watcher import ExpiryWatcher
+from config import Config
+
+
+@pytest.fixture
+def client():
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+
+
+def upload(client):
+    data = {'file': (io.BytesIO(b"x" * 50_000), 'a.txt'), 'password': ''}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    return response.get_json()['metadata']['token']
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_expired_token_is_unlinked_by_the_leader(client, monkeypatch):
+    from app.routes import redis_service
+
+    monkeypatch.setattr(Config, "EXPIRY_LOCK_SECONDS", 3)
+    stop = threading.Event()
+    leader = ExpiryWatcher(redis_service, host="test-host")
+    follower = ExpiryWatcher(redis_service, host="test-host")
+    threads = [threading.Thread(target=w.run, args=(stop,), daemon=True) for w in (leader, follower)]
+    threads[0].start()
+    assert wait_for(lambda: leader.leading)
+    threads[1].start()
+    try:
+        token = upload(client)
+        path = os.path.join(Config.UPLOAD_FOLDER, token)
+        assert os.path.exists(path)
+        redis_service.redis_client.pexpire(redis_service.file_key(token), 50)
+
+        assert wait_for(lambda: not os.path.exists(path))
+        assert redis_service.redis_client.zscore(redis_service.REGISTRY_KEY, token) is None
+        assert not follower.leading
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(5)
+
+    stats = leader.stats()
+    assert stats["unlinked"] >= 1
+    assert stats["lag_ms_p50"] is not None
+
+
+def test_reconciler_removes_files_of_missed_events(client):
+    from app.routes import redis_service
+
+    token = upload(client)
+    # Expired while no watcher was subscribed: hash gone, registry entry stale
+    redis_service.redis_client.delete(redis_service.file_key(token))
+    redis_service.redis_client.zadd(redis_service.REGISTRY_KEY, {token: time.time() - 1})
+
+    watcher = ExpiryWatcher(redis_service)
+    assert watcher.reconcile() >= 1
+    assert not os.path.exists(os.path.join(Config.UPLOAD_FOLDER, token))
+    assert watcher.stats()["last_reconcile"] is not None
+
+
+def test_watcher_ignores_other_keys(client):
+    from app.routes import redis_service
+
+    assert not ExpiryWatcher(redis_service).handle_expired("ots:upload:abc")
+    assert expiry_watcher.start_watcher(redis_service)
+    assert not expiry_watcher.start_watcher(redis_service)
+    expiry_watcher.stop_watcher()
@@ -0,0 +1,134 @@
+"""
+Lifecycle events: routes record compact, token-free records through the
+counter buffer; the aggregator bins them with NumPy and acknowledges each
+batch exactly once.
+"""
+import io
+import json
+import threading
+import numpy as np
+import pytest
+import redis
+from app import create_app
+from app.services import event_aggregator, lifecycle_events
+from app.services.counter_buffer import CounterBuffer, counters
+from app.services.event_aggregator import EventAggregator
+
+# The Config these modules actually read (test_encryption swaps config.Config)
+Config = event_aggregator.Config
+
+
+@pytest.fixture
+def client():
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+
+
+@pytest.fixture
+def scratch():
+    r = redis.Redis(host="localhost", port=6379, db=14, decode_responses=True)
+    r.flushdb()
+    yield r
+    r.flushdb()
+
+
+def record(r, *events):
+    buffer = CounterBuffer(r)
+    buffer._start = lambda: None  # flush by hand
+    for kind, token, fields in events:
+        buffer.event(kind, token, **fields)
+    buffer.flush()
+
+
+def read_batch(r, aggregator, count=10_000):
+    aggregator._ensure_group()
+    response = r.xreadgroup(lifecycle_events.GROUP, "test", {lifecycle_events.STREAM_KEY: ">"}, count=count)
+    return response[0][1] if response else []
+
+
+def test_upload_and_download_are_recorded_without_tokens(client):
+    from app.routes import redis_service
+
+    counters.flush()
+    data = {'file': (io.BytesIO(b"x" * 1000), 'a.txt'), 'password': ''}
+    token = client.post('/upload', data=data, content_type='multipart/form-data').get_json()['metadata']['token']
+    client.get(f'/d/{token}').get_data()
+    counters.flush()
+
+    entries = redis_service.redis_client.xrevrange(lifecycle_events.STREAM_KEY, count=3)
+    records = {fields["e"]: fields for _, fields in reversed(entries)}
+    assert set(records) == {"upload", "download", "delete"}
+    assert records["upload"]["s"] == "1000"
+    assert records["upload"]["p"] == "0"
+    assert records["upload"]["st"] == "i"
+    assert records["download"]["h"] == lifecycle_events.token_hash(token)
+    assert float(records["download"]["age"]) >= 0
+    assert float(records["download"]["dur"]) >= 0
+    assert not any(token in json.dumps(fields) for fields in records.values())
+
+
+def test_percentiles_match_numpy_within_a_bin(scratch):
+    rng = np.random.default_rng(7)
+    sizes = rng.lognormal(mean=12, sigma=2, size=2000)
+    ages = rng.lognormal(mean=10, sigma=1, size=2000)
+    record(scratch, *[("upload", f"t{i}", {"s": int(s), "p": i % 4 == 0}) for i, s in enumerate(sizes)])
+    record(scratch, *[("download", f"t{i}", {"s": 1, "age": a, "dur": 5}) for i, a in enumerate(ages)])
+
+    aggregator = EventAggregator(scratch)
+    assert aggregator.aggregate(read_batch(scratch, aggregator)) == 4000
+    rollup = aggregator.summarize()
+
+    assert rollup["counts"] == {"upload": 2000, "upload:protected": 500, "download": 2000}
+    bin_ratio = 2 ** (1 / event_aggregator.BINS_PER_OCTAVE)
+    for metric, values in (("upload_size", sizes.astype(int)), ("time_to_download", ages)):
+        summary = rollup["metrics"][metric]
+        assert summary["count"] == 2000
+        assert sum(n for _, _, n in summary["histogram"]) == 2000
+        for q in (50, 95, 99):
+            exact = np.percentile(values, q)
+            assert exact / bin_ratio <= summary[f"p{q}"] <= exact * bin_ratio
+    assert lifecycle_events.summary(scratch)["metrics"]["upload_size"]["count"] == 2000
+
+
+def test_batches_are_acknowledged_once(scratch):
+    record(scratch, ("lock", "a", {"p": True}), ("expire", "b", {}))
+    aggregator = EventAggregator(scratch)
+    aggregator.aggregate(read_batch(scratch, aggregator))
+
+    assert read_batch(scratch, aggregator) == []
+    assert scratch.xpending(lifecycle_events.STREAM_KEY, lifecycle_events.GROUP)["pending"] == 0
+    assert scratch.hgetall(event_aggregator.COUNTS_KEY) == {"lock": "1", "lock:protected": "1", "expire": "1"}
+
+
+def test_run_consumes_until_stopped(scratch, monkeypatch):
+    monkeypatch.setattr(Config, "EVENTS_SUMMARY_SECONDS", 0)
+    record(scratch, *[("upload", f"t{i}", {"s": 100}) for i in range(50)])
+    stop = threading.Event()
+    aggregator = EventAggregator(scratch)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(aggregator.run(stop, block_ms=100)))
+    thread.start()
+    try:
+        for _ in range(100):
+            if scratch.exists(lifecycle_events.SUMMARY_KEY):
+                break
+            threading.Event().wait(0.05)
+    finally:
+        stop.set()
+        thread.join(5)
+    assert result == [50]
+    summary = lifecycle_events.summary(scratch)
+    assert summary["counts"]["upload"] == 50
+    assert summary["aggregator_pending"] == 0
+    assert summary["stream_length"] == 50
+
+
+def test_summary_before_any_event(scratch):
+    assert lifecycle_events.summary(scratch) == {
+        "stream_length": 0, "aggregator_pending": None, "updated": None, "counts": {}, "metrics": {}}
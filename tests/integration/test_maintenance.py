@@ -0,0 +1,133 @@
+"""
+Maintenance scheduler: one elected leader runs bounded reconciliation
+batches on a schedule and records status for the dashboard.
+"""
+import io
+import os
+import time
+import uuid
+import threading
+import pytest
+from app import create_app
+from app.services import maintenance
+from app.services.maintenance import MaintenanceScheduler
+from config import Config
+
+
+@pytest.fixture
+def client():
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+
+
+@pytest.fixture
+def clean_state(client):
+    from app.routes import redis_service
+    redis_service.redis_client.delete(maintenance.STATUS_KEY, maintenance.METADATA_CURSOR_KEY, maintenance.LOCK_KEY)
+    yield redis_service
+    redis_service.redis_client.delete(maintenance.STATUS_KEY, maintenance.METADATA_CURSOR_KEY, maintenance.LOCK_KEY)
+
+
+def test_run_once_reconciles_and_records_status(clean_state, monkeypatch):
+    redis_service = clean_state
+    monkeypatch.setattr(Config, "MAINTENANCE_METADATA_BATCHES", 1)
+    monkeypatch.setattr(Config, "MAINTENANCE_BATCH_SIZE", 2)
+    monkeypatch.setattr(Config, "ORPHAN_GRACE_SECONDS", 0)
+
+    orphan = os.path.join(Config.UPLOAD_FOLDER, f"{uuid.uuid4()}.txt")
+    with open(orphan, 'wb') as f:
+        f.write(b"orphan")
+    paced = []
+
+    results = MaintenanceScheduler(redis_service).run_once(lambda: paced.append(1))
+    assert not os.path.exists(orphan)
+    assert results["orphan_files"]["ok"] and results["orphan_metadata"]["ok"]
+    # The registry cursor is kept for the next run (0: the walk completed)
+    cursor = results["orphan_metadata"]["result"]["cursor"]
+    assert redis_service.redis_client.get(maintenance.METADATA_CURSOR_KEY) == str(cursor)
+
+    status = MaintenanceScheduler(redis_service).status()
+    assert status["next_run"] - status["last_run"] == Config.MAINTENANCE_INTERVAL_SECONDS
+    assert status["tasks"]["orphan_files"]["result"]["deleted_count"] >= 1
+
+
+def test_single_leader_runs_on_schedule(clean_state, client, monkeypatch):
+    redis_service = clean_state
+    monkeypatch.setattr(Config, "MAINTENANCE_LOCK_SECONDS", 3)
+    stop = threading.Event()
+    schedulers = [MaintenanceScheduler(redis_service) for _ in range(2)]
+    schedulers[1].name = "other-process"
+    threads = [threading.Thread(target=s.run, args=(stop,), daemon=True) for s in schedulers]
+    for thread in threads:
+        thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not redis_service.redis_client.hget(maintenance.STATUS_KEY, "last_run"):
+            time.sleep(0.05)
+        assert sum(s.leading for s in schedulers) == 1
+        first_run = redis_service.redis_client.hget(maintenance.STATUS_KEY, "last_run")
+        assert first_run is not None
+        time.sleep(0.5)
+        # Not due again until the interval has passed
+        assert redis_service.redis_client.hget(maintenance.STATUS_KEY, "last_run") == first_run
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(5)
+
+    Config.ADMIN_PASSWORD = "testpassword"
+    token = client.post('/admin/api/token', json={'username': Config.ADMIN_USERNAME, 'password': 'testpassword'})
+    response = client.get('/stats/maintenance', headers={'Authorization': f"Bearer {token.get_json()['access_token']}"})
+    assert response.status_code == 200
+    assert set(response.get_json()["tasks"]) == {"orphan_files", "orphan_metadata"}
+
+
+def test_create_app_does_no_redis_io(monkeypatch):
+    from redis.connection import Connection
+    sent = []
+    monkeypatch.setattr(Connection, "send_packed_command", lambda self, *a, **k: sent.append(a))
+    create_app()
+    assert sent == []
+
+
+def test_ots_maintenance_cli(client):
+    from app.routes import redis_service
+
+    redis_service.set_counter("uploads", 7)
+    runner = client.application.test_cli_runner()
+    result = runner.invoke(args=["ots-maintenance", "--skip-cleanup"])
+    assert result.exit_code == 0, result.output
+    assert "Lua scripts loaded" in result.output
+    assert redis_service.get_counter("uploads") == 0
+
+    redis_service.set_counter("uploads", 7)
+    result = runner.invoke(args=["ots-maintenance", "--keep-counters"])
+    assert result.exit_code == 0, result.output
+    assert "File cleanup" in result.output
+    assert redis_service.get_counter("uploads") == 7
+
+
+def test_lost_lock_stops_the_pass(clean_state, monkeypatch):
+    import redis
+    redis_service = clean_state
+    monkeypatch.setattr(Config, "MAINTENANCE_BATCH_SIZE", 1)
+    monkeypatch.setattr(Config, "ORPHAN_GRACE_SECONDS", 0)
+    for _ in range(3):
+        with open(os.path.join(Config.UPLOAD_FOLDER, f"{uuid.uuid4()}.txt"), 'wb') as f:
+            f.write(b"orphan")
+
+    def lost():
+        raise redis.exceptions.LockNotOwnedError("another process took over")
+
+    metadata_walked = []
+    monkeypatch.setattr(redis_service, "cleanup_orphan_metadata", lambda *a, **k: metadata_walked.append(1))
+    with pytest.raises(redis.exceptions.LockError):
+        MaintenanceScheduler(redis_service).run_once(lost)
+    assert metadata_walked == []  # the next task never ran
+    assert not redis_service.redis_client.exists(maintenance.STATUS_KEY)
@@ -0,0 +1,116 @@
+"""
+Shared rate limiting: windows in Redis hold across workers, and the local
+pre-filter answers clients that are certainly over the limit without a
+round trip (but never rejects one within its limit).
+"""
+from types import SimpleNamespace
+import pytest
+import redis
+from limits import parse
+from limits.strategies import MovingWindowRateLimiter
+from app import create_app
+from app.services import rate_limit
+from app.services.redis_pool import unlink_matching
+
+# The Config rate_limit actually reads (test_encryption swaps config.Config)
+Config = rate_limit.Config
+
+
+@pytest.fixture
+def r():
+    r = redis.Redis(host="localhost", port=6379, decode_responses=True)
+    unlink_matching(r, f"{rate_limit.KEY_PREFIX}*")
+    rate_limit.prefilter.clear()
+    yield r
+    unlink_matching(r, f"{rate_limit.KEY_PREFIX}*")
+    rate_limit.prefilter.clear()
+
+
+@pytest.fixture
+def client(r):
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = True
+    Config.WTF_CSRF_ENABLED = False
+
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+    Config.RATELIMIT_ENABLED = False
+
+
+def test_limit_is_shared_between_workers(r, monkeypatch):
+    storage = rate_limit.SharedRedisStorage()
+    limiter = MovingWindowRateLimiter(storage)
+    limit = parse("5/minute")
+    workers = [rate_limit.LocalPrefilter(), rate_limit.LocalPrefilter()]
+
+    results = []
+    for i in range(8):
+        monkeypatch.setattr(rate_limit, "prefilter", workers[i % 2])  # round-robin like gunicorn
+        results.append(limiter.hit(limit, "client-a"))
+    assert results == [True] * 5 + [False] * 3
+    assert limiter.get_window_stats(limit, "client-a").remaining == 0
+    assert limiter.hit(limit, "client-b")  # other clients unaffected
+
+
+def test_refused_client_is_answered_locally(r, monkeypatch):
+    storage = rate_limit.SharedRedisStorage()
+    limiter = MovingWindowRateLimiter(storage)
+    limit = parse("3/minute")
+    for _ in range(3):
+        assert limiter.hit(limit, "client-a")
+    assert not limiter.hit(limit, "client-a")  # this worker's bucket is empty
+    assert rate_limit.prefilter.redis_calls == 3
+
+    # Another worker has a full bucket: Redis refuses once, then it knows
+    other = rate_limit.LocalPrefilter()
+    monkeypatch.setattr(rate_limit, "prefilter", other)
+    for _ in range(100):
+        assert not limiter.hit(limit, "client-a")
+    assert other.redis_calls == 1
+    assert other.redis_rejections == 1
+    assert other.local_rejections == 99
+
+
+def test_bucket_never_rejects_a_client_within_its_limit(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    prefilter = rate_limit.LocalPrefilter()
+
+    # A full burst, then exactly one hit per emission interval, for a while
+    assert all(prefilter.allow("k", 10, 60) for _ in range(10))
+    for _ in range(100):
+        clock[0] += 6
+        assert prefilter.allow("k", 10, 60)
+    # Hammering drains the bucket
+    assert not all(prefilter.allow("k", 10, 60) for _ in range(5))
+
+
+def test_refused_hit_gives_its_tokens_back(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    prefilter = rate_limit.LocalPrefilter()
+
+    # Other workers filled the shared window; Redis refuses this worker's hit
+    assert prefilter.allow("k", 3, 60)
+    prefilter.block("k", 1)
+    assert not prefilter.allow("k", 3, 60)
+    # Once the window has room the refused hit has cost this worker nothing
+    clock[0] += 1
+    assert all(prefilter.allow("k", 3, 60) for _ in range(3))
+
+
+def test_prefilter_is_bounded():
+    prefilter = rate_limit.LocalPrefilter(max_keys=100)
+    for i in range(1000):
+        prefilter.allow(f"client-{i}", 5, 60)
+    assert prefilter.stats()["keys"] == 100
+
+
+def test_routes_share_limits_through_redis(client, r):
+    statuses = [client.post('/upload/sessions/missing/finalize', headers={'Accept': 'application/json'}).status_code
+                for _ in range(12)]
+    assert 429 not in statuses[:10]
+    assert statuses[10:] == [429, 429]
+    assert any(r.scan_iter(f"{rate_limit.KEY_PREFIX}*"))
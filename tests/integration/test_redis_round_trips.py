@@ -0,0 +1,147 @@
+"""
+Redis round trips per endpoint: each state transition is one EVALSHA, and
+analytics counters add none (they are buffered and flushed in the background).
+"""
+import io
+import threading
+import pytest
+from redis.connection import Connection
+from app import create_app
+from config import Config
+
+
+@pytest.fixture
+def client():
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    """Commands sent to Redis (a pipeline or script call is one entry)."""
+    from app.routes import redis_service
+
+    redis_service.redis_client.ping()  # connection handshake happens here, not in a route
+    redis_service.load_scripts()  # as `flask ots-maintenance` does; no NOSCRIPT retry in a route
+    sent = []
+    send = Connection.send_packed_command
+
+    request_thread = threading.get_ident()
+
+    def counting(self, command, check_health=True):
+        # Background threads (counter flushes, watchers) are not the request path
+        if threading.get_ident() == request_thread:
+            packed = command if isinstance(command, bytes) else b"".join(command)
+            sent.append(packed.split(b"\r\n")[2].decode())
+        return send(self, command, check_health)
+
+    monkeypatch.setattr(Connection, "send_packed_command", counting)
+    return sent
+
+
+def call(sent, request):
+    sent.clear()
+    response = request()
+    response.get_data()  # run the streaming body (CONSUME happens at the end)
+    return response, list(sent)
+
+
+def upload(client, payload, password=''):
+    data = {'file': (io.BytesIO(payload), 'a.txt'), 'password': password}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    return response.get_json()['metadata']['token']
+
+
+def test_upload_is_one_script_call(client, round_trips):
+    for payload in (b"tiny", b"x" * 50_000):
+        response, sent = call(round_trips, lambda: client.post(
+            '/upload', data={'file': (io.BytesIO(payload), 'a.txt'), 'password': ''},
+            content_type='multipart/form-data'))
+        assert response.status_code == 201
+        assert sent == ["EVALSHA"]
+
+
+def test_unprotected_download_round_trips(client, round_trips):
+    token = upload(client, b"x" * 50_000)
+
+    response, sent = call(round_trips, lambda: client.head(f'/d/{token}'))
+    assert response.status_code == 200
+    assert sent == ["EVALSHA"]
+
+    # OPEN (lookup + lease) and CONSUME (delivery + delete)
+    response, sent = call(round_trips, lambda: client.get(f'/d/{token}'))
+    assert response.status_code == 200
+    assert sent == ["EVALSHA", "EVALSHA"]
+
+    response, sent = call(round_trips, lambda: client.get(f'/d/{token}'))
+    assert response.status_code == 410
+    assert sent == ["EVALSHA"]
+
+
+def test_protected_download_round_trips(client, round_trips):
+    token = upload(client, b"x" * 50_000, password='password123')
+
+    response, sent = call(round_trips, lambda: client.get(f'/d/{token}'))
+    assert response.status_code == 200
+    assert sent == ["EVALSHA"]
+
+    # peek + ATTEMPT
+    response, sent = call(round_trips, lambda: client.post(f'/verify/{token}', data={'password': 'wrong'}))
+    assert response.status_code == 403
+    assert sent == ["EVALSHA", "EVALSHA"]
+
+    # peek + OPEN(unlock) + CONSUME
+    response, sent = call(round_trips, lambda: client.post(f'/verify/{token}', data={'password': 'password123'}))
+    assert response.status_code == 200
+    assert sent == ["EVALSHA", "EVALSHA", "EVALSHA"]
+
+
+def test_attempts_lock_without_passing_max(client):
+    from app.routes import redis_service
+
+    token = upload(client, b"guarded", password='password123')
+    for _ in range(Config.MAX_RETRIES):
+        client.post(f'/verify/{token}', data={'password': 'wrong'})
+    assert redis_service.record_failed_attempt(token) == (Config.MAX_RETRIES, True)
+    assert client.post(f'/verify/{token}', data={'password': 'password123'}).status_code == 403
+    assert redis_service.record_failed_attempt("no-such-token") == (-1, False)
+
+
+def test_analytics_counters_are_off_the_request_path(client, round_trips):
+    from app.services.counter_buffer import counters
+    from app.routes import redis_service
+
+    counters.flush()
+    before = redis_service.get_counter("index_visits")
+    response, sent = call(round_trips, lambda: client.get('/'))
+    assert response.status_code == 200
+    assert sent == []
+
+    counters.flush()
+    assert redis_service.get_counter("index_visits") == before + 1
+
+
+def test_stats_json_is_one_pipeline_then_cached(client, round_trips, monkeypatch):
+    from app.services import stats
+
+    monkeypatch.setattr(stats.Config, "STATS_CACHE_SECONDS", 60)
+    stats.stats_cache.clear()
+    response, sent = call(round_trips, lambda: client.get('/stats-json'))
+    assert response.status_code == 200
+    assert len(sent) == 1  # MGET + bucket HGETALLs + PFCOUNTs in one pipeline
+    etag = response.headers['ETag']
+
+    response, sent = call(round_trips, lambda: client.get('/stats-json'))
+    assert sent == []
+    assert response.headers['ETag'] == etag
+
+    response, sent = call(round_trips, lambda: client.get('/stats-json', headers={'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.data == b''
+    assert sent == []
@@ -0,0 +1,95 @@
+import pytest
+from app import create_app
+from config import Config
+import os
+
+
+@pytest.fixture
+def client():
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+    original_chunk_size = Config.RESUMABLE_CHUNK_SIZE
+    Config.RESUMABLE_CHUNK_SIZE = 64 * 1024
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+    Config.RESUMABLE_CHUNK_SIZE = original_chunk_size
+
+
+def _create_session(client, size):
+    response = client.post('/upload/sessions', json={'filename': 'big.txt', 'size': size})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def _put_chunk(client, session_id, index, data):
+    return client.put(
+        f'/upload/sessions/{session_id}/chunks/{index}',
+        data=data,
+        content_type='application/octet-stream',
+    )
+
+
+def test_resumable_upload_out_of_order(client):
+    payload = os.urandom(2 * 64 * 1024 + 100)
+    session = _create_session(client, len(payload))
+    assert session['chunk_count'] == 3
+    session_id, chunk_size = session['session_id'], session['chunk_size']
+
+    for index in (2, 0):
+        chunk = payload[index * chunk_size:(index + 1) * chunk_size]
+        assert _put_chunk(client, session_id, index, chunk).status_code == 200
+
+    status = client.get(f'/upload/sessions/{session_id}').get_json()
+    assert status['received'] == [0, 2]
+
+    response = client.post(f'/upload/sessions/{session_id}/finalize', json={})
+    assert response.status_code == 409
+    assert response.get_json()['missing'] == [1]
+
+    assert _put_chunk(client, session_id, 1, payload[chunk_size:2 * chunk_size]).status_code == 200
+    response = client.post(f'/upload/sessions/{session_id}/finalize', json={'password': 'password123'})
+    assert response.status_code == 201
+    token = response.get_json()['metadata']['token']
+
+    # Session is consumed
+    assert client.get(f'/upload/sessions/{session_id}').status_code == 404
+
+    dl_response = client.post(f'/verify/{token}', data={'password': 'password123'})
+    assert dl_response.data == payload
+
+
+def test_resumable_chunk_length_checked(client):
+    session = _create_session(client, 1000)
+    response = _put_chunk(client, session['session_id'], 0, b"x" * 999)
+    assert response.status_code == 400
+    response = _put_chunk(client, session['session_id'], 0, b"x" * 1001)
+    assert response.status_code == 400
+    assert client.get(f"/upload/sessions/{session['session_id']}").get_json()['received'] == []
+
+
+def test_resumable_rejects_bad_extension(client):
+    response = client.post('/upload/sessions', json={'filename': 'run.exe', 'size': 10})
+    assert response.status_code == 400
+
+
+def test_resumable_retry_must_repeat_the_same_bytes(client):
+    payload = os.urandom(64 * 1024 + 100)
+    session = _create_session(client, len(payload))
+    session_id, chunk_size = session['session_id'], session['chunk_size']
+    first = payload[:chunk_size]
+
+    assert _put_chunk(client, session_id, 0, first).status_code == 200
+    assert _put_chunk(client, session_id, 0, first).status_code == 200  # same bytes: idempotent
+    response = _put_chunk(client, session_id, 0, os.urandom(chunk_size))
+    assert response.status_code == 409  # would reuse the chunk's nonces
+
+    # A chunk cut short after some frames were written can still be completed
+    last = payload[chunk_size:]
+    assert _put_chunk(client, session_id, 1, last + b"extra").status_code == 400
+    assert _put_chunk(client, session_id, 1, last).status_code == 200
+
+    token = client.post(f'/upload/sessions/{session_id}/finalize', json={}).get_json()['metadata']['token']
+    assert client.get(f'/d/{token}').data == payload
@@ -0,0 +1,105 @@
+"""
+Time-bucketed stats: counter flushes feed per-minute/per-hour buckets and
+the visitor HyperLogLog, and read_stats returns them in one snapshot.
+"""
+import re
+import time
+import inspect
+
+import pytest
+import redis
+
+from app import routes
+from app.services import stats
+from app.services.counter_buffer import CounterBuffer
+from app.services.redis_service import RedisService
+
+# The Config stats actually reads (test_encryption swaps config.Config)
+Config = stats.Config
+
+
+@pytest.fixture
+def client():
+    client = redis.Redis(host="localhost", port=6379, db=14, decode_responses=True)
+    client.flushdb()
+    yield client
+    client.flushdb()
+
+
+def buffer_for(client, monkeypatch):
+    buffer = CounterBuffer(client)
+    monkeypatch.setattr(buffer, "_start", lambda: None)  # flush by hand
+    return buffer
+
+
+def test_flush_fills_minute_and_hour_buckets(client, monkeypatch):
+    buffer = buffer_for(client, monkeypatch)
+    for _ in range(3):
+        buffer.incr("uploads")
+    buffer.incr("downloads", 2)
+    buffer.flush()
+
+    now = time.time()
+    minute = stats.minute_key(stats.bucket_start(now, 60))
+    hour = stats.hour_key(stats.bucket_start(now, 3600))
+    assert client.hgetall(minute) == {"uploads": "3", "downloads": "2"}
+    assert client.hgetall(hour) == {"uploads": "3", "downloads": "2"}
+    assert 0 < client.ttl(minute) <= Config.STATS_MINUTE_TTL
+    assert 0 < client.ttl(hour) <= Config.STATS_HOUR_TTL
+    assert client.get(RedisService.counter_key("uploads")) == "3"
+
+
+def test_unique_visitors_without_storing_addresses(client, monkeypatch):
+    buffer = buffer_for(client, monkeypatch)
+    for i in range(500):
+        buffer.visit(f"10.0.{i % 250}.1")  # 250 distinct, each seen twice
+    buffer.flush()
+
+    snapshot = stats.read_stats(client)
+    assert abs(snapshot["unique_visitors"] - 250) <= 10
+    assert snapshot["unique_visitors_today"] == snapshot["unique_visitors"]
+    assert client.type(stats.VISITORS_KEY) == "string"  # HLL, no set of IPs
+    assert not any("10.0." in key for key in client.keys("*"))
+
+
+def test_read_stats_series(client, monkeypatch):
+    buffer = buffer_for(client, monkeypatch)
+    now = time.time()
+    pipeline = client.pipeline()
+    stats.add_buckets(pipeline, {"uploads": 4}, (), now=now - 120)  # two minutes ago
+    pipeline.execute()
+    buffer.incr("uploads")
+    buffer.flush()
+
+    snapshot = stats.read_stats(client, now=now)
+    minutes = snapshot["per_minute"]
+    assert len(minutes) == stats.SERIES_MINUTES
+    assert len(snapshot["per_hour"]) == stats.SERIES_HOURS
+    assert [m["t"] for m in minutes] == sorted(m["t"] for m in minutes)
+    assert minutes[-1]["uploads"] == 1
+    assert minutes[-3]["uploads"] == 4
+    assert sum(h["uploads"] for h in snapshot["per_hour"]) == 5
+    assert snapshot["uploads"] == 1  # totals only count real flushes
+    assert set(stats.STATS_COUNTERS) <= set(snapshot)
+
+
+def test_every_route_counter_is_reported():
+    incremented = set(re.findall(r'counters\.incr\("(\w+)"', inspect.getsource(routes)))
+    assert incremented and incremented <= set(stats.STATS_COUNTERS)
+
+
+def test_cache_reads_redis_once_per_interval(client, monkeypatch):
+    cache = stats.StatsCache()
+    reads = []
+    read = stats.read_stats
+    monkeypatch.setattr(stats, "read_stats", lambda c: reads.append(1) or read(c))
+    monkeypatch.setattr(Config, "STATS_CACHE_SECONDS", 60)
+
+    _, body, etag = cache.get(client)
+    assert cache.get(client)[2] == etag
+    assert len(reads) == 1
+
+    client.incr(RedisService.counter_key("uploads"))
+    cache.clear()
+    assert cache.get(client)[2] != etag
+    assert len(reads) == 2
@@ -0,0 +1,123 @@
+"""
+/stats/stream: one Redis subscription per process fans counter deltas out
+to every open stream.
+"""
+import json
+import time
+import pytest
+import redis
+from app import create_app
+from app.services import stats_stream
+from app.services.counter_buffer import CounterBuffer
+from app.services.stats import EVENTS_CHANNEL
+
+# The Config stats_stream actually reads (test_encryption swaps config.Config)
+Config = stats_stream.Config
+
+
+@pytest.fixture
+def client():
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+
+
+@pytest.fixture
+def admin_headers(client):
+    Config.ADMIN_PASSWORD = "testpassword"
+    response = client.post('/admin/api/token', json={'username': Config.ADMIN_USERNAME, 'password': 'testpassword'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+@pytest.fixture
+def r():
+    return redis.Redis(host="localhost", port=6379, decode_responses=True)
+
+
+def subscriptions(r):
+    return dict(r.pubsub_numsub(EVENTS_CHANNEL))[EVENTS_CHANNEL]
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def flush(r, **deltas):
+    buffer = CounterBuffer(r)
+    buffer._start = lambda: None  # flush by hand
+    for name, count in deltas.items():
+        buffer.incr(name, count)
+    buffer.flush()
+
+
+def test_many_streams_share_one_subscription(r, monkeypatch):
+    monkeypatch.setattr(Config, "STATS_STREAM_MAX_CLIENTS", 10)
+    hub = stats_stream.StatsHub(r)
+    subscribers = [hub.subscribe() for _ in range(10)]
+    assert wait_for(lambda: subscriptions(r) == 1)
+
+    flush(r, uploads=2)
+    for subscriber in subscribers:
+        message = subscriber.get(timeout=2)
+        assert message["deltas"] == {"uploads": 2}
+        assert message["t"] % 60 == 0
+
+    # Nobody watching: the subscription goes away
+    for subscriber in subscribers:
+        hub.unsubscribe(subscriber)
+    assert wait_for(lambda: subscriptions(r) == 0)
+    assert not hub.stats()["subscribed"]
+
+
+def test_slow_stream_is_resynced_and_cap_enforced(r, monkeypatch):
+    monkeypatch.setattr(Config, "STATS_STREAM_MAX_CLIENTS", 1)
+    hub = stats_stream.StatsHub(r)
+    subscriber = hub.subscribe()
+    with pytest.raises(stats_stream.StreamsFull):
+        hub.subscribe()
+
+    for _ in range(stats_stream.QUEUE_SIZE + 1):
+        hub.publish({"t": 0, "deltas": {"uploads": 1}})
+    assert subscriber.get_nowait() is stats_stream.RESYNC
+    assert subscriber.empty()
+    assert hub.stats()["resyncs"] == 1
+    hub.unsubscribe(subscriber)
+
+
+def test_stream_sends_snapshot_then_deltas(client, admin_headers, r):
+    response = client.get('/stats/stream', headers=admin_headers, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    try:
+        first = next(chunks)
+        first = first.decode() if isinstance(first, bytes) else first
+        assert first.startswith("retry: ")
+        assert "event: snapshot" in first
+        snapshot = json.loads(first.split("data: ", 1)[1])
+        assert "uploads" in snapshot and "per_minute" in snapshot
+
+        assert wait_for(lambda: subscriptions(r) >= 1)
+        flush(r, downloads=3)
+        delta = next(chunks)
+        delta = delta.decode() if isinstance(delta, bytes) else delta
+        assert delta.startswith("event: delta")
+        assert json.loads(delta.split("data: ", 1)[1])["deltas"] == {"downloads": 3}
+    finally:
+        response.close()
+    assert stats_stream.hub.stats()["subscribers"] == 0
+
+
+def test_stream_requires_admin(client):
+    response = client.get('/stats/stream', headers={'Content-Type': 'application/json'}, json={})
+    assert response.status_code == 401
@@ -0,0 +1,187 @@
+"""
+Namespaced keys and the expiry-indexed token registry (no KEYS anywhere).
+"""
+import io
+import os
+import time
+import uuid
+import pytest
+from app import create_app
+from app.services import key_migration, lifecycle_events
+from config import Config
+
+
+@pytest.fixture
+def client():
+    Config.TESTING = True
+    Config.RATELIMIT_ENABLED = False
+    Config.WTF_CSRF_ENABLED = False
+
+    app = create_app()
+    with app.test_client() as client:
+        with app.app_context():
+            yield client
+
+
+def upload(client, payload=b"registry"):
+    data = {'file': (io.BytesIO(payload), 'a.txt'), 'password': ''}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    return response.get_json()['metadata']['token']
+
+
+def test_create_and_consume_keep_registry_in_step(client):
+    from app.routes import redis_service
+
+    token = upload(client)
+    score = redis_service.redis_client.zscore(redis_service.REGISTRY_KEY, token)
+    assert score == pytest.approx(time.time() + Config.REDIS_TTL, abs=5)
+    assert token in redis_service.live_tokens()
+    assert redis_service.redis_client.exists(redis_service.file_key(token))
+
+    # Claiming the lease re-scores the entry to the lease expiry
+    response = client.get(f'/d/{token}', headers={'Range': 'bytes=0-1'})
+    assert response.status_code == 206
+    score = redis_service.redis_client.zscore(redis_service.REGISTRY_KEY, token)
+    assert score <= time.time() + Config.DOWNLOAD_LEASE_SECONDS + 1
+
+    response = client.get(f'/d/{token}')
+    assert response.data == b"registry"  # the body must run for CONSUME
+    assert redis_service.redis_client.zscore(redis_service.REGISTRY_KEY, token) is None
+
+
+def test_sweep_removes_expired_tokens_and_files(client):
+    from app.routes import redis_service
+
+    token = f"{uuid.uuid4()}.txt"
+    path = os.path.join(Config.UPLOAD_FOLDER, token)
+    with open(path, 'wb') as f:
+        f.write(b"expired")
+    redis_service.redis_client.zadd(redis_service.REGISTRY_KEY, {token: int(time.time()) - 1})
+
+    # An entry whose hash is still alive is re-scored, not swept
+    live = upload(client, b"x" * 50_000)
+    redis_service.redis_client.zadd(redis_service.REGISTRY_KEY, {live: int(time.time()) - 1})
+
+    assert redis_service.sweep_expired() >= 1
+    assert not os.path.exists(path)
+    assert redis_service.redis_client.zscore(redis_service.REGISTRY_KEY, token) is None
+    assert redis_service.redis_client.zscore(redis_service.REGISTRY_KEY, live) > time.time()
+    assert os.path.exists(os.path.join(Config.UPLOAD_FOLDER, live))
+
+
+def test_orphan_cleanup_keeps_registered_files(client):
+    from app.routes import redis_service
+
+    live = upload(client, b"x" * 50_000)
+    orphan, committed = f"{uuid.uuid4()}.txt", f"{uuid.uuid4()}.txt"
+    for name in (orphan, committed):
+        with open(os.path.join(Config.UPLOAD_FOLDER, name), 'wb') as f:
+            f.write(b"orphan")
+    stale = time.time() - Config.ORPHAN_GRACE_SECONDS - 1
+    os.utime(os.path.join(Config.UPLOAD_FOLDER, orphan), (stale, stale))
+
+    result = redis_service.cleanup_orphan_files()
+    assert result["success"]
+    assert os.path.exists(os.path.join(Config.UPLOAD_FOLDER, live))
+    assert not os.path.exists(os.path.join(Config.UPLOAD_FOLDER, orphan))
+    # Just committed, CREATE not run yet: kept for the grace period
+    assert os.path.exists(os.path.join(Config.UPLOAD_FOLDER, committed))
+    os.remove(os.path.join(Config.UPLOAD_FOLDER, committed))
+
+    # Metadata whose file vanished is dropped along with its registry entry
+    os.remove(os.path.join(Config.UPLOAD_FOLDER, live))
+    assert redis_service.cleanup_orphan_metadata()["deleted_count"] >= 1
+    assert not redis_service.redis_client.exists(redis_service.file_key(live))
+    assert redis_service.redis_client.zscore(redis_service.REGISTRY_KEY, live) is None
+
+
+def test_migration_moves_legacy_keys(client):
+    from app.routes import redis_service
+    r = redis_service.redis_client
+
+    token = f"{uuid.uuid4()}.txt"
+    r.hset(token, mapping={"token": token, "filename": token, "is_protected": "False"})
+    r.expire(token, 300)
+    r.set("unprotected_downloads_visits", "7")
+    # Not baseline shapes: left alone
+    lookalikes = [f"{token}:blob", "upload_session:legacy", "jobs:stream", "notes", f"{uuid.uuid4()}.md"]
+    r.set(lookalikes[0], "YmxvYg==", ex=300)
+    r.hset(lookalikes[1], mapping={"received": "0"})
+    r.set(lookalikes[2], "1")
+    r.hset(lookalikes[3], mapping={"token": "notes"})
+    r.hset(lookalikes[4], mapping={"token": "someone-else"})
+    before = r.get(redis_service.counter_key("unprotected_downloads_visits"))
+    r.delete(redis_service.counter_key("unprotected_downloads_visits"))
+
+    result = key_migration.migrate(r)
+    assert result["renamed"] == 2
+    assert not r.exists(token, "unprotected_downloads_visits")
+    assert r.hget(redis_service.file_key(token), "token") == token
+    assert 0 < r.ttl(redis_service.file_key(token)) <= 300
+    assert r.get(redis_service.counter_key("unprotected_downloads_visits")) == "7"
+    assert token in redis_service.live_tokens()
+    assert r.exists(*lookalikes) == len(lookalikes)
+
+    # Running again is a no-op
+    assert key_migration.migrate(r)["renamed"] == 0
+    r.delete(redis_service.file_key(token), *lookalikes)
+    if before is None:
+        r.delete(redis_service.counter_key("unprotected_downloads_visits"))
+    else:
+        r.set(redis_service.counter_key("unprotected_downloads_visits"), before)
+    r.zrem(redis_service.REGISTRY_KEY, token)
+    r.zrem(redis_service.UPLOADED_KEY, token)
+
+
+@pytest.fixture
+def admin_headers(client):
+    Config.ADMIN_PASSWORD = "testpassword"
+    response = client.post('/admin/api/token', json={'username': Config.ADMIN_USERNAME, 'password': 'testpassword'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def test_listing_pages_by_upload_time(client, admin_headers):
+    from app.routes import redis_service
+
+    tokens = [upload(client, b"x" * 50_000) for _ in range(5)]
+    # Same upload score for all five, newest in the index: the cursor must
+    # still walk ties without repeating or skipping any
+    redis_service.redis_client.zadd(redis_service.UPLOADED_KEY, {token: 9e9 for token in tokens})
+    stale = f"{uuid.uuid4()}.txt"
+    redis_service.redis_client.zadd(redis_service.UPLOADED_KEY, {stale: 9e9})
+
+    seen, cursor = [], None
+    for _ in range(3):
+        entries, cursor = redis_service.list_files_page(cursor, limit=2)
+        seen += [entry['token'] for entry in entries]
+    assert sorted(seen[:5]) == sorted(tokens)
+    assert stale not in seen
+    assert redis_service.redis_client.zscore(redis_service.UPLOADED_KEY, stale) is None
+    assert entries[0]['content_type'] == 'text/plain'
+
+    response = client.get('/list-files?limit=2', headers=admin_headers)
+    assert response.status_code == 200
+    assert b"NEXT 2" in response.data
+    assert client.get('/list-files?cursor=nonsense', headers=admin_headers).status_code == 400
+    assert client.get('/list-files?cursor=nan:abc', headers=admin_headers).status_code == 400
+    assert client.get('/list-files?cursor=inf:abc', headers=admin_headers).status_code == 400
+    assert not any(token.encode() in response.data for token in tokens)  # not even in the Next link
+    assert client.get('/list-files?limit=0', headers=admin_headers).status_code == 400
+
+    redis_service.redis_client.zadd(redis_service.UPLOADED_KEY, {token: time.time() for token in tokens})
+
+
+def test_ndjson_export_streams_every_live_file(client, admin_headers):
+    import json
+
+    token = upload(client, b"x" * 50_000)
+    response = client.get('/list-files/export?order=oldest', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert token.encode() not in response.data  # tokens are download secrets
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert lifecycle_events.token_hash(token) in [row['id'] for row in rows]
+    assert token[:12] in [row['token_prefix'] for row in rows]
+    assert set(rows[0]) == {'id', 'token_prefix', 'uploaded', 'content_type', 'is_protected', 'upload_time',
+                            'size', 'storage'}
+    assert [row['uploaded'] for row in rows] == sorted(row['uploaded'] for row in rows)
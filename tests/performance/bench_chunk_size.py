@@ -0,0 +1,76 @@
+"""
+Chunk Size Benchmark - throughput and peak memory per frame size
+================================================================
+Encrypts and decrypts one file with the v2 container at frame sizes from
+16 KB to 4 MB. Throughput is measured without tracing; peak Python heap
+(tracemalloc) is measured in a separate pass, since tracing slows the loop.
+
+Usage:
+    python -m tests.performance.bench_chunk_size [size_mb]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.encryption_utils import generate_key, encrypt_file_chunked, decrypt_file_chunked
+
+CHUNK_SIZES_KB = [16, 64, 256, 1024, 4096]
+RUNS = 3
+
+
+def encrypt(plain_path, enc_path, key, chunk_size):
+    encrypt_file_chunked(plain_path, enc_path, key, chunk_size)
+
+
+def decrypt(plain_path, enc_path, key, chunk_size):
+    for _ in decrypt_file_chunked(enc_path, key):
+        pass
+
+
+def throughput(fn, size_mb, *args):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return size_mb / statistics.median(timings)
+
+
+def peak_kib(fn, *args):
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    key = generate_key()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        plain_path = os.path.join(tmpdir, "plain.bin")
+        enc_path = os.path.join(tmpdir, "enc.bin")
+        with open(plain_path, 'wb') as f:
+            f.write(os.urandom(size_mb * 1024 * 1024))
+
+        print(f"File size: {size_mb} MB, median of {RUNS} runs")
+        print(f"{'chunk':>8} | {'enc MB/s':>9} | {'enc peak KiB':>12} | {'dec MB/s':>9} | {'dec peak KiB':>12}")
+        print("-" * 62)
+        for chunk_kb in CHUNK_SIZES_KB:
+            args = (plain_path, enc_path, key, chunk_kb * 1024)
+            enc_rate = throughput(encrypt, size_mb, *args)
+            enc_peak = peak_kib(encrypt, *args)
+            dec_rate = throughput(decrypt, size_mb, *args)
+            dec_peak = peak_kib(decrypt, *args)
+            print(f"{chunk_kb:>6}KB | {enc_rate:>9.0f} | {enc_peak:>12.0f} | {dec_rate:>9.0f} | {dec_peak:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Crypto Hot Loop Benchmark - per-chunk bytes vs pooled buffers
+=============================================================
+Compares the previous frame loops (a fresh `bytes` from `read()` per chunk,
+nonce rebuilt from bytes each time) with the current ones (pooled
+bytearrays filled by `readinto`, `encrypt_into`, precomputed nonce base,
+optional mmap reads) on 1 MB and 20 MB files.
+
+tracemalloc only reports live memory, so allocations are counted with a
+profile hook: the peak is reset on every call and return event, and a
+call whose peak rose by at least 1 KiB counts as one allocation. Small
+per-call objects (memoryview slices, nonces) stay below that threshold.
+
+Usage:
+    python -m tests.performance.bench_crypto_hotloop
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from app.utils.encryption_utils import (
+    generate_key, encrypt_file_chunked, decrypt_file_chunked, read_header,
+    _increment_nonce, frame_count, FileHeader, TAG_SIZE,
+)
+
+SIZES_MB = [1, 20]
+CHUNK_SIZE = 64 * 1024
+RUNS = 5
+THRESHOLD = 1024
+
+
+def baseline_encrypt(plain_path, enc_path, key):
+    size = os.path.getsize(plain_path)
+    cipher = ChaCha20Poly1305(key)
+    base_nonce = os.urandom(12)
+    header = FileHeader(1, CHUNK_SIZE, base_nonce, size)
+    frames = frame_count(size, CHUNK_SIZE)
+    with open(plain_path, 'rb') as infile, open(enc_path, 'wb') as outfile:
+        outfile.write(header.pack())
+        for chunk_num in range(frames):
+            chunk = infile.read(CHUNK_SIZE)
+            final = chunk_num == frames - 1
+            outfile.write(cipher.encrypt(_increment_nonce(base_nonce, chunk_num), chunk, header.aad(final)))
+
+
+def baseline_decrypt(enc_path, key):
+    cipher = ChaCha20Poly1305(key)
+    with open(enc_path, 'rb') as f:
+        header = read_header(f)
+        frames = frame_count(header.plaintext_length, header.chunk_size)
+        for chunk_num in range(frames):
+            final = chunk_num == frames - 1
+            frame = f.read(header.chunk_size + TAG_SIZE)
+            yield cipher.decrypt(_increment_nonce(header.base_nonce, chunk_num), frame, header.aad(final))
+
+
+def drain(generator):
+    for _ in generator:
+        pass
+
+
+def count_allocations(fn, *args):
+    allocations = 0
+    tracemalloc.start()
+    level = tracemalloc.get_traced_memory()[0]
+
+    def hook(frame, event, arg):
+        nonlocal allocations, level
+        if event in ('return', 'c_return') and tracemalloc.get_traced_memory()[1] - level >= THRESHOLD:
+            allocations += 1
+        # Measure each call from its own starting level (frees in between do not hide it)
+        tracemalloc.reset_peak()
+        level = tracemalloc.get_traced_memory()[0]
+
+    sys.setprofile(hook)
+    try:
+        fn(*args)
+    finally:
+        sys.setprofile(None)
+        tracemalloc.stop()
+    return allocations
+
+
+def throughput(fn, size_mb, *args):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return size_mb / statistics.median(timings)
+
+
+def main():
+    key = generate_key()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        plain_path = os.path.join(tmpdir, "plain.bin")
+        enc_path = os.path.join(tmpdir, "enc.bin")
+
+        for size_mb in SIZES_MB:
+            with open(plain_path, 'wb') as f:
+                f.write(os.urandom(size_mb * 1024 * 1024))
+            encrypt_file_chunked(plain_path, enc_path, key, CHUNK_SIZE)
+
+            cases = [
+                ("encrypt  baseline", baseline_encrypt, (plain_path, enc_path + ".b", key)),
+                ("encrypt  pooled", encrypt_file_chunked, (plain_path, enc_path + ".p", key, CHUNK_SIZE)),
+                ("decrypt  baseline", lambda: drain(baseline_decrypt(enc_path, key)), ()),
+                ("decrypt  pooled", lambda: drain(decrypt_file_chunked(enc_path, key)), ()),
+                ("decrypt  mmap", lambda: drain(decrypt_file_chunked(enc_path, key, use_mmap=True)), ()),
+            ]
+
+            print(f"\n{size_mb} MB file, {CHUNK_SIZE // 1024} KB frames, median of {RUNS} runs")
+            print(f"{'path':>18} | {'MB/s':>7} | {'allocs/MB':>9}")
+            print("-" * 42)
+            for name, fn, args in cases:
+                rate = throughput(fn, size_mb, *args)
+                allocs = count_allocations(fn, *args) / size_mb
+                print(f"{name:>18} | {rate:>7.0f} | {allocs:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
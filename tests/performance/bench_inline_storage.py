@@ -0,0 +1,62 @@
+"""
+Inline Storage Benchmark - Redis-inline vs on-disk ciphertext
+=============================================================
+Uploads and downloads 1 KB - 64 KB files through the Flask app with the
+inline tier disabled (disk) and forced on (inline), and reports the median
+upload + download latency for each mode.
+
+Requires a running Redis (REDIS_HOST / REDIS_PORT).
+
+Usage:
+    python -m tests.performance.bench_inline_storage
+"""
+
+import io
+import os
+import logging
+import sys
+import time
+import statistics
+
+os.environ.setdefault("RATELIMIT_ENABLED", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config import Config
+from app import create_app
+
+SIZES_KB = [1, 4, 16, 64]
+RUNS = 50
+
+
+def roundtrip(client, payload):
+    t0 = time.perf_counter()
+    data = {'file': (io.BytesIO(payload), 'bench.txt'), 'password': ''}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    token = response.get_json()['metadata']['token']
+    t1 = time.perf_counter()
+    body = client.get(f'/d/{token}').data
+    t2 = time.perf_counter()
+    assert body == payload
+    return (t1 - t0) * 1000, (t2 - t1) * 1000
+
+
+def main():
+    logging.disable(logging.INFO)
+    Config.WTF_CSRF_ENABLED = False
+    app = create_app()
+    client = app.test_client()
+
+    print(f"{'size':>6} | {'mode':>6} | {'upload ms':>9} | {'download ms':>11}")
+    print("-" * 44)
+    for size_kb in SIZES_KB:
+        payload = os.urandom(size_kb * 1024)
+        for mode, limit in (("disk", 0), ("inline", 128 * 1024)):
+            Config.INLINE_STORAGE_MAX_BYTES = limit
+            samples = [roundtrip(client, payload) for _ in range(RUNS)]
+            upload = statistics.median(s[0] for s in samples)
+            download = statistics.median(s[1] for s in samples)
+            print(f"{size_kb:>4}KB | {mode:>6} | {upload:>9.2f} | {download:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Parallel Encryption Benchmark - throughput by cipher worker count
+=================================================================
+Encrypts one file with 1, 2, 4 and 8 cipher workers (reader -> N sealing
+threads -> ordered writer) for each AEAD suite, using the same sequential
+and parallel loops as `encrypt_file_chunked` with a fixed nonce, and checks
+the output matches the sequential run byte for byte. Scaling is bounded
+by the cores available; `os.cpu_count()` is printed for context.
+
+Usage:
+    python -m tests.performance.bench_parallel_encrypt [size_mb]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.encryption_utils import (
+    CIPHERS, FrameCipher, ParallelSealer, frame_count, generate_key,
+    _encrypt_parallel, _encrypt_sequential,
+)
+
+WORKERS = [1, 2, 4, 8]
+CHUNK_SIZE = 256 * 1024
+RUNS = 5
+
+
+def digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def encrypt(plain_path, enc_path, cipher, workers):
+    size = os.path.getsize(plain_path)
+    frames = frame_count(size, cipher.chunk_size)
+    with open(plain_path, 'rb', buffering=0) as infile, open(enc_path, 'wb', buffering=0) as outfile:
+        outfile.write(cipher.header(size))
+        if workers > 1:
+            _encrypt_parallel(infile, cipher, ParallelSealer(cipher, outfile, workers), frames)
+        else:
+            _encrypt_sequential(infile, outfile, cipher, frames)
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    key = generate_key()
+    base_nonce = os.urandom(12)
+    print(f"CPUs: {os.cpu_count()}, file: {size_mb} MB, {CHUNK_SIZE // 1024} KB frames, median of {RUNS} runs")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        plain_path = os.path.join(tmpdir, "plain.bin")
+        enc_path = os.path.join(tmpdir, "enc.bin")
+        with open(plain_path, 'wb') as f:
+            f.write(os.urandom(size_mb * 1024 * 1024))
+
+        for suite in CIPHERS.values():
+            cipher = FrameCipher(key, CHUNK_SIZE, base_nonce, suite.cipher_id)
+            print(f"\n{suite.name}")
+            print(f"{'workers':>8} | {'MB/s':>7} | {'speedup':>7} | identical")
+            print("-" * 42)
+            baseline_rate = reference = None
+            for workers in WORKERS:
+                timings = []
+                for _ in range(RUNS):
+                    start = time.perf_counter()
+                    encrypt(plain_path, enc_path, cipher, workers)
+                    timings.append(time.perf_counter() - start)
+                rate = size_mb / statistics.median(timings)
+                output = digest(enc_path)
+                baseline_rate = baseline_rate or rate
+                reference = reference or output
+                print(f"{workers:>8} | {rate:>7.0f} | {rate / baseline_rate:>6.2f}x | {output == reference}")
+
+
+if __name__ == "__main__":
+    main()
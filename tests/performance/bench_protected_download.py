@@ -0,0 +1,63 @@
+"""
+Protected Download Benchmark - bcrypt + Argon2 vs single Argon2 unwrap
+======================================================================
+CPU time spent unlocking one protected file, using the configured Argon2
+parameters (64 MiB, t=3, p=4 by default):
+
+    legacy   bcrypt verify_password, then Argon2 derive in serve_and_delete
+    current  one Argon2 derive, then AEAD unwrap of the file key
+
+CPU time is process-wide (time.process_time), so Argon2's lanes count.
+
+Usage:
+    python -m tests.performance.bench_protected_download
+"""
+
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.password_utils import PasswordUtils
+from app.utils.encryption_utils import derive_key_from_password, generate_key, generate_salt, unwrap_key, wrap_key
+
+RUNS = 10
+PASSWORD = "correct horse battery"
+
+
+def legacy_unlock(password_hash, salt):
+    assert PasswordUtils.verify_password(PASSWORD, password_hash)
+    return derive_key_from_password(PASSWORD, salt)
+
+
+def current_unlock(wrapped, salt):
+    return unwrap_key(wrapped, derive_key_from_password(PASSWORD, salt))
+
+
+def measure(fn, *args):
+    cpu, wall = [], []
+    for _ in range(RUNS):
+        c0, w0 = time.process_time(), time.perf_counter()
+        fn(*args)
+        cpu.append((time.process_time() - c0) * 1000)
+        wall.append((time.perf_counter() - w0) * 1000)
+    return statistics.median(cpu), statistics.median(wall)
+
+
+def main():
+    salt = generate_salt()
+    password_hash = PasswordUtils.hash_password(PASSWORD)
+    wrapped = wrap_key(generate_key(), derive_key_from_password(PASSWORD, salt))
+
+    print(f"{'path':>8} | {'CPU ms':>8} | {'wall ms':>8}")
+    print("-" * 32)
+    for name, fn, args in (("legacy", legacy_unlock, (password_hash, salt)),
+                           ("current", current_unlock, (wrapped, salt))):
+        cpu, wall = measure(fn, *args)
+        print(f"{name:>8} | {cpu:>8.1f} | {wall:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
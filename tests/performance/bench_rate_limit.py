@@ -0,0 +1,107 @@
+"""
+Rate Limiter Benchmark - limiter overhead per request under tier3 load
+======================================================================
+Replays the tier3 DDoS pattern (pass 3.3: 300 clients firing with no wait)
+against the `/d/<token>` limit ("60 per minute"), straight at the limiter,
+with THREADS threads standing in for gunicorn worker threads:
+
+    memory://           old setup: a separate window per worker
+    ots+redis           shared moving window, one Lua call per hit
+    ots+redis+prefilter the same, with the local token-bucket pre-filter
+
+For each it reports the limiter time per request (p50 / p95 / p99), the
+Redis round trips per request, and the number of hits allowed.
+"Allowed" is per simulated worker for memory://, so across WORKERS
+workers a client gets WORKERS times the limit.
+
+Usage:
+    python -m tests.performance.bench_rate_limit [requests] [clients] [threads]
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import MovingWindowRateLimiter
+
+from config import Config
+from app.services import rate_limit
+from app.services.redis_pool import get_redis, unlink_matching
+
+LIMIT = parse("60 per minute")
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", 4))
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def run(limiter, requests, clients, threads):
+    timings, allowed = [], [0]
+    lock = threading.Lock()
+    per_thread = requests // threads
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local, hits = [], 0
+        for _ in range(per_thread):
+            ip = f"10.3.{rng.randrange(clients) // 256}.{rng.randrange(clients) % 256}"
+            start = time.perf_counter()
+            if limiter.hit(LIMIT, "bench", ip):
+                hits += 1
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            timings.extend(local)
+            allowed[0] += hits
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return timings, allowed[0], elapsed
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 60_000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    client = get_redis()
+    client.ping()
+
+    print(f"{requests} requests from {clients} clients on {threads} threads, limit {LIMIT}")
+    print(f"{'storage':>20} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'RTT/req':>7} | {'req/s':>8} | {'allowed':>7}")
+    print("-" * 82)
+
+    cases = (
+        ("memory://", MemoryStorage(), None),
+        ("ots+redis", rate_limit.SharedRedisStorage(), False),
+        ("ots+redis+prefilter", rate_limit.SharedRedisStorage(), True),
+    )
+    try:
+        for name, storage, prefilter in cases:
+            unlink_matching(client, f"{rate_limit.KEY_PREFIX}*bench*")
+            rate_limit.prefilter = rate_limit.LocalPrefilter()
+            if prefilter is not None:
+                Config.RATELIMIT_PREFILTER_ENABLED = prefilter
+            timings, allowed, elapsed = run(MovingWindowRateLimiter(storage), requests, clients, threads)
+            round_trips = rate_limit.prefilter.redis_calls / requests if prefilter is not None else 0.0
+            note = f" (x{WORKERS} workers)" if prefilter is None else ""
+            print(f"{name:>20} | {percentile(timings, 0.5):>7.3f} | {percentile(timings, 0.95):>7.3f} | "
+                  f"{percentile(timings, 0.99):>7.3f} | {round_trips:>7.2f} | {requests / elapsed:>8.0f} | "
+                  f"{allowed:>7}{note}")
+    finally:
+        unlink_matching(client, f"{rate_limit.KEY_PREFIX}*bench*")
+
+
+if __name__ == "__main__":
+    main()
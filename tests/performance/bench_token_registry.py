@@ -0,0 +1,123 @@
+"""
+Token Registry Benchmark - KEYS vs SCAN vs the expiry-indexed registry
+======================================================================
+Fills a scratch Redis db with N live tokens (namespaced file hashes plus
+`ots:files` registry entries, 10% already past their expiry score) and
+times the ways of answering "which tokens are live / expired":
+
+    KEYS *            one blocking command over the whole keyspace
+    SCAN              incremental walk, COUNT 1000 per call
+    ZRANGEBYSCORE     registry range query for live tokens
+    ZCOUNT            how many are live, without fetching them
+    sweep_expired     registry range query for expired tokens + pipelined TTLs
+
+and the admin file list: the old KEYS + one HGETALL per token against one
+cursor page (upload-order index + pipelined HMGET of the shown fields).
+
+"longest call" is the longest single command: Redis is single-threaded,
+so that is how long every other client waits behind it.
+
+Usage:
+    python -m tests.performance.bench_token_registry [tokens] [db]
+"""
+
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import redis
+
+from config import Config
+from app.services.redis_service import RedisService
+
+
+def fill(client, tokens):
+    now, count = int(time.time()), len(tokens)
+    pipeline = client.pipeline(transaction=False)
+    for i, token in enumerate(tokens):
+        expired = i % 10 == 0
+        pipeline.hset(RedisService.file_key(token), mapping={
+            "token": token, "filename": token, "content_type": "text/plain", "is_protected": "False"})
+        if not expired:
+            pipeline.expire(RedisService.file_key(token), Config.REDIS_TTL)
+        pipeline.zadd(RedisService.REGISTRY_KEY, {token: now - 1 if expired else now + Config.REDIS_TTL})
+        pipeline.zadd(RedisService.UPLOADED_KEY, {token: now - count + i})
+        if i % 5000 == 4999:
+            pipeline.execute()
+    pipeline.execute()
+    # Expired entries: hash already gone, registry entry left for the sweep
+    for i in range(0, len(tokens), 10 * 5000):
+        client.delete(*[RedisService.file_key(t) for t in tokens[i:i + 10 * 5000:10]])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def scan_all(client):
+    found, longest, cursor = 0, 0.0, 0
+    while True:
+        start = time.perf_counter()
+        cursor, keys = client.scan(cursor, match="ots:file:*", count=1000)
+        longest = max(longest, (time.perf_counter() - start) * 1000)
+        found += len(keys)
+        if cursor == 0:
+            return found, longest
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    db = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+    client = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=db, decode_responses=True)
+    if client.dbsize():
+        sys.exit(f"db {db} is not empty; pick a scratch db")
+    service = RedisService(redis_client=client)
+
+    try:
+        tokens = [f"{uuid.uuid4()}.txt" for _ in range(count)]
+        fill(client, tokens)
+        print(f"{count} tokens ({count // 10} expired) in db {db}")
+        print(f"{'query':>18} | {'total ms':>9} | {'longest call ms':>15} | {'tokens':>7}")
+        print("-" * 60)
+
+        keys, ms = timed(lambda: client.keys("*"))
+        print(f"{'KEYS *':>18} | {ms:>9.1f} | {ms:>15.1f} | {len(keys):>7}")
+
+        (found, longest), ms = timed(lambda: scan_all(client))
+        print(f"{'SCAN':>18} | {ms:>9.1f} | {longest:>15.1f} | {found:>7}")
+
+        live, ms = timed(service.live_tokens)
+        print(f"{'ZRANGEBYSCORE':>18} | {ms:>9.1f} | {ms:>15.1f} | {len(live):>7}")
+
+        live, ms = timed(lambda: client.zcount(RedisService.REGISTRY_KEY, int(time.time()), "+inf"))
+        print(f"{'ZCOUNT':>18} | {ms:>9.1f} | {ms:>15.1f} | {live:>7}")
+
+        def old_listing():
+            listed = 0
+            for key in client.keys("ots:file:*"):
+                if client.hgetall(key):
+                    listed += 1
+            return listed
+
+        listed, ms = timed(old_listing)
+        print(f"{'list: KEYS+HGETALL':>18} | {ms:>9.1f} | {'':>15} | {listed:>7}")
+
+        (page, cursor), ms = timed(lambda: service.list_files_page(None, 50))
+        print(f"{'list: page of 50':>18} | {ms:>9.1f} | {'':>15} | {len(page):>7}")
+        _, ms = timed(lambda: service.list_files_page(cursor, 50))
+        print(f"{'list: next page':>18} | {ms:>9.1f} | {'':>15} | {len(page):>7}")
+
+        swept, ms = timed(service.sweep_expired)
+        remaining = client.zcard(RedisService.REGISTRY_KEY)
+        print(f"{'sweep_expired':>18} | {ms:>9.1f} | {'(500/batch)':>15} | {count - remaining:>7}")
+    finally:
+        client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Upload Pipeline Benchmark - save/re-read/encrypt vs streaming encrypt
+=====================================================================
+Compares the old upload path (werkzeug spools the part to a temp file,
+`file.save` copies it into UPLOAD_FOLDER, `encrypt_file_chunked` re-reads it
+and the plaintext is removed) with EncryptedUploadStream, which seals the
+multipart chunks as they arrive.
+
+Bytes written come from /proc/self/io (`wchar`), so run this on Linux.
+
+Usage:
+    python -m tests.performance.bench_upload_pipeline
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.encryption_utils import generate_key, encrypt_file_chunked
+from app.utils.upload_stream import EncryptedUploadStream
+
+SIZES_MB = [1, 5, 20]
+RUNS = 5
+PART_SIZE = 64 * 1024  # werkzeug multipart buffer size
+
+
+def bytes_written():
+    with open('/proc/self/io') as f:
+        for line in f:
+            if line.startswith('wchar:'):
+                return int(line.split()[1])
+    return 0
+
+
+def parts(payload):
+    for i in range(0, len(payload), PART_SIZE):
+        yield payload[i:i + PART_SIZE]
+
+
+def legacy_upload(payload, directory):
+    filepath = os.path.join(directory, "legacy.bin")
+    spool = tempfile.TemporaryFile()
+    for part in parts(payload):
+        spool.write(part)
+    spool.seek(0)
+    with open(filepath, 'wb') as dst:
+        shutil.copyfileobj(spool, dst)
+    spool.close()
+    temp_path = filepath + ".temp"
+    os.rename(filepath, temp_path)
+    encrypt_file_chunked(temp_path, filepath, generate_key())
+    os.remove(temp_path)
+    os.remove(filepath)
+
+
+def streaming_upload(payload, directory):
+    stream = EncryptedUploadStream(directory)
+    for part in parts(payload):
+        stream.write(part)
+    stream.seek(0)
+    filepath = os.path.join(directory, "streamed.bin")
+    stream.commit(filepath)
+    os.remove(filepath)
+
+
+def measure(fn, payload, directory):
+    latencies, written = [], []
+    for _ in range(RUNS):
+        w0, t0 = bytes_written(), time.perf_counter()
+        fn(payload, directory)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        written.append(bytes_written() - w0)
+    return statistics.median(latencies), statistics.median(written)
+
+
+def main():
+    print(f"{'size':>6} | {'pipeline':>9} | {'latency ms':>10} | {'disk MB written':>15}")
+    print("-" * 50)
+    with tempfile.TemporaryDirectory() as directory:
+        for size_mb in SIZES_MB:
+            payload = os.urandom(size_mb * 1024 * 1024)
+            for name, fn in (("legacy", legacy_upload), ("streaming", streaming_upload)):
+                latency, written = measure(fn, payload, directory)
+                print(f"{size_mb:>4}MB | {name:>9} | {latency:>10.1f} | {written / 1024 / 1024:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
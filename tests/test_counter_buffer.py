@@ -0,0 +1,75 @@
+"""
+Counter buffer unit tests: increments stay in process until a flush writes
+them in one pipeline; deltas survive a Redis outage for a bounded time.
+"""
+import redis
+import pytest
+
+from app.services import counter_buffer
+from app.services.redis_service import RedisService
+
+# The Config counter_buffer actually reads (test_encryption swaps config.Config)
+Config = counter_buffer.Config
+
+
+@pytest.fixture
+def client():
+    client = redis.Redis(host="localhost", port=6379, decode_responses=True)
+    client.delete(RedisService.counter_key("buffer_test"), RedisService.counter_key("buffer_other"))
+    yield client
+    client.delete(RedisService.counter_key("buffer_test"), RedisService.counter_key("buffer_other"))
+
+
+def test_flush_sums_deltas_into_one_pipeline(client, monkeypatch):
+    buffer = counter_buffer.CounterBuffer(client)
+    monkeypatch.setattr(buffer, "_start", lambda: None)  # flush by hand
+    for _ in range(1000):
+        buffer.incr("buffer_test")
+    buffer.incr("buffer_other", 5)
+    assert client.get(RedisService.counter_key("buffer_test")) is None
+
+    pipelines = []
+    write = buffer._write
+    monkeypatch.setattr(buffer, "_write", lambda deltas, visitors, events: (pipelines.append(dict(deltas)), write(deltas, visitors, events)))
+    assert buffer.flush() == 2
+    assert pipelines == [{"buffer_test": 1000, "buffer_other": 5}]
+    assert client.get(RedisService.counter_key("buffer_test")) == "1000"
+    assert buffer.flush() == 0
+    assert buffer.stats()["flushed"] == 1005
+
+
+def test_deltas_retained_then_dropped_while_redis_is_down(client, monkeypatch):
+    down = redis.Redis(host="localhost", port=1, socket_connect_timeout=0.1)
+    buffer = counter_buffer.CounterBuffer(down)
+    monkeypatch.setattr(buffer, "_start", lambda: None)
+
+    buffer.incr("buffer_test", 3)
+    assert buffer.flush() == 0
+    assert buffer.stats()["retained"] == 3
+
+    # Back up: the retained deltas go out with the next flush
+    buffer._redis_client = client
+    buffer.incr("buffer_test")
+    assert buffer.flush() == 1
+    assert client.get(RedisService.counter_key("buffer_test")) == "4"
+
+    # Down for longer than COUNTER_RETAIN_SECONDS: dropped, not kept forever
+    monkeypatch.setattr(Config, "COUNTER_RETAIN_SECONDS", 0)
+    buffer._redis_client = down
+    buffer.incr("buffer_test", 2)
+    buffer.flush()
+    buffer.flush()
+    assert buffer.stats()["dropped"] == 2
+    assert buffer.stats()["retained"] == 0
+
+
+def test_background_thread_flushes(client, monkeypatch):
+    import time
+    monkeypatch.setattr(Config, "COUNTER_FLUSH_MS", 20)
+    buffer = counter_buffer.CounterBuffer(client)
+    buffer.incr("buffer_test", 7)
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline and client.get(RedisService.counter_key("buffer_test")) != "7":
+        time.sleep(0.01)
+    buffer._stop.set()
+    assert client.get(RedisService.counter_key("buffer_test")) == "7"
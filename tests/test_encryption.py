@@ -4,11 +4,13 @@ Day 16: Encryption Unit Tests
 Pass 4 Note: AI-written tests because user was lazy 😅
 This is documented as a learning moment in 11_Pass_4_Notes.md
 """
+import io
 import os
 import sys
 import pytest
 import tempfile
 from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
 
 # Add project root to path BEFORE imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -26,6 +28,11 @@ class MockConfig:
     SECRET_KEY = "test-secret"
     JWT_SECRET_KEY = "test-jwt-secret"
     UPLOAD_FOLDER = "/tmp/uploads"
+    CHUNK_SIZE = 64 * 1024
+    CHUNK_SIZE_AUTO = False
+    CIPHER_SUITE = "chacha20-poly1305"
+    ENCRYPT_WORKERS = 1
+    PARALLEL_ENCRYPT_MIN_BYTES = 8 * 1024 * 1024
 
 # Patch config module
 import config
@@ -59,6 +66,7 @@ derive_key_from_password = encryption_utils.derive_key_from_password
 encrypt_file_chunked = encryption_utils.encrypt_file_chunked
 decrypt_file_chunked = encryption_utils.decrypt_file_chunked
 _increment_nonce = encryption_utils._increment_nonce
+read_header = encryption_utils.read_header
 
 
 class TestKeyGeneration:
@@ -274,5 +282,148 @@ class TestPasswordProtectedFile:
                 list(decrypt_file_chunked(encrypted_path, wrong_key, nonce))
 
 
+
+class TestContainerFormat:
+    """Test the versioned (v2) container and legacy compatibility."""
+
+    def _encrypt(self, tmpdir, data, chunk_size=None):
+        input_path = os.path.join(tmpdir, "input.bin")
+        encrypted_path = os.path.join(tmpdir, "encrypted.bin")
+        with open(input_path, "wb") as f:
+            f.write(data)
+        key = generate_key()
+        encrypt_file_chunked(input_path, encrypted_path, key, chunk_size)
+        return encrypted_path, key
+
+    def test_header_records_parameters(self):
+        """Header carries version, chunk size and plaintext length."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path, _ = self._encrypt(tmpdir, b"x" * 1000, chunk_size=256)
+            with open(path, "rb") as f:
+                header = read_header(f)
+            assert header.version == encryption_utils.FORMAT_VERSION
+            assert header.chunk_size == 256
+            assert header.plaintext_length == 1000
+            # 4 frames, no length prefixes
+            assert os.path.getsize(path) == encryption_utils.HEADER_SIZE + 1000 + 4 * 16
+
+    @pytest.mark.parametrize("use_mmap", [False, True])
+    @pytest.mark.parametrize("chunk_size", [16 * 1024, 64 * 1024, 1024 * 1024])
+    @pytest.mark.parametrize("size", [0, 16 * 1024, 200 * 1024])
+    def test_roundtrip_without_stored_nonce(self, chunk_size, size, use_mmap):
+        """Any chunk size decrypts from the header alone, including exact multiples and empty files."""
+        data = os.urandom(size)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path, key = self._encrypt(tmpdir, data, chunk_size)
+            assert b"".join(decrypt_file_chunked(path, key, use_mmap=use_mmap)) == data
+
+    @pytest.mark.parametrize("use_mmap", [False, True])
+    def test_truncated_file_fails(self, use_mmap):
+        """Dropping the final frame is detected."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path, key = self._encrypt(tmpdir, os.urandom(3000), chunk_size=1024)
+            with open(path, "r+b") as f:
+                f.truncate(encryption_utils.frame_offset(2, 1024))
+            with pytest.raises(InvalidTag):
+                list(decrypt_file_chunked(path, key, use_mmap=use_mmap))
+
+    def test_chunks_survive_buffer_reuse(self):
+        """Yielded chunks stay valid after the pooled read buffer is reused."""
+        data = os.urandom(5000)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path, key = self._encrypt(tmpdir, data, chunk_size=1024)
+            chunks = list(decrypt_file_chunked(path, key))
+            list(decrypt_file_chunked(path, key))
+            assert b"".join(chunks) == data
+
+    def test_tampered_length_fails(self):
+        """Claiming fewer bytes turns a middle frame into a fake final frame."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path, key = self._encrypt(tmpdir, os.urandom(3000), chunk_size=1024)
+            with open(path, "r+b") as f:
+                f.seek(encryption_utils.HEADER_SIZE - 8)
+                f.write((2048).to_bytes(8, "big"))
+            with pytest.raises(InvalidTag):
+                list(decrypt_file_chunked(path, key))
+
+    @pytest.mark.parametrize("suite", ["chacha20-poly1305", "aes-256-gcm"])
+    def test_each_suite_roundtrips_and_is_recorded(self, suite):
+        """Files record their cipher id and decrypt whatever the current suite is."""
+        data = os.urandom(100 * 1024)
+        cipher_id = encryption_utils.CIPHERS_BY_NAME[suite].cipher_id
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "input.bin")
+            path = os.path.join(tmpdir, "encrypted.bin")
+            with open(input_path, "wb") as f:
+                f.write(data)
+            key = generate_key()
+            cipher = encryption_utils.FrameCipher(key, 64 * 1024, cipher_id=cipher_id)
+            with open(path, "wb") as f:
+                f.write(cipher.header(len(data)))
+                f.write(cipher.seal(0, data[:64 * 1024], False))
+                f.write(cipher.seal(1, data[64 * 1024:], True))
+            with open(path, "rb") as f:
+                assert read_header(f).cipher_id == cipher_id
+            assert b"".join(decrypt_file_chunked(path, key)) == data
+
+    def test_select_cipher(self):
+        """Named suites resolve directly, auto benchmarks, unknown names fail."""
+        assert encryption_utils.select_cipher("aes-256-gcm").cipher_id == encryption_utils.CIPHER_AES_256_GCM
+        assert encryption_utils.select_cipher("auto") in encryption_utils.CIPHERS.values()
+        with pytest.raises(ValueError):
+            encryption_utils.select_cipher("rot13")
+
+    @pytest.mark.parametrize("size", [0, 1000, 4096, 10 * 4096 + 7])
+    def test_parallel_output_is_identical(self, size):
+        """Parallel sealing writes the same bytes as sequential sealing."""
+        data = os.urandom(size)
+        base_nonce = os.urandom(12)
+        key = generate_key()
+        outputs = []
+        for workers in (1, 4):
+            cipher = encryption_utils.FrameCipher(key, 4096, base_nonce)
+            sink = io.BytesIO()
+            sink.write(cipher.header(size))
+            with tempfile.TemporaryFile() as infile:
+                infile.write(data)
+                infile.seek(0)
+                frames = encryption_utils.frame_count(size, 4096)
+                if workers == 1:
+                    encryption_utils._encrypt_sequential(infile, sink, cipher, frames)
+                else:
+                    sealer = encryption_utils.ParallelSealer(cipher, sink, workers, window=3)
+                    encryption_utils._encrypt_parallel(infile, cipher, sealer, frames)
+            outputs.append(sink.getvalue())
+        assert outputs[0] == outputs[1]
+        assert b"".join(encryption_utils.decrypt_stream(io.BytesIO(outputs[1]), key)) == data
+
+    @pytest.mark.parametrize("suite", ["chacha20-poly1305", "aes-256-gcm"])
+    def test_seal_into_without_encrypt_into(self, suite):
+        """Older cryptography releases lack encrypt_into; sealing falls back to encrypt()."""
+        key, base_nonce = generate_key(), os.urandom(12)
+        cipher_id = encryption_utils.CIPHERS_BY_NAME[suite].cipher_id
+        native = encryption_utils.FrameCipher(key, 4096, base_nonce, cipher_id)
+        fallback = encryption_utils.FrameCipher(key, 4096, base_nonce, cipher_id)
+        fallback._encrypt_into = None
+        chunk = memoryview(bytearray(os.urandom(1000)))
+        out = memoryview(bytearray(1000 + encryption_utils.TAG_SIZE))
+        assert fallback.seal_into(3, chunk, out, True) == len(out)
+        assert bytes(out) == native.seal(3, bytes(chunk), True)
+
+    def test_legacy_file_still_decrypts(self):
+        """Headerless v1 files (length-prefixed frames) remain readable."""
+        key, base_nonce = generate_key(), os.urandom(12)
+        cipher = ChaCha20Poly1305(key)
+        data = os.urandom(150 * 1024)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "legacy.bin")
+            with open(path, "wb") as f:
+                for chunk_num, start in enumerate(range(0, len(data), 64 * 1024)):
+                    ciphertext = cipher.encrypt(_increment_nonce(base_nonce, chunk_num),
+                                                data[start:start + 64 * 1024], None)
+                    f.write(len(ciphertext).to_bytes(4, "big") + ciphertext)
+            assert b"".join(decrypt_file_chunked(path, key, base_nonce)) == data
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
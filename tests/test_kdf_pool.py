@@ -0,0 +1,57 @@
+"""
+KDF pool unit tests: bounded concurrency, fast rejection, metrics.
+"""
+import threading
+import pytest
+
+from app.utils.kdf_pool import KDFPool, KDFPoolBusy
+
+
+def test_runs_and_returns_result():
+    pool = KDFPool(max_workers=1, max_queue=1, queue_timeout=5)
+    assert pool.run(lambda a, b: a + b, 2, 3) == 5
+    assert pool.stats()["completed"] == 1
+
+
+def test_rejects_when_queue_full():
+    pool = KDFPool(max_workers=1, max_queue=0, queue_timeout=5)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=pool.run, args=(slow,))
+    worker.start()
+    started.wait(5)
+    try:
+        with pytest.raises(KDFPoolBusy) as exc_info:
+            pool.run(lambda: None)
+        assert exc_info.value.code == 503
+        assert exc_info.value.get_response().headers["Retry-After"]
+        assert pool.stats()["rejected"] == 1
+    finally:
+        release.set()
+        worker.join()
+
+
+def test_queued_job_times_out():
+    pool = KDFPool(max_workers=1, max_queue=1, queue_timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=pool.run, args=(slow,))
+    worker.start()
+    started.wait(5)
+    try:
+        with pytest.raises(KDFPoolBusy):
+            pool.run(lambda: None)
+        assert pool.stats()["rejected"] == 1
+    finally:
+        release.set()
+        worker.join()
+    # Only the derivation that ran is counted
+    assert pool.stats()["completed"] == 1
@@ -0,0 +1,62 @@
+"""
+Read-ahead unit tests: ordering, bounded prefetch, errors, early close.
+"""
+import os
+import tempfile
+import time
+import threading
+import pytest
+
+from app.utils.read_ahead import advise_willneed, read_ahead
+
+
+def test_preserves_order():
+    assert list(read_ahead(iter(range(100)), depth=3)) == list(range(100))
+
+
+def test_prefetch_is_bounded():
+    produced = []
+
+    def source():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    chunks = read_ahead(source(), depth=2)
+    assert next(chunks) == 0
+    time.sleep(0.2)
+    # consumed 1, at most 2 queued, 1 blocked in put
+    assert len(produced) <= 4
+    chunks.close()
+
+
+def test_errors_reach_consumer():
+    def source():
+        yield b"ok"
+        raise ValueError("bad frame")
+
+    chunks = read_ahead(source(), depth=4)
+    assert next(chunks) == b"ok"
+    with pytest.raises(ValueError):
+        next(chunks)
+
+
+def test_close_stops_producer_and_closes_source():
+    closed = threading.Event()
+
+    def source():
+        try:
+            while True:
+                yield b"x"
+        finally:
+            closed.set()
+
+    chunks = read_ahead(source(), depth=2)
+    next(chunks)
+    chunks.close()
+    assert closed.wait(1)
+    assert not any(t.name == "read-ahead" for t in threading.enumerate())
+
+
+def test_advise_willneed_tolerates_missing_file():
+    advise_willneed(os.path.join(tempfile.gettempdir(), "does-not-exist.bin"))
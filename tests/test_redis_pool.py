@@ -0,0 +1,67 @@
+"""
+Redis pool unit tests: one client per process, checkout metrics, fork safety.
+"""
+import os
+import pytest
+import redis
+
+from app.services import redis_pool
+
+# The Config redis_pool actually reads (test_encryption swaps config.Config)
+Config = redis_pool.Config
+
+
+@pytest.fixture
+def fresh_pool(monkeypatch):
+    monkeypatch.setattr(Config, "REDIS_HOST", "localhost")
+    monkeypatch.setattr(Config, "REDIS_PORT", 6379)
+    redis_pool.reset()
+    yield monkeypatch
+    redis_pool.reset()
+
+
+def test_one_client_per_process(fresh_pool):
+    client = redis_pool.get_redis()
+    assert redis_pool.get_redis() is client
+    kwargs = client.connection_pool.connection_kwargs
+    assert kwargs["health_check_interval"] == Config.REDIS_HEALTH_CHECK_INTERVAL
+    assert kwargs["socket_timeout"] == Config.REDIS_SOCKET_TIMEOUT
+
+
+def test_checkouts_are_metered(fresh_pool):
+    client = redis_pool.get_redis()
+    client.set("pool:test", "1")
+    client.get("pool:test")
+    stats = redis_pool.pool_stats()
+    assert stats["checkouts"] >= 2
+    assert stats["connections"] == 1
+    assert stats["wait_ms_p50"] is not None
+    client.delete("pool:test")
+
+
+def test_exhausted_pool_times_out(fresh_pool):
+    fresh_pool.setattr(Config, "REDIS_MAX_CONNECTIONS", 1)
+    fresh_pool.setattr(Config, "REDIS_POOL_TIMEOUT", 0.05)
+    pool = redis_pool.get_redis().connection_pool
+    held = pool.get_connection()
+    try:
+        with pytest.raises(redis.exceptions.ConnectionError):
+            redis_pool.get_redis().ping()
+    finally:
+        pool.release(held)
+    stats = redis_pool.pool_stats()
+    assert stats["timeouts"] == 1
+    assert stats["exhausted"] == 1
+
+
+def test_forked_child_builds_its_own_pool(fresh_pool):
+    parent = redis_pool.get_redis()
+    parent.ping()
+    pid = os.fork()
+    if pid == 0:
+        child = redis_pool.get_redis()
+        ok = child is not parent and child.ping() and child.connection_pool.stats()["checkouts"] == 1
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert parent.ping()